@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Route-level benchmarks for the Blogify web application.
+
+- This script builds the app with 'create_app' against a throwaway
+  SQLite database, seeds it at one or more sizes with the synthetic
+  data generator of 'create_users_and_posts.py', and drives the main
+  routes through the Flask test client: the landing page, the home
+  feed (first page and a deep page), a post, a user timeline, login
+  and new post.
+- For each size and route it reports the throughput and the p50, p95
+  and p99 latencies, and writes them to a JSON file. Each route is
+  measured '--runs' times and the median of the runs is kept, so one
+  noisy run does not move the numbers.
+- Given '--baseline', results are compared with a stored run, and
+  routes slower than the baseline by more than '--threshold' and by
+  more than '--floor' milliseconds are flagged; the script then exits
+  with status 1, so it can gate CI. Runs made with different settings
+  (requests, runs, caches, bcrypt cost, seed) are not compared.
+- A route answering with an error status fails the run (status 1)
+  without any comparison: error pages are usually faster than the
+  real ones and would pass for an improvement.
+
+Usage:
+    python benchmarks/bench_routes.py --sizes 1000,20000 --output bench.json
+    python benchmarks/bench_routes.py --baseline bench.json
+
+Note: The full-page and fragment caches are disabled unless '--cache'
+is given, so the numbers measure the work behind each route rather
+than cache hits. Login is dominated by bcrypt, whose cost is set with
+'--bcrypt-rounds' (4 by default, far below production). Importing the
+app reads '/etc/config.json', as the application itself does.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+from blogify_app import db, create_app, bcrypt  # noqa: E402
+from blogify_app.config_production import Config  # noqa: E402
+from blogify_app.models import Post, User  # noqa: E402
+from blogify_app.pagination import encode_cursor  # noqa: E402
+from create_users_and_posts import generate_posts, generate_users  # noqa: E402
+
+# Routes benchmarked, in report order.
+ROUTES = (
+    "landing_page",
+    "home",
+    "home_deep",
+    "post",
+    "user_posts",
+    "login",
+    "new_post",
+)
+
+# Latency statistics compared against a baseline.
+COMPARED = ("p50_ms", "p95_ms")
+
+# Statistics of a route that are medians over its runs.
+MEDIANS = ("rps", "mean_ms", "p50_ms", "p95_ms", "p99_ms")
+
+
+def percentile(samples, q):
+    """
+    Return a percentile of sorted samples, by nearest rank.
+
+    Args:
+        samples (list): The sorted samples.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The sample at that rank.
+    """
+    rank = max(0, min(len(samples) - 1, round(q / 100 * len(samples)) - 1))
+    return samples[rank]
+
+
+def build_app(database, cache, bcrypt_rounds):
+    """
+    Create the app configured for benchmarking.
+
+    Args:
+        database (str): The path of the SQLite database.
+        cache (bool): Whether the page and fragment caches are on.
+        bcrypt_rounds (int): The bcrypt cost of new hashes.
+
+    Returns:
+        Flask: The application.
+    """
+
+    class BenchConfig(Config):
+        SECRET_KEY = "benchmark"
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + database
+        WTF_CSRF_ENABLED = False
+        SERVER_NAME = "localhost"
+        RATELIMIT_ENABLED = False
+        MAIL_QUEUE_MODE = "worker"
+        BCRYPT_LOG_ROUNDS = bcrypt_rounds
+        RESPONSE_CACHE_TYPE = "lru" if cache else "null"
+        FRAGMENT_CACHE_TYPE = "lru" if cache else "null"
+
+    return create_app(BenchConfig)
+
+
+def seed(app, posts, seed_value):
+    """
+    Fill a fresh database with synthetic users and posts.
+
+    Args:
+        app (Flask): The application.
+        posts (int): The number of posts. One user is created per 20.
+        seed_value (int): The random seed.
+    """
+    rng = random.Random(seed_value)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        password_hash = bcrypt.generate_password_hash("password").decode("utf-8")
+        user_ids = generate_users(max(1, posts // 20), password_hash, rng, 5000)
+        generate_posts(posts, user_ids, rng, 5000, 730)
+
+
+def scenarios(app, rng):
+    """
+    Build the request of each benchmarked route.
+
+    Args:
+        app (Flask): The seeded application.
+        rng (Random): Picks the posts and users requested.
+
+    Returns:
+        dict: Maps route names to functions taking a logged-in client
+          and a fresh client, and returning a response.
+    """
+    with app.app_context():
+        post_ids = db.session.scalars(select(Post.id)).all()
+        usernames = db.session.scalars(select(User.username)).all()
+        # A page four fifths of the way down the feed
+        boundary = db.session.scalar(
+            select(Post)
+            .order_by(Post.date_posted.desc(), Post.id.desc())
+            .offset(int(len(post_ids) * 0.8))
+            .limit(1)
+        )
+        deep = encode_cursor(boundary, "next")
+        login_email = db.session.scalar(select(User.email).limit(1))
+
+    return {
+        "landing_page": lambda client, fresh: client.get("/"),
+        "home": lambda client, fresh: client.get("/home"),
+        "home_deep": lambda client, fresh: client.get("/home?cursor=" + deep),
+        "post": lambda client, fresh: client.get(
+            "/post/{}".format(rng.choice(post_ids))
+        ),
+        "user_posts": lambda client, fresh: client.get(
+            "/user/{}".format(rng.choice(usernames))
+        ),
+        "login": lambda client, fresh: fresh.post(
+            "/login", data={"email": login_email, "password": "password"}
+        ),
+        "new_post": lambda client, fresh: client.post(
+            "/post/new",
+            data={"title": "Benchmark post", "content": "Benchmark content. " * 40},
+        ),
+    }
+
+
+def measure(app, request, requests, warmup, login_email):
+    """
+    Time one route.
+
+    Args:
+        app (Flask): The application.
+        request (callable): Issues one request (see 'scenarios').
+        requests (int): The number of timed requests.
+        warmup (int): The number of untimed requests made first.
+        login_email (str): The user the logged-in client signs in as.
+
+    Returns:
+        dict: The request count, errors, throughput and latencies.
+    """
+    client = app.test_client()
+    client.post("/login", data={"email": login_email, "password": "password"})
+    durations, errors = [], 0
+    for i in range(warmup + requests):
+        fresh = app.test_client()
+        started = time.perf_counter()
+        response = request(client, fresh)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            errors += 1
+        if i >= warmup:
+            durations.append(elapsed * 1000)
+    durations.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / (sum(durations) / 1000), 1),
+        "mean_ms": round(sum(durations) / len(durations), 3),
+        "p50_ms": round(percentile(durations, 50), 3),
+        "p95_ms": round(percentile(durations, 95), 3),
+        "p99_ms": round(percentile(durations, 99), 3),
+    }
+
+
+def measure_runs(app, request, runs, requests, warmup, login_email):
+    """
+    Time one route several times and keep the median of the runs.
+
+    Args:
+        app (Flask): The application.
+        request (callable): Issues one request (see 'scenarios').
+        runs (int): The number of runs.
+        requests (int): The number of timed requests per run.
+        warmup (int): The number of untimed requests before each run.
+        login_email (str): The user the logged-in client signs in as.
+
+    Returns:
+        dict: The statistics of 'measure', each the median over the
+          runs, with the errors of every run added up.
+    """
+    measured = [
+        measure(app, request, requests, warmup, login_email) for _ in range(runs)
+    ]
+    stats = {
+        "runs": runs,
+        "requests": requests,
+        "errors": sum(run["errors"] for run in measured),
+    }
+    for key in MEDIANS:
+        values = sorted(run[key] for run in measured)
+        middle = len(values) // 2
+        if len(values) % 2:
+            stats[key] = values[middle]
+        else:
+            stats[key] = round((values[middle - 1] + values[middle]) / 2, 3)
+    return stats
+
+
+def compare(results, baseline, threshold, floor):
+    """
+    Find the routes slower than in a baseline run.
+
+    - A route regresses when it is slower by more than 'threshold' and
+      by more than 'floor' milliseconds: fast routes vary by a larger
+      fraction between runs than slow ones.
+
+    Args:
+        results (dict): The current results, by size and route.
+        baseline (dict): The results of the baseline run.
+        threshold (float): The tolerated slowdown, as a fraction.
+        floor (float): The tolerated slowdown, in milliseconds.
+
+    Returns:
+        list: A line describing each regression.
+    """
+    regressions = []
+    for size, routes in results.items():
+        for route, stats in routes.items():
+            before = baseline.get(size, {}).get(route)
+            if before is None:
+                continue
+            for key in COMPARED:
+                slower = stats[key] - before[key]
+                if slower > before[key] * threshold and slower > floor:
+                    regressions.append(
+                        "{} posts, {}: {} {:.2f} ms -> {:.2f} ms (+{:.0%})".format(
+                            size,
+                            route,
+                            key[:3],
+                            before[key],
+                            stats[key],
+                            stats[key] / before[key] - 1,
+                        )
+                    )
+    return regressions
+
+
+def environment():
+    """
+    Describe the machine and code the benchmark ran on.
+
+    Returns:
+        dict: The date, git commit, Python and SQLite versions.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "date": datetime.utcnow().isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+    }
+
+
+def parse_args():
+    """
+    Parse the command-line arguments of the script.
+
+    Returns:
+        Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--sizes", default="1000,20000", help="comma-separated numbers of posts"
+    )
+    parser.add_argument(
+        "--routes", default=",".join(ROUTES), help="comma-separated routes to run"
+    )
+    parser.add_argument("--requests", type=int, default=200, help="timed requests")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests")
+    parser.add_argument(
+        "--runs", type=int, default=5, help="runs per route, the median is kept"
+    )
+    parser.add_argument("--cache", action="store_true", help="keep page caches on")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="bcrypt cost")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with this JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="tolerated slowdown against the baseline (0.15 = 15%%)",
+    )
+    parser.add_argument(
+        "--floor",
+        type=float,
+        default=0.5,
+        help="tolerated slowdown against the baseline, in milliseconds",
+    )
+    return parser.parse_args()
+
+
+def main():
+    """
+    Run the benchmarks and report, save and compare the results.
+
+    Returns:
+        int: The exit status, 1 if a route failed or a regression was
+          found.
+    """
+    args = parse_args()
+    routes = [route.strip() for route in args.routes.split(",")]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        sys.exit("Unknown routes: {}".format(", ".join(sorted(unknown))))
+    if args.runs < 1:
+        sys.exit("--runs must be at least 1")
+
+    settings = {
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "runs": args.runs,
+        "cache": args.cache,
+        "bcrypt_rounds": args.bcrypt_rounds,
+        "seed": args.seed,
+    }
+    baseline = None
+    if args.baseline:
+        # Checked first, rather than after minutes of benchmarking
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            sys.exit(
+                "Cannot compare with {}, which ran with different settings:\n"
+                "  baseline: {}\n  current:  {}".format(
+                    args.baseline,
+                    json.dumps(baseline.get("settings"), sort_keys=True),
+                    json.dumps(settings, sort_keys=True),
+                )
+            )
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(size) for size in args.sizes.split(",")):
+            database = os.path.join(tmp, "bench_{}.db".format(size))
+            app = build_app(database, args.cache, args.bcrypt_rounds)
+            started = time.perf_counter()
+            seed(app, size, args.seed)
+            print(
+                "{} posts seeded in {:.1f}s".format(size, time.perf_counter() - started)
+            )
+            rng = random.Random(args.seed)
+            requests = scenarios(app, rng)
+            with app.app_context():
+                login_email = db.session.scalar(select(User.email).limit(1))
+            results[str(size)] = {}
+            print(
+                "{:<14} {:>9} {:>9} {:>9} {:>9} {:>7}".format(
+                    "route", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors"
+                )
+            )
+            for route in routes:
+                stats = measure_runs(
+                    app,
+                    requests[route],
+                    args.runs,
+                    args.requests,
+                    args.warmup,
+                    login_email,
+                )
+                results[str(size)][route] = stats
+                print(
+                    "{:<14} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>7}".format(
+                        route,
+                        stats["rps"],
+                        stats["p50_ms"],
+                        stats["p95_ms"],
+                        stats["p99_ms"],
+                        stats["errors"],
+                    )
+                )
+            with app.app_context():
+                db.engine.dispose()
+
+    report = {
+        "environment": environment(),
+        "settings": settings,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print("Results written to {}".format(args.output))
+
+    failed = [
+        "{} posts, {}: {} errors".format(size, route, stats["errors"])
+        for size, routes in results.items()
+        for route, stats in routes.items()
+        if stats["errors"]
+    ]
+    if failed:
+        print("Routes answered with errors, not comparing:")
+        for line in failed:
+            print("  " + line)
+        return 1
+
+    if baseline is not None:
+        regressions = compare(results, baseline["results"], args.threshold, args.floor)
+        if regressions:
+            print("Regressions against {}:".format(args.baseline))
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print("No regression against {}.".format(args.baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,11 +12,31 @@ Attributes:
     - app: Flask application instance.
     - db: SQLAlchemy database instance.
     - bcrypt: Bcrypt extension for password hashing.
+    - password_hasher: PasswordHasher extension running bcrypt on a
+      bounded thread pool.
     - login_manager: LoginManager for user session management.
     - mail: Mail extension for email handling.
+    - query_counter: QueryCounter extension for per-request SQL counts.
+    - response_cache: ResponseCache extension for full-page caching.
+    - fragment_cache: FragmentCache extension for cached template blocks.
+    - template_cache: TemplateCache extension for compiled template reuse.
+    - assets: Assets extension serving fingerprinted static assets.
+    - images: Images extension rendering responsive pictures.
+    - uploads: Uploads extension streaming uploads with size limits.
+    - avatar_processor: AvatarProcessor extension resizing profile
+      pictures in the background.
+    - rate_limiter: RateLimiter extension throttling login, registration
+      and password reset submissions.
+    - user_cache: UserCache extension caching users by id and username.
+    - mail_queue: MailQueue extension delivering outbound mail in the
+      background, with retries.
+    - request_profiler: RequestProfiler extension profiling selected
+      requests when enabled.
+    - metrics: Metrics extension recording request, database and cache
+      metrics for the '/metrics' endpoint.
 
 The module also imports models and registers blueprints
-for 'users', 'posts', and 'main'.
+for 'users', 'posts', 'main' and 'search'.
 
  Author: Emeka Emodi<emodiemeka@gmail.com>
 """
@@ -28,6 +48,21 @@ from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from flask_mail import Mail
 from blogify_app.config_production import Config
+from blogify_app.database import configure_engine, log_pool_settings
+from blogify_app.passwords import PasswordHasher
+from blogify_app.instrumentation import QueryCounter
+from blogify_app.cache import ResponseCache
+from blogify_app.fragments import FragmentCache
+from blogify_app.templating import TemplateCache
+from blogify_app.assets import Assets
+from blogify_app.images import Images
+from blogify_app.uploads import Uploads
+from blogify_app.avatars import AvatarProcessor
+from blogify_app.ratelimit import RateLimiter
+from blogify_app.identity import UserCache
+from blogify_app.mailqueue import MailQueue
+from blogify_app.profiler import RequestProfiler
+from blogify_app.metrics import Metrics
 
 # Load environment variables from .env file
 load_dotenv()
@@ -38,6 +73,9 @@ db = SQLAlchemy()
 # Initialize Bcrypt for password hashing with Flask app
 bcrypt = Bcrypt()
 
+# Hash and verify passwords on a bounded pool, off the request threads
+password_hasher = PasswordHasher()
+
 # Init. and handle user login sessions with Flask app
 login_manager = LoginManager()
 
@@ -50,6 +88,45 @@ login_manager.login_message_category = "info"
 # Initialize Mail extension with Flask app for email handling
 mail = Mail()
 
+# Count SQL statements per request and enforce route query budgets
+query_counter = QueryCounter()
+
+# Cache rendered pages of the public read routes
+response_cache = ResponseCache()
+
+# Cache rendered post cards across pages and visitors
+fragment_cache = FragmentCache()
+
+# Reuse compiled templates across worker starts
+template_cache = TemplateCache()
+
+# Serve the self-hosted, fingerprinted front-end assets
+assets = Assets()
+
+# Render static pictures with resized and WebP variants
+images = Images()
+
+# Stream uploads to disk, enforcing size limits as they arrive
+uploads = Uploads()
+
+# Resize uploaded profile pictures off the request path
+avatar_processor = AvatarProcessor()
+
+# Throttle the account forms per client IP and per account
+rate_limiter = RateLimiter()
+
+# Cache user identities for the session loader and profile lookups
+user_cache = UserCache()
+
+# Queue outbound mail and deliver it off the request path
+mail_queue = MailQueue()
+
+# Profile selected requests, only when 'PROFILER_ENABLED' is set
+request_profiler = RequestProfiler()
+
+# Record metrics aggregated across workers, only when 'METRICS_ENABLED' is set
+metrics = Metrics()
+
 # Import models module after initializing app and extensions
 from blogify_app.models import User, Post
 
@@ -61,8 +138,8 @@ def create_app(config_class=Config):
     This function initializes and configures the Flask application,
     along with associated extensions such as Flask-SQLAlchemy, Flask-Bcrypt,
     Flask-Login, and Flask-Mail. It registers blueprints for different
-    application components (users, posts, main, landing_bp, and errors)
-    to organize routes and views.
+    application components (users, posts, main, landing_bp, search, and
+    errors) to organize routes and views.
 
     Args:
         config_class (class, optional): The configuration class to use.
@@ -80,27 +157,79 @@ def create_app(config_class=Config):
           config_class or the default Config class.
         - The database, password hashing, login management, and email
           handling are initialized and associated with the app.
+        - The database engine and its connection pool are configured
+          from the 'DB_*' settings (see 'blogify_app/database.py').
         - Blueprints are registered to organize routes for different
-          components of the application (users, posts, main, landing_bp, and errors).
+          components of the application (users, posts, main, landing_bp, search,
+          and errors).
+        - Maintenance command groups (such as 'flask posts') are added
+          to the application's CLI.
+        - With 'TEMPLATE_PRELOAD' set, every template is loaded before
+          the app is returned, so workers serve their first request warm.
     """
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    configure_engine(app)
     db.init_app(app)
+    log_pool_settings(app)
     bcrypt.init_app(app)
+    password_hasher.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
+    query_counter.init_app(app)
+    response_cache.init_app(app)
+    fragment_cache.init_app(app)
+    template_cache.init_app(app)
+    assets.init_app(app)
+    images.init_app(app)
+    uploads.init_app(app)
+    avatar_processor.init_app(app)
+    rate_limiter.init_app(app)
+    user_cache.init_app(app)
+    mail_queue.init_app(app)
+    request_profiler.init_app(app)
+    metrics.init_app(app)
 
     from blogify_app.users.routes import users
     from blogify_app.posts.routes import posts
     from blogify_app.main.routes import main
     from blogify_app.landing_bp.routes import landing_bp
+    from blogify_app.search.routes import search
     from blogify_app.errors.handlers import errors
 
     app.register_blueprint(users)
     app.register_blueprint(posts)
     app.register_blueprint(main)
     app.register_blueprint(landing_bp)
+    app.register_blueprint(search)
     app.register_blueprint(errors)
 
+    from blogify_app.posts.commands import posts_cli
+    from blogify_app.search.commands import search_cli
+    from blogify_app.templating import templates_cli
+    from blogify_app.assets import assets_cli
+    from blogify_app.images import images_cli
+    from blogify_app.users.commands import avatars_cli
+    from blogify_app.passwords import passwords_cli
+    from blogify_app.mailqueue import mail_cli
+    from blogify_app.profiler import profiler_cli
+    from blogify_app.metrics import metrics_cli
+    from blogify_app.migrations import db_cli
+
+    app.cli.add_command(posts_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(templates_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(avatars_cli)
+    app.cli.add_command(passwords_cli)
+    app.cli.add_command(mail_cli)
+    app.cli.add_command(profiler_cli)
+    app.cli.add_command(metrics_cli)
+    app.cli.add_command(db_cli)
+
+    if app.config["TEMPLATE_PRELOAD"]:
+        template_cache.preload(app)
+
     return app
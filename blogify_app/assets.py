@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Self-hosted static asset pipeline for the Blogify web application.
+
+- This module vendors the third-party front-end assets (Bootstrap 5 CSS
+  and JS bundle, Bootstrap Icons and the Montserrat web font) into
+  'static/vendor', so pages no longer open connections to several CDNs
+  before their first paint.
+- 'flask assets build' copies the vendored files and 'main.css' into
+  'static/dist' under content-hashed names, rewrites the 'url()'
+  references between them, drops the icon rules no template uses, and
+  writes gzip (and, when the optional 'brotli' package is installed,
+  brotli) variants next to each text file, plus a 'manifest.json'.
+- The 'asset_url' template helper resolves a logical name such as
+  'main.css' through the manifest. Built files are served from
+  '/assets/' with far-future immutable cache headers and the best
+  precompressed variant the browser accepts.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: Until 'flask assets build' has been run, 'asset_url' falls back
+to the public CDN copies (with their integrity hashes) and to the plain
+'static' route, so a fresh checkout still renders.
+"""
+
+import os
+import re
+import json
+import gzip
+import shutil
+import hashlib
+import mimetypes
+import posixpath
+import tempfile
+import urllib.request
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+from markupsafe import Markup
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+assets_cli = AppGroup("assets", help="Build the self-hosted static assets.")
+
+BOOTSTRAP = "https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist"
+BOOTSTRAP_ICONS = "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font"
+MONTSERRAT = "https://cdn.jsdelivr.net/npm/@fontsource/montserrat@5/files"
+
+# Third-party files downloaded into 'static/', by path.
+VENDOR_FILES = {
+    "vendor/bootstrap.min.css": BOOTSTRAP + "/css/bootstrap.min.css",
+    "vendor/bootstrap.bundle.min.js": BOOTSTRAP + "/js/bootstrap.bundle.min.js",
+    "vendor/bootstrap-icons.min.css": BOOTSTRAP_ICONS + "/bootstrap-icons.min.css",
+    "vendor/fonts/bootstrap-icons.woff2": BOOTSTRAP_ICONS
+    + "/fonts/bootstrap-icons.woff2",
+    "vendor/fonts/bootstrap-icons.woff": BOOTSTRAP_ICONS
+    + "/fonts/bootstrap-icons.woff",
+}
+VENDOR_FILES.update(
+    {
+        "vendor/fonts/montserrat-latin-{}-normal.woff2".format(weight): (
+            "{}/montserrat-latin-{}-normal.woff2".format(MONTSERRAT, weight)
+        )
+        for weight in (400, 500, 700)
+    }
+)
+
+# Files copied into 'static/dist'. Stylesheets come last, so the files
+# they reference already have their hashed names.
+BUNDLE = [name for name in VENDOR_FILES if not name.endswith((".css", ".js"))] + [
+    "vendor/bootstrap.bundle.min.js",
+    "vendor/bootstrap.min.css",
+    "vendor/bootstrap-icons.min.css",
+    "fonts.css",
+    "main.css",
+]
+
+# Where 'asset_url' points before the pipeline has been built, with the
+# Subresource Integrity hash of the CDN copy when one is published.
+CDN_FALLBACKS = {
+    "vendor/bootstrap.min.css": (
+        BOOTSTRAP + "/css/bootstrap.min.css",
+        "sha384-T3c6CoIi6uLrA9TneNEoa7RxnatzjcDSCmG1MXxSR1GAsXEV/Dwwykc2MPK8M2HN",
+    ),
+    "vendor/bootstrap.bundle.min.js": (
+        BOOTSTRAP + "/js/bootstrap.bundle.min.js",
+        "sha384-C6RzsynM9kWDrMNeT87bh95OGNyZPhcTNXj1NW7RuBCsyN/o0jlpcV8Qyq46cDfL",
+    ),
+    "vendor/bootstrap-icons.min.css": (
+        BOOTSTRAP_ICONS + "/bootstrap-icons.min.css",
+        None,
+    ),
+    "fonts.css": (
+        "https://fonts.googleapis.com/css2?family=Montserrat:wght@400;500;700"
+        "&display=swap",
+        None,
+    ),
+}
+
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt")
+
+# Entries of the output directory written by 'flask images build'.
+PRESERVED = ("img", "images.json")
+
+_CSS_URL = re.compile(r"""url\((['"]?)([^'")]+)\1\)""")
+_SOURCE_MAP = re.compile(r"/\*# sourceMappingURL=[^*]*\*/")
+_ICON_RULE = re.compile(r"\.bi-([a-z0-9-]+)::before\s*\{[^}]*\}\s*")
+_ICON_USE = re.compile(r"\bbi-([a-z0-9-]+)")
+
+
+def write_atomic(path, data):
+    """
+    Write bytes to 'path' through a temporary file in the same directory.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def fetch_vendor(static_folder, refresh=False, echo=print):
+    """
+    Download the third-party assets into the static folder.
+
+    Args:
+        static_folder (str): The application's static directory.
+        refresh (bool, optional): Whether files already present are
+          downloaded again. Defaults to False.
+        echo (callable, optional): Called with a progress line for each
+          download. Defaults to print.
+
+    Raises:
+        OSError: If a download fails.
+    """
+    for name, url in VENDOR_FILES.items():
+        path = os.path.join(static_folder, name)
+        if os.path.exists(path) and not refresh:
+            continue
+        echo("Downloading {}".format(url))
+        with urllib.request.urlopen(url, timeout=30) as response:
+            write_atomic(path, response.read())
+
+
+def used_icons(template_folder):
+    """
+    Collect the Bootstrap Icons names used by the templates.
+
+    Args:
+        template_folder (str): The application's template directory.
+
+    Returns:
+        set: Icon names such as 'cup' for 'bi-cup'.
+    """
+    names = set()
+    for root, _, files in os.walk(template_folder):
+        for filename in files:
+            with open(os.path.join(root, filename), encoding="utf-8") as f:
+                names.update(_ICON_USE.findall(f.read()))
+    return names
+
+
+def shake_icons(css, keep):
+    """
+    Remove the rules of unused icons from the Bootstrap Icons stylesheet.
+
+    Args:
+        css (str): The stylesheet.
+        keep (set): The icon names to keep.
+
+    Returns:
+        str: The stylesheet with only the kept icon rules.
+    """
+    return _ICON_RULE.sub(
+        lambda match: match.group(0) if match.group(1) in keep else "", css
+    )
+
+
+def rewrite_css_urls(css, name, manifest):
+    """
+    Point the 'url()' references of a stylesheet at hashed file names.
+
+    Args:
+        css (str): The stylesheet.
+        name (str): Its logical name, relative to the static folder.
+        manifest (dict): Logical names mapped to hashed names.
+
+    Returns:
+        str: The rewritten stylesheet.
+    """
+    base = posixpath.dirname(name)
+
+    def replace(match):
+        target = match.group(2)
+        if target.startswith(("data:", "http:", "https:", "/", "#")):
+            return match.group(0)
+        logical = posixpath.normpath(posixpath.join(base, target.split("?")[0]))
+        if logical not in manifest:
+            return match.group(0)
+        return 'url("{}")'.format(posixpath.relpath(manifest[logical], base or "."))
+
+    return _CSS_URL.sub(replace, css)
+
+
+def hashed_name(name, data):
+    """
+    Insert a digest of 'data' before the extension of 'name'.
+
+    Args:
+        name (str): A logical name, such as 'main.css'.
+        data (bytes): The final content of the file.
+
+    Returns:
+        str: The hashed name, such as 'main.3f2a9c1d04e7.css'.
+    """
+    stem, ext = posixpath.splitext(name)
+    return "{}.{}{}".format(stem, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def build_dist(static_folder, template_folder, dist_dir, clean=False):
+    """
+    Write fingerprinted and precompressed copies of the bundle.
+
+    - Files from earlier builds are kept unless 'clean' is set, so pages
+      rendered by workers still running the previous release keep
+      loading during a rolling deploy.
+
+    Args:
+        static_folder (str): The application's static directory.
+        template_folder (str): The application's template directory.
+        dist_dir (str): The output directory.
+        clean (bool, optional): Whether earlier builds are deleted
+          first. The image derivatives of 'flask images build', which
+          share the directory, are kept. Defaults to False.
+
+    Returns:
+        dict: The manifest, mapping logical names to hashed names.
+    """
+    if clean and os.path.isdir(dist_dir):
+        for entry in os.listdir(dist_dir):
+            if entry in PRESERVED:
+                continue
+            path = os.path.join(dist_dir, entry)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    icons = used_icons(template_folder)
+    manifest = {}
+    for name in BUNDLE:
+        with open(os.path.join(static_folder, name), "rb") as f:
+            data = f.read()
+        if name.endswith(".css"):
+            css = _SOURCE_MAP.sub("", data.decode("utf-8"))
+            if name == "vendor/bootstrap-icons.min.css":
+                css = shake_icons(css, icons)
+            data = rewrite_css_urls(css, name, manifest).encode("utf-8")
+        elif name.endswith(".js"):
+            data = _SOURCE_MAP.sub("", data.decode("utf-8")).encode("utf-8")
+        manifest[name] = hashed_name(name, data)
+        path = os.path.join(dist_dir, manifest[name])
+        write_atomic(path, data)
+        if name.endswith(COMPRESSIBLE):
+            variants = {".gz": gzip.compress(data, 9, mtime=0)}
+            if brotli is not None:
+                variants[".br"] = brotli.compress(data, quality=11)
+            for suffix, compressed in variants.items():
+                if len(compressed) < len(data):
+                    write_atomic(path + suffix, compressed)
+    write_atomic(
+        os.path.join(dist_dir, "manifest.json"),
+        json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"),
+    )
+    return manifest
+
+
+def load_manifest(dist_dir):
+    """
+    Read the manifest of a build.
+
+    Args:
+        dist_dir (str): The build output directory.
+
+    Returns:
+        dict: The manifest, or an empty dict if nothing was built.
+    """
+    try:
+        with open(os.path.join(dist_dir, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(name):
+    """
+    Return the URL of a static asset.
+
+    Args:
+        name (str): The logical name of the asset, relative to the
+          static folder (e.g. 'main.css').
+
+    Returns:
+        str: The fingerprinted '/assets/' URL when the asset is built,
+          otherwise its CDN URL or plain static URL.
+    """
+    manifest = current_app.extensions["assets"]
+    if name in manifest:
+        return url_for("assets", filename=manifest[name])
+    if name in CDN_FALLBACKS:
+        return CDN_FALLBACKS[name][0]
+    return url_for("static", filename=name)
+
+
+def asset_sri(name):
+    """
+    Return the integrity attributes for an asset loaded from a CDN.
+
+    Args:
+        name (str): The logical name of the asset.
+
+    Returns:
+        Markup: ' integrity="..." crossorigin="anonymous"' when the asset
+          falls back to a CDN copy with a published hash, otherwise an
+          empty string.
+    """
+    if name in current_app.extensions["assets"] or name not in CDN_FALLBACKS:
+        return Markup("")
+    integrity = CDN_FALLBACKS[name][1]
+    if integrity is None:
+        return Markup("")
+    return Markup(' integrity="{}" crossorigin="anonymous"').format(integrity)
+
+
+def send_asset(filename):
+    """
+    Serve a built asset, precompressed when the browser allows it.
+
+    Args:
+        filename (str): The hashed name of the asset.
+
+    Returns:
+        Response: The file, with immutable far-future cache headers.
+    """
+    dist_dir = current_app.config["ASSETS_DIST_DIR"]
+    encoding, suffix = None, ""
+    for candidate, extension in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[candidate] and os.path.isfile(
+            os.path.join(dist_dir, filename + extension)
+        ):
+            encoding, suffix = candidate, extension
+            break
+    response = send_from_directory(
+        dist_dir,
+        filename + suffix,
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        max_age=current_app.config["ASSETS_MAX_AGE"],
+    )
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+class Assets:
+    """
+    Flask extension serving the built assets and the 'asset_url' helper.
+
+    Usage:
+        - assets = Assets()
+        - assets.init_app(app)
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Register the '/assets/' route and the template helpers of an app.
+
+        Args:
+            app (Flask): The Flask application instance.
+        """
+        app.config.setdefault(
+            "ASSETS_DIST_DIR", os.path.join(app.static_folder, "dist")
+        )
+        app.config.setdefault("ASSETS_MAX_AGE", 365 * 24 * 3600)
+        app.extensions["assets"] = load_manifest(app.config["ASSETS_DIST_DIR"])
+        app.add_url_rule("/assets/<path:filename>", "assets", send_asset)
+        app.jinja_env.globals.update(asset_url=asset_url, asset_sri=asset_sri)
+
+
+@assets_cli.command("build")
+@click.option("--refresh", is_flag=True, help="Download vendored files again.")
+@click.option("--clean", is_flag=True, help="Delete earlier builds first.")
+def build(refresh, clean):
+    """
+    Vendor, fingerprint and precompress the static assets.
+    \f
+    Args:
+        refresh (bool): Whether vendored files are downloaded again.
+        clean (bool): Whether files from earlier builds are deleted.
+    """
+    app = current_app
+    try:
+        fetch_vendor(app.static_folder, refresh=refresh, echo=click.echo)
+    except OSError as e:
+        raise click.ClickException("Download failed: {}".format(e))
+    dist_dir = app.config["ASSETS_DIST_DIR"]
+    manifest = build_dist(
+        app.static_folder,
+        os.path.join(app.root_path, app.template_folder),
+        dist_dir,
+        clean=clean,
+    )
+    app.extensions["assets"] = manifest
+    for name, hashed in manifest.items():
+        path = os.path.join(dist_dir, hashed)
+        sizes = [os.path.getsize(path)] + [
+            os.path.getsize(path + suffix)
+            for suffix in (".gz", ".br")
+            if os.path.exists(path + suffix)
+        ]
+        click.echo(
+            "{:<45} {}".format(hashed, " / ".join(str(s) for s in sizes) + " bytes")
+        )
+    if brotli is None:
+        click.echo("Note: install 'brotli' to also write .br variants.")
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Background profile picture processing for the Blogify web application.
+
+- This module provides the 'AvatarProcessor' Flask extension. The
+  account page only streams an upload to a staging file and hands it
+  over; decoding, resizing and saving happen on a small pool of worker
+  threads, so a large phone photo no longer ties up a gunicorn worker.
+- Pictures are decoded with Pillow's draft mode (JPEG DCT scaling) and
+  'reducing_gap' resizing, which avoid decoding and filtering the full
+  resolution image just to produce a 125px thumbnail.
+- Pictures are stored under a digest of the uploaded bytes, so the
+  same upload is only stored (and processed) once. One decode writes
+  every size the templates show ('avatar_url(user, size)').
+- Each file is written to a temporary file and renamed into place,
+  and 'User.image_file' is only updated once that has succeeded. A
+  failed upload leaves the previous picture untouched.
+- Uploads arrive already spooled to disk and checked by
+  'blogify_app/uploads.py'; only the header was read so far.
+- The pool is bounded: when 'AVATAR_QUEUE_SIZE' pictures are already
+  waiting, the next one is processed in the request instead.
+- Each upload gets a ticket, and only the latest upload of a user may
+  switch their picture, so a slow earlier upload finishing last never
+  reverts the account to the older picture.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: The 'avatar_processor' extension instance is created and
+initialised in 'blogify_app/__init__.py'. Set 'AVATAR_PROCESSING' to
+'sync' to process pictures in the request, for instance in tests.
+"""
+
+import os
+import re
+import secrets
+import hashlib
+import tempfile
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, url_for
+from PIL import Image, ImageOps
+from blogify_app.uploads import ALLOWED_FORMATS, UploadSpool, inspect_picture
+
+# Size, in pixels, of the main profile picture file ('User.image_file').
+AVATAR_SIZE = 125
+
+# Extra sizes written next to it, as '<hash>-<size><ext>': the 65px
+# feed and post page avatar, and 2x copies for high-density screens.
+AVATAR_RENDITIONS = (65, 130, 250)
+
+# Threads processing pictures in each worker, unless 'AVATAR_WORKERS'
+# is set.
+DEFAULT_AVATAR_WORKERS = 2
+
+# Content-addressed picture names: a digest of the uploaded bytes.
+_HASHED = re.compile(r"^[0-9a-f]{32}$")
+
+
+def avatar_dir(app):
+    """
+    Return the directory profile pictures are stored in.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        str: The absolute path of 'static/profile_pics'.
+    """
+    return os.path.join(app.root_path, "static", "profile_pics")
+
+
+def rendition_name(image_file, size):
+    """
+    Return the file name of one size of a profile picture.
+
+    Args:
+        image_file (str): The main file name, as in 'User.image_file'.
+        size (int): AVATAR_SIZE or one of AVATAR_RENDITIONS.
+
+    Returns:
+        str: The name of the file holding that size.
+    """
+    if size == AVATAR_SIZE:
+        return image_file
+    stem, ext = os.path.splitext(image_file)
+    return "{}-{}{}".format(stem, size, ext)
+
+
+def is_content_addressed(image_file):
+    """
+    Tell whether a picture is stored by content hash, with renditions.
+
+    Args:
+        image_file (str): The main file name, as in 'User.image_file'.
+
+    Returns:
+        bool: False for pictures saved before renditions existed.
+    """
+    return bool(_HASHED.match(os.path.splitext(image_file)[0]))
+
+
+def avatar_url(user, size=AVATAR_SIZE):
+    """
+    Return the URL of a user's profile picture at a display size.
+
+    Args:
+        user (User): The user.
+        size (int, optional): AVATAR_SIZE or one of AVATAR_RENDITIONS.
+          Defaults to AVATAR_SIZE.
+
+    Returns:
+        str: The URL of the matching rendition, or of the single legacy
+          file for pictures that have not been backfilled.
+
+    Raises:
+        ValueError: If no rendition of that size is generated.
+    """
+    if size != AVATAR_SIZE and size not in AVATAR_RENDITIONS:
+        raise ValueError("No {}px avatar rendition".format(size))
+    filename = user.image_file
+    if is_content_addressed(filename):
+        filename = rendition_name(filename, size)
+    return url_for("static", filename="profile_pics/" + filename)
+
+
+def _save_atomic(image, path, image_format):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, image_format)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def process_avatar(source_path, directory, image_file, max_pixels=None):
+    """
+    Write every size of an uploaded picture from a single decode.
+
+    - The main file is written last, so its presence means all the
+      renditions are there too.
+
+    Args:
+        source_path (str): The staged upload.
+        directory (str): The profile pictures directory.
+        image_file (str): The main file name ('<hash><ext>').
+        max_pixels (int, optional): The largest picture decoded, checked
+          from the header before decoding. Defaults to None (no limit).
+
+    Raises:
+        OSError: If the upload cannot be read as a picture, is larger
+          than 'max_pixels', or a file cannot be written.
+    """
+    largest = max(AVATAR_RENDITIONS + (AVATAR_SIZE,))
+    with Image.open(source_path) as source:
+        image_format = source.format
+        if max_pixels is not None and source.width * source.height > max_pixels:
+            raise OSError("Picture of {}x{} pixels refused".format(*source.size))
+        source.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    for size in sorted(AVATAR_RENDITIONS + (AVATAR_SIZE,), reverse=True):
+        image.thumbnail((size, size), reducing_gap=2.0)
+        if size != AVATAR_SIZE:
+            path = os.path.join(directory, rendition_name(image_file, size))
+            _save_atomic(image, path, image_format)
+        else:
+            main = image.copy()
+    _save_atomic(main, os.path.join(directory, image_file), image_format)
+
+
+def stage_upload(form_picture, directory, max_pixels):
+    """
+    Keep an uploaded picture past the end of the request, and hash it.
+
+    - Uploads spooled by 'UploadRequest' are already on disk and hashed,
+      so they are hard-linked into place without copying a byte. Other
+      file objects are copied in chunks.
+    - The extension comes from the picture's format, not from the name
+      the client sent, so identical uploads share one file.
+
+    Args:
+        form_picture (FileStorage): The uploaded picture.
+        directory (str): The staging directory ('UPLOAD_SPOOL_DIR').
+        max_pixels (int): The largest accepted width times height.
+
+    Returns:
+        tuple: The staging file path and the content-addressed main
+          file name ('<hash><ext>').
+
+    Raises:
+        ValueError: If the upload is not an accepted picture.
+    """
+    image_format, _ = inspect_picture(form_picture.stream, max_pixels)
+    f_ext = ALLOWED_FORMATS[image_format]
+    staged = os.path.join(directory, secrets.token_hex(16) + ".staged")
+    stream = form_picture.stream
+    if isinstance(stream, UploadSpool):
+        stream.flush()
+        os.link(stream.name, staged)
+        return staged, stream.hexdigest()[:32] + f_ext
+
+    digest = hashlib.sha256()
+    with open(staged, "wb") as f:
+        for chunk in iter(lambda: stream.read(64 * 1024), b""):
+            digest.update(chunk)
+            f.write(chunk)
+    return staged, digest.hexdigest()[:32] + f_ext
+
+
+class AvatarProcessor:
+    """
+    Flask extension processing uploaded profile pictures in the background.
+
+    Usage:
+        - avatar_processor = AvatarProcessor()
+        - avatar_processor.init_app(app)
+        - avatar_processor.submit(user, form.picture.data)
+
+    Note:
+        - Tickets are kept per worker process, like the thread pool. A
+          user uploading twice through two workers within seconds can
+          still see the earlier upload win.
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._slots = None
+        # The ticket of the latest upload of each user still pending
+        self._latest = {}
+        self._tickets = itertools.count(1)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Configure picture processing for an app.
+
+        Args:
+            app (Flask): The Flask application instance.
+        """
+        app.config.setdefault("AVATAR_PROCESSING", "async")
+        app.config.setdefault("AVATAR_WORKERS", DEFAULT_AVATAR_WORKERS)
+        app.config.setdefault("AVATAR_QUEUE_SIZE", 16)
+        app.extensions["avatar_processor"] = self
+        app.jinja_env.globals.update(avatar_url=avatar_url)
+
+    def _get_executor(self, app):
+        """
+        Create the worker pool on first use, after gunicorn has forked.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=app.config["AVATAR_WORKERS"],
+                    thread_name_prefix="avatar",
+                )
+                self._slots = threading.BoundedSemaphore(
+                    app.config["AVATAR_QUEUE_SIZE"]
+                )
+            return self._executor
+
+    def is_pending(self, user_id):
+        """
+        Tell whether a picture of a user is still being processed
+        by this worker.
+
+        Args:
+            user_id (int): The id of the user.
+
+        Returns:
+            bool: True while the new picture is not ready yet.
+        """
+        return user_id in self._latest
+
+    def _claim(self, user_id):
+        """
+        Make a new upload the latest one of a user.
+
+        Returns:
+            int: The ticket of the upload.
+        """
+        with self._lock:
+            ticket = next(self._tickets)
+            self._latest[user_id] = ticket
+        return ticket
+
+    def _finish(self, user_id, ticket, picture_fn=None):
+        """
+        Point a user at a picture and clear their pending flag, unless a
+        newer upload was submitted since.
+
+        - The check and the switch happen under the lock, so a newer
+          upload cannot switch in between.
+
+        Args:
+            user_id (int): The id of the user.
+            ticket (int): The ticket of the finished upload.
+            picture_fn (str, optional): The picture to switch to. Defaults
+              to None, for an upload that failed.
+        """
+        with self._lock:
+            if self._latest.get(user_id) != ticket:
+                return
+            try:
+                if picture_fn is not None:
+                    self._switch(user_id, picture_fn)
+            finally:
+                del self._latest[user_id]
+
+    def submit(self, user, form_picture):
+        """
+        Stage an uploaded picture and schedule its processing.
+
+        Args:
+            user (User): The user whose picture is replaced.
+            form_picture (FileStorage): The uploaded picture.
+
+        Returns:
+            bool: True if the picture is processed in the background,
+              False if it has already been processed (or found, for a
+              picture uploaded before) in the request.
+        """
+        app = current_app._get_current_object()
+        staged, picture_fn = stage_upload(
+            form_picture,
+            app.config["UPLOAD_SPOOL_DIR"],
+            app.config["AVATAR_MAX_PIXELS"],
+        )
+        ticket = self._claim(user.id)
+        if os.path.exists(os.path.join(avatar_dir(app), picture_fn)):
+            # The same picture was uploaded before: reuse its files, and
+            # refresh them so 'flask avatars gc' treats them as new.
+            os.unlink(staged)
+            for size in AVATAR_RENDITIONS + (AVATAR_SIZE,):
+                path = os.path.join(avatar_dir(app), rendition_name(picture_fn, size))
+                if os.path.exists(path):
+                    os.utime(path)
+            self._finish(user.id, ticket, picture_fn)
+            return False
+
+        if app.config["AVATAR_PROCESSING"] == "sync":
+            self._run(app, user.id, ticket, staged, picture_fn)
+            return False
+        executor = self._get_executor(app)
+        if not self._slots.acquire(blocking=False):
+            app.logger.warning("Avatar queue full, processing picture in request")
+            self._run(app, user.id, ticket, staged, picture_fn)
+            return False
+        future = executor.submit(self._run, app, user.id, ticket, staged, picture_fn)
+        future.add_done_callback(lambda _: self._slots.release())
+        return True
+
+    def _run(self, app, user_id, ticket, staged, picture_fn):
+        """
+        Process a staged picture and point the user at it on success,
+        if it is still their latest upload.
+        """
+        with app.app_context():
+            processed = None
+            try:
+                process_avatar(
+                    staged,
+                    avatar_dir(app),
+                    picture_fn,
+                    max_pixels=app.config["AVATAR_MAX_PIXELS"],
+                )
+                processed = picture_fn
+            except Exception:
+                app.logger.exception(
+                    "Processing the picture of user %s failed", user_id
+                )
+            try:
+                self._finish(user_id, ticket, processed)
+            except Exception:
+                app.logger.exception("Switching the picture of user %s failed", user_id)
+            finally:
+                if os.path.exists(staged):
+                    os.unlink(staged)
+
+    def _switch(self, user_id, picture_fn):
+        """
+        Point a user at a processed picture and drop their cached pages.
+        """
+        from blogify_app import db, response_cache, user_cache
+        from blogify_app.models import User
+
+        user = db.session.get(User, user_id)
+        if user is not None:
+            user.image_file = picture_fn
+            db.session.commit()
+            user_cache.invalidate(user)
+            response_cache.invalidate_author(user)
@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+"""
+Full-page response caching for the public read routes of the Blogify
+web application.
+
+- This module provides the 'ResponseCache' Flask extension, which
+  stores rendered responses of selected views and replays them without
+  touching the database or Jinja.
+- Two storage backends are available: 'LRUCacheBackend', an in-process
+  least-recently-used store, and 'FileSystemCacheBackend', which keeps
+  entries on disk so they are shared by every gunicorn worker on a host.
+- Entries are keyed on the request path, the normalised query string
+  and the auth state of the visitor.
+- Cache hits still honour 'If-None-Match' against the stored ETag.
+- Every backend counts its hits and misses per key prefix ('view',
+  'tag', 'fragment', 'user'), which the metrics endpoint reports.
+- Entries carry tags (such as 'feed', 'post:<id>' or
+  'timeline:<username>'). Writes invalidate tags rather than keys:
+  each tag has a version, and an entry is only served while the
+  versions it was stored with are still current.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: The 'response_cache' extension instance is created and initialised
+in 'blogify_app/__init__.py'; routes opt in with 'response_cache.cached'.
+"""
+
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, g, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+
+def _prefix(key):
+    return key.split(":", 1)[0]
+
+
+class NullCacheBackend:
+    """
+    Cache backend that stores nothing, used to disable caching.
+    """
+
+    def __init__(self):
+        self.lookups = Counter()
+
+    def get(self, key):
+        self.lookups[_prefix(key), "miss"] += 1
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        """
+        Return the lookups of this process, by key prefix and result.
+        """
+        return dict(self.lookups)
+
+
+class LRUCacheBackend:
+    """
+    In-process cache backend with LRU eviction and per-entry expiry.
+
+    Attributes:
+        max_entries (int): The number of entries kept before the least
+          recently used one is evicted.
+        default_timeout (int): Seconds an entry lives when no explicit
+          timeout is given. 0 means entries never expire.
+
+    Note:
+        - Entries live in the memory of a single worker process, so
+          invalidations made by one gunicorn worker are not seen by the
+          others until their entries expire. Use the filesystem backend
+          when that matters.
+    """
+
+    def __init__(self, max_entries=1024, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self.lookups = Counter()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the value stored under 'key', or None if absent or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+            self.lookups[_prefix(key), "miss" if entry is None else "hit"] += 1
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, timeout=None):
+        """
+        Store 'value' under 'key' for 'timeout' seconds.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        expires_at = time.time() + timeout if timeout else 0
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Remove 'key' from the cache if present.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return the lookups of this process, by key prefix and result.
+        """
+        with self._lock:
+            return dict(self.lookups)
+
+
+class FileSystemCacheBackend:
+    """
+    Cache backend storing one pickled file per entry in a directory.
+
+    Attributes:
+        directory (str): The directory holding the cache files.
+        max_entries (int): The number of files above which expired and
+          then oldest entries are pruned.
+        default_timeout (int): Seconds an entry lives when no explicit
+          timeout is given. 0 means entries never expire.
+
+    Note:
+        - Files are written to a temporary name and renamed into place,
+          so concurrent workers never read a partially written entry.
+    """
+
+    _prune_every = 100
+
+    def __init__(self, directory, max_entries=10000, default_timeout=300):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self._writes = 0
+        self.lookups = Counter()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".cache")
+
+    def get(self, key):
+        """
+        Return the value stored under 'key', or None if absent or expired.
+        """
+        try:
+            with open(self._path(key), "rb") as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.lookups[_prefix(key), "miss"] += 1
+            return None
+        if expires_at and expires_at < time.time():
+            self.delete(key)
+            self.lookups[_prefix(key), "miss"] += 1
+            return None
+        self.lookups[_prefix(key), "hit"] += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        """
+        Atomically store 'value' under 'key' for 'timeout' seconds.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        expires_at = time.time() + timeout if timeout else 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((expires_at, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._writes += 1
+        if self._writes % self._prune_every == 0:
+            self._prune()
+
+    def delete(self, key):
+        """
+        Remove 'key' from the cache if present.
+        """
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith(".cache"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        """
+        Return the lookups of this process, by key prefix and result.
+
+        - The counts are approximate under concurrent threads, as they
+          are updated without a lock.
+        """
+        return dict(self.lookups)
+
+    def _prune(self):
+        """
+        Drop expired entries, then the oldest ones, above 'max_entries'.
+        """
+        paths = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(".cache")
+        ]
+        if len(paths) <= self.max_entries:
+            return
+        now = time.time()
+        survivors = []
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    expires_at, _ = pickle.load(f)
+                if expires_at and expires_at < now:
+                    os.remove(path)
+                else:
+                    survivors.append((os.path.getmtime(path), path))
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+        survivors.sort()
+        for _, path in survivors[: max(0, len(survivors) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def make_backend(app, prefix):
+    """
+    Build a cache backend from the '<prefix>_*' settings of an app.
+
+    Args:
+        app (Flask): The Flask application instance.
+        prefix (str): The settings prefix, e.g. 'RESPONSE_CACHE'.
+
+    Returns:
+        object: A Null, LRU or FileSystem cache backend.
+
+    Raises:
+        ValueError: If '<prefix>_TYPE' names an unknown backend.
+    """
+    backend_type = app.config[prefix + "_TYPE"]
+    timeout = app.config[prefix + "_TIMEOUT"]
+    max_entries = app.config[prefix + "_MAX_ENTRIES"]
+    if backend_type == "null":
+        return NullCacheBackend()
+    if backend_type == "lru":
+        return LRUCacheBackend(max_entries=max_entries, default_timeout=timeout)
+    if backend_type == "filesystem":
+        return FileSystemCacheBackend(
+            app.config[prefix + "_DIR"],
+            max_entries=max_entries,
+            default_timeout=timeout,
+        )
+    raise ValueError("Unknown {}_TYPE: {}".format(prefix, backend_type))
+
+
+class ResponseCache:
+    """
+    Flask extension caching full responses of public read routes.
+
+    Usage:
+        - response_cache = ResponseCache()
+        - response_cache.init_app(app)
+
+        @main.route("/home")
+        @response_cache.cached(tags=["feed"])
+        def home():
+            ...
+
+        # after a write
+        response_cache.invalidate_post(post)
+
+    Note:
+        - Only GET and HEAD requests that produce a 200 response are
+          stored, and nothing is cached while the session holds flashed
+          messages, since those are rendered into the page once.
+        - Authenticated visitors bypass the cache unless
+          'RESPONSE_CACHE_AUTHENTICATED' is enabled, in which case each
+          user gets their own entries.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Configure the cache backend for an application.
+
+        Args:
+            app (Flask): The Flask application instance.
+        """
+        app.config.setdefault("RESPONSE_CACHE_TYPE", "lru")
+        if not app.config.get("RESPONSE_CACHE_DIR"):
+            app.config["RESPONSE_CACHE_DIR"] = os.path.join(
+                app.instance_path, "response_cache"
+            )
+        app.config.setdefault("RESPONSE_CACHE_TIMEOUT", 60)
+        app.config.setdefault("RESPONSE_CACHE_MAX_ENTRIES", 2048)
+        app.config.setdefault("RESPONSE_CACHE_AUTHENTICATED", False)
+        app.extensions["response_cache"] = make_backend(app, "RESPONSE_CACHE")
+
+    @property
+    def backend(self):
+        """
+        object: The cache backend of the current application.
+        """
+        return current_app.extensions["response_cache"]
+
+    def _tag_versions(self, tags):
+        """
+        Look up the current version of each tag, creating missing ones.
+
+        - A tag whose version is unknown (never set, expired or evicted)
+          gets a fresh, time-based version, so entries stored against an
+          older version can never become valid again.
+        """
+        versions = {}
+        for tag in tags:
+            version = self.backend.get("tag:" + tag)
+            if version is None:
+                version = time.time_ns()
+                self.backend.set("tag:" + tag, version, timeout=0)
+            versions[tag] = version
+        return versions
+
+    def invalidate_tags(self, *tags):
+        """
+        Invalidate every entry stored with any of the given tags.
+
+        Args:
+            *tags (str): The tags to invalidate.
+        """
+        for tag in tags:
+            self.backend.set("tag:" + tag, time.time_ns(), timeout=0)
+
+    def invalidate_post(self, post):
+        """
+        Invalidate the pages showing a post: its own page, its author's
+        timeline and the home feed.
+
+        Args:
+            post (Post): The post that was created, updated or deleted.
+        """
+        self.invalidate_tags(
+            "feed", "post:{}".format(post.id), "timeline:" + post.author.username
+        )
+
+    def invalidate_author(self, user, *old_usernames):
+        """
+        Invalidate the pages showing an author's profile details: every
+        page of their posts, their timeline and the home feed.
+
+        Args:
+            user (User): The user whose account was updated.
+            *old_usernames (str): Previous usernames whose timeline
+              URLs should also be invalidated.
+        """
+        timelines = ["timeline:" + name for name in (user.username,) + old_usernames]
+        self.invalidate_tags("feed", "author:{}".format(user.id), *timelines)
+
+    def tag(self, *tags):
+        """
+        Add tags to the entry the current view is about to store.
+
+        - The versions of the tags are read now, so call this before
+          loading the data they cover; an invalidation that happens
+          between loading and tagging would otherwise be masked. Tags
+          known from the view arguments belong in 'cached(tags=...)'.
+
+        Args:
+            *tags (str): The tags to add.
+        """
+        if self._cacheable_request():
+            g.setdefault("_response_cache_tags", {}).update(self._tag_versions(tags))
+
+    def _key(self):
+        """
+        Build the cache key for the current request.
+        """
+        if current_user.is_authenticated:
+            auth = "user:{}".format(current_user.get_id())
+        else:
+            auth = "anon"
+        query = urlencode(sorted(request.args.items(multi=True)))
+        return "view:{}?{}|{}".format(request.path, query, auth)
+
+    def _cacheable_request(self):
+        # A disabled cache skips the tag lookups as well
+        if isinstance(self.backend, NullCacheBackend):
+            return False
+        if request.method not in ("GET", "HEAD") or "_flashes" in session:
+            return False
+        if current_user.is_authenticated:
+            return current_app.config["RESPONSE_CACHE_AUTHENTICATED"]
+        return True
+
+    def cached(self, tags=None, timeout=None):
+        """
+        Decorate a view so its responses are served from the cache.
+
+        Args:
+            tags (list or callable, optional): Tags for the stored entry,
+              or a function receiving the view arguments and returning
+              them. Defaults to None.
+            timeout (int, optional): Seconds the entry lives. Defaults to
+              'RESPONSE_CACHE_TIMEOUT'.
+
+        Returns:
+            callable: The decorator.
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if not self._cacheable_request():
+                    return view(**kwargs)
+                key = self._key()
+                entry = self.backend.get(key)
+                if entry is not None:
+                    versions, status, headers, body = entry
+                    if self._tag_versions(versions) == versions:
+                        response = current_app.response_class(
+                            body, status=status, headers=headers
+                        )
+                        response.headers["X-Cache"] = "HIT"
+                        etag, _ = response.get_etag()
+                        if etag and not is_resource_modified(
+                            request.environ, etag=etag
+                        ):
+                            response.status_code = 304
+                            response.set_data(b"")
+                        return response
+
+                # Read tag versions before rendering, so an invalidation
+                # racing with this request is never masked by its entry.
+                versions = self._tag_versions(
+                    tags(**kwargs) if callable(tags) else tags or []
+                )
+                response = current_app.make_response(view(**kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    versions.update(g.pop("_response_cache_tags", {}))
+                    headers = [
+                        (name, value)
+                        for name, value in response.headers.items()
+                        if name.lower() != "set-cookie"
+                    ]
+                    self.backend.set(
+                        key,
+                        (
+                            versions,
+                            response.status_code,
+                            headers,
+                            response.get_data(),
+                        ),
+                        timeout=(
+                            current_app.config["RESPONSE_CACHE_TIMEOUT"]
+                            if timeout is None
+                            else timeout
+                        ),
+                    )
+                    response.headers["X-Cache"] = "MISS"
+                return response
+
+            return wrapper
+
+        return decorator
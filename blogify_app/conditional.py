@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Conditional GET support (ETag / Last-Modified / 304) for the Blogify
+web application.
+
+- This module computes strong ETags for pages built from posts, from
+  the post ids, their modification stamps and the author details the
+  pages display.
+- Requests carrying a matching 'If-None-Match' are answered with
+  '304 Not Modified' before any template is rendered. 'If-Modified-Since'
+  alone never is: 'Last-Modified' only follows the posts, while pages
+  also show author details and depend on templates and assets, which
+  only the ETag covers.
+- Full responses are sent with 'ETag', 'Last-Modified' and a
+  'Cache-Control: no-cache' header, so browsers and proxies keep the
+  page but revalidate it on every use.
+
+For detailed information about each function, refer to the individual
+function docstrings.
+
+Note: These helpers are used by the 'posts.post', 'main.home' and
+'users.user_posts' routes.
+"""
+
+import os
+import hashlib
+from functools import lru_cache
+from flask import current_app, make_response, render_template, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+
+@lru_cache(maxsize=None)
+def template_version(template_folder):
+    """
+    Fingerprint the template files, so a deploy that changes the
+    markup also changes every ETag.
+
+    Args:
+        template_folder (str): The application's template directory.
+
+    Returns:
+        str: A short digest of the template file names, sizes and
+          modification times.
+    """
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(template_folder)):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(
+                "{}:{}:{}".format(name, stat.st_size, stat.st_mtime_ns).encode()
+            )
+    return digest.hexdigest()[:12]
+
+
+def _viewer():
+    """
+    Describe who is looking at the page, since the navbar and the
+    author-only controls depend on it.
+    """
+    if current_user.is_authenticated:
+        return "user:{}".format(current_user.get_id())
+    return "anon"
+
+
+def post_fingerprint(post):
+    """
+    Build the part of an ETag contributed by a single post.
+
+    Args:
+        post (Post): A post shown on the page, with its author loaded.
+
+    Returns:
+        str: The post id, modification stamp and displayed author details.
+    """
+    author = post.author
+    return "{}@{}/{}:{}:{}:{}:{}".format(
+        post.id,
+        post.last_modified.isoformat(),
+        author.id,
+        author.username,
+        author.firstname,
+        author.lastname,
+        author.image_file,
+    )
+
+
+def make_etag(*parts):
+    """
+    Build a strong ETag from the given parts.
+
+    - The template version, the asset build and the viewer are always
+      mixed in.
+
+    Args:
+        *parts: Values identifying the content of the page.
+
+    Returns:
+        str: A hex digest suitable for 'Response.set_etag'.
+    """
+    digest = hashlib.sha1()
+    digest.update(
+        template_version(
+            os.path.join(current_app.root_path, current_app.template_folder)
+        ).encode()
+    )
+    digest.update(" ".join(sorted(current_app.extensions["assets"].values())).encode())
+    digest.update(_viewer().encode())
+    for part in parts:
+        digest.update(b"|" + str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def page_validators(posts, *extra):
+    """
+    Compute the validators of a page listing posts.
+
+    Args:
+        posts (KeysetPage or Pagination): The page of posts shown.
+        *extra: Further values shown on the page, such as the owner
+          of a timeline.
+
+    Returns:
+        tuple: The (etag, last_modified) pair of the page. The stamp is
+          None when the page is empty.
+    """
+    etag = make_etag(
+        *[post_fingerprint(post) for post in posts.items],
+        posts.has_next,
+        posts.has_prev,
+        getattr(posts, "total", None),
+        *extra,
+    )
+    stamps = [post.last_modified for post in posts.items]
+    return etag, max(stamps) if stamps else None
+
+
+def render_conditional(template_name, etag, last_modified=None, **context):
+    """
+    Render a template unless the client already holds the current version.
+
+    Args:
+        template_name (str): The template to render.
+        etag (str): The ETag of the current version of the page.
+        last_modified (datetime, optional): When the posts of the page
+          last changed, sent as 'Last-Modified' for information only; it
+          is not used to answer 'If-Modified-Since'. Defaults to None.
+        **context: Variables passed to the template.
+
+    Returns:
+        Response: A '304 Not Modified' response, or the rendered page
+          with validators attached.
+    """
+    if "_flashes" in session:
+        # Flashed messages are rendered once, so the page must be sent.
+        return render_template(template_name, **context)
+
+    if not is_resource_modified(request.environ, etag=etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render_template(template_name, **context))
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+    response.vary.add("Cookie")
+    return response
@@ -43,6 +43,87 @@ class Config:
           server.
         MAIL_PASSWORD (str): The password for authenticating with the email
           server.
+        FEED_PAGINATION (str): The pagination mode used by the home feed
+          and user timelines, either 'keyset' (cursor-based) or 'offset'
+          (numbered pages).
+        POSTS_PER_PAGE (int): The number of posts shown on each feed or
+          timeline page.
+        FEED_AUTHOR_LOADING (str): How the home feed loads post authors
+          ('joined', 'selectin', 'subquery', 'lazy' or 'raise').
+        TIMELINE_AUTHOR_LOADING (str): How user timelines load post authors.
+        POST_AUTHOR_LOADING (str): How the single post page loads its author.
+        RESPONSE_CACHE_TYPE (str): The full-page cache backend, one of
+          'lru' (per worker), 'filesystem' (shared by workers) or 'null'.
+        RESPONSE_CACHE_DIR (str): The directory used by the filesystem
+          backend. Defaults to 'response_cache' in the instance folder.
+        RESPONSE_CACHE_TIMEOUT (int): Seconds a cached page is kept.
+        FRAGMENT_CACHE_TYPE (str): The backend of the post card fragment
+          cache, one of 'lru', 'filesystem' or 'null'.
+        FRAGMENT_CACHE_TIMEOUT (int): Seconds a cached fragment is kept.
+        TEMPLATE_BYTECODE_CACHE_DIR (str): The directory of the persistent
+          Jinja bytecode cache. Defaults to 'jinja_cache' in the instance
+          folder.
+        TEMPLATE_PRELOAD (bool): Whether 'create_app()' loads every
+          template up front, so workers start warm.
+        MAX_CONTENT_LENGTH (int): The largest request body accepted, in
+          bytes.
+        UPLOAD_MAX_FILE_BYTES (int): The largest uploaded file accepted,
+          in bytes, enforced while the upload streams in.
+        UPLOAD_SPOOL_DIR (str): The directory uploads are streamed to.
+          Defaults to 'uploads' in the instance folder.
+        AVATAR_MAX_PIXELS (int): The largest profile picture accepted,
+          in pixels (width times height).
+        BCRYPT_LOG_ROUNDS (int): The bcrypt cost of new password hashes,
+          as suggested by 'flask passwords calibrate'. Older hashes are
+          upgraded on login.
+        RATELIMIT_ENABLED (bool): Whether login, registration and
+          password reset submissions are rate limited. Defaults to true.
+        RATELIMIT_STORAGE (str): Where rate limit buckets are kept,
+          'memory' (per worker) or 'sqlite' (shared by workers).
+        RATELIMIT_STORAGE_PATH (str): The SQLite file of the 'sqlite'
+          storage. Defaults to 'ratelimit.sqlite3' in the instance folder.
+        USER_CACHE_TYPE (str): The backend of the user identity cache,
+          one of 'lru', 'filesystem' or 'null'.
+        USER_CACHE_TIMEOUT (int): Seconds a cached user is kept.
+        MAIL_QUEUE_MODE (str): Where queued mail is delivered, 'thread'
+          (a background thread in each worker), 'worker' (only by
+          'flask mail worker') or 'sync' (in the request).
+        PROFILER_ENABLED (bool): Whether selected requests are profiled.
+          When off, profiling adds no work to requests at all.
+        PROFILER_MODE (str): 'cprofile' (pstats files) or 'sampling'
+          (collapsed stack files, for flame graphs).
+        PROFILER_SAMPLE_RATE (float): The fraction of requests profiled,
+          besides those carrying a signed 'X-Profile' header.
+        PROFILER_ENDPOINTS (str): Comma-separated endpoints eligible for
+          sampled profiling, such as 'main.home'. Empty means all.
+        PROFILER_DIR (str): The directory profiles are written to.
+          Defaults to 'profiles' in the instance folder.
+        SQL_SLOW_QUERY_MS (float): SQL statements slower than this are
+          logged with their parameters and endpoint.
+        SERVER_TIMING_ENABLED (bool): Whether responses carry a
+          'Server-Timing' header with the db, render and total times.
+        METRICS_ENABLED (bool): Whether request, database and cache
+          metrics are recorded and served at '/metrics'.
+        METRICS_TOKEN (str): A bearer token '/metrics' requires, if set.
+          Otherwise restrict the path at the reverse proxy.
+        METRICS_DIR (str): The directory each worker writes its metrics
+          to. Defaults to 'metrics' in the instance folder.
+        DB_POOL_SIZE (int): Connections each worker keeps open. Defaults
+          to the gunicorn thread count plus one.
+        DB_MAX_OVERFLOW (int): Extra connections opened for bursts.
+        DB_POOL_TIMEOUT (int): Seconds a request waits for a connection.
+        DB_POOL_RECYCLE (int): Seconds after which a connection is
+          replaced, or -1 for never. Preset per database.
+        DB_POOL_PRE_PING (bool): Whether connections are checked before
+          use. Preset per database.
+        DB_STATEMENT_TIMEOUT_MS (int): The longest a statement may run on
+          PostgreSQL and MySQL. 0 disables the limit.
+        DB_MAX_CONNECTIONS (int): The connections the database accepts
+          from this host; startup fails if the pools could exceed it.
+        GUNICORN_WORKERS (int): gunicorn workers, when not given by
+          'GUNICORN_CMD_ARGS' or 'WEB_CONCURRENCY'.
+        GUNICORN_THREADS (int): gunicorn threads per worker, when not
+          given by 'GUNICORN_CMD_ARGS'.
 
     Note:
         These configuration settings are used by the Flask application to
@@ -57,4 +138,52 @@ class Config:
     MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS")
     MAIL_USERNAME = os.environ.get("EMAIL_USER")
     MAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")
-
+    FEED_PAGINATION = os.environ.get("FEED_PAGINATION") or "keyset"
+    POSTS_PER_PAGE = int(os.environ.get("POSTS_PER_PAGE") or 5)
+    FEED_AUTHOR_LOADING = os.environ.get("FEED_AUTHOR_LOADING") or "joined"
+    TIMELINE_AUTHOR_LOADING = os.environ.get("TIMELINE_AUTHOR_LOADING") or "joined"
+    POST_AUTHOR_LOADING = os.environ.get("POST_AUTHOR_LOADING") or "joined"
+    RESPONSE_CACHE_TYPE = os.environ.get("RESPONSE_CACHE_TYPE") or "lru"
+    RESPONSE_CACHE_DIR = os.environ.get("RESPONSE_CACHE_DIR")
+    RESPONSE_CACHE_TIMEOUT = int(os.environ.get("RESPONSE_CACHE_TIMEOUT") or 60)
+    FRAGMENT_CACHE_TYPE = os.environ.get("FRAGMENT_CACHE_TYPE") or "lru"
+    FRAGMENT_CACHE_TIMEOUT = int(os.environ.get("FRAGMENT_CACHE_TIMEOUT") or 3600)
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get("TEMPLATE_BYTECODE_CACHE_DIR")
+    TEMPLATE_PRELOAD = (os.environ.get("TEMPLATE_PRELOAD") or "").lower() == "true"
+    MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH") or 6 * 1024 * 1024)
+    UPLOAD_MAX_FILE_BYTES = int(
+        os.environ.get("UPLOAD_MAX_FILE_BYTES") or 5 * 1024 * 1024
+    )
+    UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR")
+    AVATAR_MAX_PIXELS = int(os.environ.get("AVATAR_MAX_PIXELS") or 24_000_000)
+    BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS") or 12)
+    RATELIMIT_ENABLED = (
+        os.environ.get("RATELIMIT_ENABLED") or "true"
+    ).lower() == "true"
+    RATELIMIT_STORAGE = os.environ.get("RATELIMIT_STORAGE") or "memory"
+    RATELIMIT_STORAGE_PATH = os.environ.get("RATELIMIT_STORAGE_PATH")
+    USER_CACHE_TYPE = os.environ.get("USER_CACHE_TYPE") or "lru"
+    USER_CACHE_TIMEOUT = int(os.environ.get("USER_CACHE_TIMEOUT") or 60)
+    MAIL_QUEUE_MODE = os.environ.get("MAIL_QUEUE_MODE") or "thread"
+    PROFILER_ENABLED = (os.environ.get("PROFILER_ENABLED") or "").lower() == "true"
+    PROFILER_MODE = os.environ.get("PROFILER_MODE") or "cprofile"
+    PROFILER_SAMPLE_RATE = float(os.environ.get("PROFILER_SAMPLE_RATE") or 0)
+    PROFILER_ENDPOINTS = os.environ.get("PROFILER_ENDPOINTS") or ""
+    PROFILER_DIR = os.environ.get("PROFILER_DIR")
+    SQL_SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_QUERY_MS") or 100)
+    SERVER_TIMING_ENABLED = (
+        os.environ.get("SERVER_TIMING_ENABLED") or "true"
+    ).lower() == "true"
+    METRICS_ENABLED = (os.environ.get("METRICS_ENABLED") or "").lower() == "true"
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+    METRICS_DIR = os.environ.get("METRICS_DIR")
+    # Validated by 'blogify_app/database.py'
+    DB_POOL_SIZE = os.environ.get("DB_POOL_SIZE")
+    DB_MAX_OVERFLOW = os.environ.get("DB_MAX_OVERFLOW")
+    DB_POOL_TIMEOUT = os.environ.get("DB_POOL_TIMEOUT")
+    DB_POOL_RECYCLE = os.environ.get("DB_POOL_RECYCLE")
+    DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING")
+    DB_STATEMENT_TIMEOUT_MS = os.environ.get("DB_STATEMENT_TIMEOUT_MS")
+    DB_MAX_CONNECTIONS = os.environ.get("DB_MAX_CONNECTIONS")
+    GUNICORN_WORKERS = os.environ.get("GUNICORN_WORKERS")
+    GUNICORN_THREADS = os.environ.get("GUNICORN_THREADS")
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Database engine and connection pool settings for the Blogify web
+application.
+
+- This module turns the 'DB_*' settings into the
+  'SQLALCHEMY_ENGINE_OPTIONS' Flask-SQLAlchemy creates its engine with,
+  on top of a preset for the database in use: SQLite, PostgreSQL or
+  MySQL.
+- Unless set explicitly, the pool is sized from the gunicorn thread
+  count: each request thread holds at most one connection at a time, so
+  a worker needs one connection per thread, plus one for the mail
+  queue's delivery thread and one per avatar processing thread, which
+  write 'User.image_file' through the same engine. The gunicorn worker
+  count is used to check the total against 'DB_MAX_CONNECTIONS'; a
+  warning is logged when it cannot be found.
+- Every setting is validated when the app is created, so a typo fails
+  the deploy rather than the first busy hour.
+- The effective pool settings are logged once the engine exists.
+
+For detailed information about each function, refer to the individual
+docstrings.
+
+Note: 'configure_engine' runs in 'create_app' before 'db.init_app', and
+'log_pool_settings' right after it. Options already present in
+'SQLALCHEMY_ENGINE_OPTIONS' take precedence over the ones built here.
+"""
+
+import os
+import shlex
+from sqlalchemy.engine import make_url
+from blogify_app.avatars import DEFAULT_AVATAR_WORKERS
+
+# Engine options of each database, before the 'DB_*' settings apply.
+PRESETS = {
+    # Writers wait up to 15s for the database lock instead of failing
+    "sqlite": {"connect_args": {"timeout": 15}},
+    # Connections are checked before use and replaced after 30 minutes,
+    # before firewalls and PgBouncer drop idle ones
+    "postgresql": {
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+        "connect_args": {"connect_timeout": 10},
+    },
+    # Connections are replaced before the common 300s 'wait_timeout' of
+    # hosted MySQL servers
+    "mysql": {
+        "pool_pre_ping": True,
+        "pool_recycle": 280,
+        "connect_args": {"connect_timeout": 10},
+    },
+}
+
+# Seconds a request waits for a pooled connection (SQLAlchemy waits 30).
+DEFAULT_POOL_TIMEOUT = 10
+
+# Milliseconds a statement may run on PostgreSQL and MySQL. 0 disables.
+DEFAULT_STATEMENT_TIMEOUT_MS = 30000
+
+# Connections beyond the pool size opened for bursts.
+DEFAULT_MAX_OVERFLOW = 2
+
+
+def _integer(config, key, minimum, default=None):
+    """
+    Read an integer setting, which may be a string from the environment.
+
+    Raises:
+        ValueError: If the setting is not an integer of at least
+          'minimum'.
+    """
+    value = config.get(key)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("{} must be an integer, got {!r}".format(key, value))
+    if number < minimum:
+        raise ValueError("{} must be at least {}, got {}".format(key, minimum, number))
+    return number
+
+
+def _boolean(config, key):
+    """
+    Read a boolean setting, which may be 'true' or 'false' from the
+    environment.
+
+    Raises:
+        ValueError: If the setting is neither.
+    """
+    value = config.get(key)
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("true", "1", "yes"):
+        return True
+    if str(value).lower() in ("false", "0", "no"):
+        return False
+    raise ValueError("{} must be true or false, got {!r}".format(key, value))
+
+
+def gunicorn_concurrency(config, environ=os.environ):
+    """
+    Find the number of gunicorn workers and threads per worker.
+
+    - 'GUNICORN_WORKERS' and 'GUNICORN_THREADS' win; otherwise the
+      '--workers' and '--threads' options of 'GUNICORN_CMD_ARGS' (as
+      '-w 4', '-w4' or '--workers=4') and the 'WEB_CONCURRENCY'
+      variable, which gunicorn itself reads, are used. A gunicorn
+      configuration file is not read.
+
+    Args:
+        config (dict): The app configuration.
+        environ (dict, optional): The environment. Defaults to
+          'os.environ'.
+
+    Returns:
+        tuple: The workers, None if unknown, and the threads, 1 (the
+          gunicorn default) if unknown.
+    """
+    found = {"workers": environ.get("WEB_CONCURRENCY"), "threads": None}
+    args = shlex.split(environ.get("GUNICORN_CMD_ARGS", ""))
+    for i, arg in enumerate(args):
+        for name, flags in (
+            ("workers", ("-w", "--workers")),
+            ("threads", ("--threads",)),
+        ):
+            if arg in flags and i + 1 < len(args):
+                found[name] = args[i + 1]
+            elif arg.startswith(flags[-1] + "="):
+                found[name] = arg.split("=", 1)[1]
+            elif flags[0] == "-w" and arg.startswith("-w") and len(arg) > 2:
+                found[name] = arg[2:]
+    environment = {
+        "GUNICORN_WORKERS": found["workers"],
+        "GUNICORN_THREADS": found["threads"],
+    }
+    workers = _integer(config, "GUNICORN_WORKERS", 1) or _integer(
+        environment, "GUNICORN_WORKERS", 1
+    )
+    threads = _integer(config, "GUNICORN_THREADS", 1) or _integer(
+        environment, "GUNICORN_THREADS", 1, 1
+    )
+    return workers, threads
+
+
+def engine_options(config, environ=os.environ):
+    """
+    Build the engine options for the configured database.
+
+    Args:
+        config (dict): The app configuration, with
+          'SQLALCHEMY_DATABASE_URI' and the optional 'DB_*' settings.
+        environ (dict, optional): The environment, read for the gunicorn
+          settings. Defaults to 'os.environ'.
+
+    Returns:
+        dict: The engine options, without the ones already in
+          'SQLALCHEMY_ENGINE_OPTIONS'.
+
+    Raises:
+        ValueError: If a setting is invalid, or the pools of every
+          worker would exceed 'DB_MAX_CONNECTIONS'.
+    """
+    uri = config.get("SQLALCHEMY_DATABASE_URI")
+    if not uri:
+        return {}
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend == "mariadb":
+        backend = "mysql"
+    options = {
+        key: dict(value) if isinstance(value, dict) else value
+        for key, value in PRESETS.get(backend, {}).items()
+    }
+    # SQLite in memory uses a single shared connection, without a pool
+    if backend == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+
+    workers, threads = gunicorn_concurrency(config, environ)
+    background = 1
+    if config.get("AVATAR_PROCESSING", "async") == "async":
+        background += _integer(config, "AVATAR_WORKERS", 1, DEFAULT_AVATAR_WORKERS)
+    pool_size = _integer(config, "DB_POOL_SIZE", 1, threads + background)
+    max_overflow = _integer(config, "DB_MAX_OVERFLOW", 0, DEFAULT_MAX_OVERFLOW)
+    options["pool_size"] = pool_size
+    options["max_overflow"] = max_overflow
+    options["pool_timeout"] = _integer(
+        config, "DB_POOL_TIMEOUT", 1, DEFAULT_POOL_TIMEOUT
+    )
+    recycle = _integer(config, "DB_POOL_RECYCLE", -1)
+    if recycle == 0:
+        raise ValueError("DB_POOL_RECYCLE must be -1 (never) or a number of seconds")
+    if recycle is not None:
+        options["pool_recycle"] = recycle
+    pre_ping = _boolean(config, "DB_POOL_PRE_PING")
+    if pre_ping is not None:
+        options["pool_pre_ping"] = pre_ping
+
+    timeout = _integer(
+        config, "DB_STATEMENT_TIMEOUT_MS", 0, DEFAULT_STATEMENT_TIMEOUT_MS
+    )
+    if timeout and backend == "postgresql":
+        options["connect_args"]["options"] = "-c statement_timeout={}".format(timeout)
+    elif timeout and backend == "mysql":
+        # Applies to SELECT statements, the ones that can run away
+        options["connect_args"][
+            "init_command"
+        ] = "SET SESSION max_execution_time={}".format(timeout)
+
+    limit = _integer(config, "DB_MAX_CONNECTIONS", 1)
+    total = (workers or 1) * (pool_size + max_overflow)
+    if limit is not None and total > limit:
+        raise ValueError(
+            "{} workers x (DB_POOL_SIZE {} + DB_MAX_OVERFLOW {}) = {} connections, "
+            "above DB_MAX_CONNECTIONS {}".format(
+                workers, pool_size, max_overflow, total, limit
+            )
+        )
+    return options
+
+
+def configure_engine(app):
+    """
+    Fill in 'SQLALCHEMY_ENGINE_OPTIONS' for an app.
+
+    - Must run before 'db.init_app', which creates the engine.
+    - Logs a warning when the gunicorn worker count cannot be found.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Raises:
+        ValueError: If a 'DB_*' setting is invalid.
+    """
+    options = engine_options(app.config)
+    if "pool_size" in options and gunicorn_concurrency(app.config)[0] is None:
+        app.logger.warning(
+            "The gunicorn worker count is unknown; assuming 1 worker of up to "
+            "%s connections. Set GUNICORN_WORKERS to size the pools correctly",
+            options["pool_size"] + options["max_overflow"],
+        )
+    explicit = app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {}
+    if "connect_args" in explicit and "connect_args" in options:
+        options["connect_args"].update(explicit["connect_args"])
+        explicit = {k: v for k, v in explicit.items() if k != "connect_args"}
+    options.update(explicit)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+
+def pool_settings(engine):
+    """
+    Describe the effective pool of an engine.
+
+    Args:
+        engine (Engine): The engine.
+
+    Returns:
+        dict: The dialect, pool class and, for queue pools, the size,
+          overflow, timeout, recycle and pre-ping settings.
+    """
+    pool = engine.pool
+    settings = {"dialect": engine.dialect.name, "pool": type(pool).__name__}
+    # The pool has no public accessors for these three settings
+    if hasattr(pool, "overflow"):
+        settings.update(
+            size=pool.size(),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+            recycle=pool._recycle,
+            pre_ping=pool._pre_ping,
+        )
+    return settings
+
+
+def log_pool_settings(app):
+    """
+    Log the effective pool settings of an app's engine.
+
+    Args:
+        app (Flask): The Flask application instance, after
+          'db.init_app'.
+    """
+    from blogify_app import db
+
+    with app.app_context():
+        settings = pool_settings(db.engine)
+    app.logger.info(
+        "Database pool: %s",
+        ", ".join("{}={}".format(key, value) for key, value in settings.items()),
+    )
@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 """
-Flask Blueprint for handling custom error pages (404, 403, 500).
+Flask Blueprint for handling custom error pages
+(404, 403, 413, 429, 500, 503).
 
 - This Blueprint provides error handlers for HTTP status codes
-  404 (Not Found), 403 (Forbidden), and 500 (Internal Server Error).
+  404 (Not Found), 403 (Forbidden), 413 (Payload Too Large),
+  429 (Too Many Requests), 500 (Internal Server Error),
+  and 503 (Service Unavailable).
 - It renders custom error pages while setting the appropriate
   HTTP status codes for each error scenario.
 
@@ -54,6 +57,50 @@ def error_403(error):
     return render_template("errors/403.html"), 403
 
 
+@errors.app_errorhandler(413)
+def error_413(error):
+    """
+    Handle 413 Payload Too Large errors.
+
+    Args:
+    - error (Exception): The error object.
+
+    Returns:
+    - tuple: A tuple containing the rendered template
+      for the 413 error page and the HTTP status code 413.
+
+    - This function is an error handler for uploads larger than
+      'MAX_CONTENT_LENGTH' or 'UPLOAD_MAX_FILE_BYTES'.
+    - It renders the "errors/413.html" template
+      and sets the HTTP status code to 413 before returning the response.
+    """
+    return render_template("errors/413.html"), 413
+
+
+@errors.app_errorhandler(429)
+def error_429(error):
+    """
+    Handle 429 Too Many Requests errors.
+
+    Args:
+    - error (Exception): The error object.
+
+    Returns:
+    - tuple: A tuple containing the rendered template
+      for the 429 error page, the HTTP status code 429 and the
+      'Retry-After' header.
+
+    - This function is an error handler for form submissions refused
+      by the rate limiter.
+    - It renders the "errors/429.html" template
+      and sets the HTTP status code to 429 before returning the response.
+    """
+    headers = {}
+    if getattr(error, "retry_after", None) is not None:
+        headers["Retry-After"] = str(error.retry_after)
+    return render_template("errors/429.html"), 429, headers
+
+
 @errors.app_errorhandler(500)
 def error_500(error):
     """
@@ -71,3 +118,27 @@ def error_500(error):
       to 500 before returning the response.
     """
     return render_template("errors/500.html"), 500
+
+
+@errors.app_errorhandler(503)
+def error_503(error):
+    """
+    Handle 503 Service Unavailable errors.
+
+    Args:
+    - error (Exception): The error object.
+
+    Returns:
+    - tuple: A tuple containing the rendered template
+      for the 503 error page and the HTTP status code 503.
+
+    - This function is an error handler for 503 Service Unavailable errors.
+    - It renders the "errors/503.html" template
+      and sets the HTTP status code to 503 before returning the response.
+    - A 'Retry-After' value carried by the error (for instance when the
+      password hashing pool is saturated) is passed on to the client.
+    """
+    headers = {}
+    if getattr(error, "retry_after", None) is not None:
+        headers["Retry-After"] = str(error.retry_after)
+    return render_template("errors/503.html"), 503, headers
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Template fragment caching for the Blogify web application.
+
+- This module provides a '{% cache key %}...{% endcache %}' Jinja tag
+  that stores the rendered HTML of a template block and reuses it on
+  later renders, for any visitor.
+- It is used for post cards, which look the same for everyone even
+  when the page around them (the navbar of a logged-in user, for
+  instance) cannot be cached as a whole.
+- Keys are versioned: they embed the template version, the post id,
+  the post's modification stamp and the author's profile version.
+  Editing a post or changing a username or avatar therefore produces
+  new keys, and the outdated fragments simply age out of the cache.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: The 'fragment_cache' extension instance is created and initialised
+in 'blogify_app/__init__.py'.
+"""
+
+import os
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from blogify_app.cache import make_backend
+from blogify_app.conditional import template_version
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Jinja extension adding the '{% cache key[, timeout] %}' block tag.
+
+    Usage:
+        {% cache post_card_key(post) %}
+            ... expensive markup ...
+        {% endcache %}
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_cache_support", args), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_support(self, key, timeout, caller):
+        """
+        Return the cached fragment for 'key', rendering it on a miss.
+        """
+        backend = current_app.extensions["fragment_cache"]
+        key = "fragment:" + key
+        html = backend.get(key)
+        if html is None:
+            html = str(caller())
+            backend.set(key, html, timeout=timeout)
+        return Markup(html)
+
+
+def post_card_key(post):
+    """
+    Build the fragment cache key of a post card.
+
+    Args:
+        post (Post): The post, with its author loaded.
+
+    Returns:
+        str: A key that changes whenever the card's content (or the
+          markup of the templates) would.
+    """
+    return "card:{}:{}:{}:{}:{}:{}".format(
+        template_version(
+            os.path.join(current_app.root_path, current_app.template_folder)
+        ),
+        post.id,
+        post.last_modified.isoformat(),
+        int(post.excerpt is not None),
+        post.user_id,
+        post.author.profile_version,
+    )
+
+
+def post_body_key(post):
+    """
+    Build the fragment cache key of the title and content of a post page.
+
+    Args:
+        post (Post): The post.
+
+    Returns:
+        str: A key that changes whenever the post is edited.
+    """
+    return "body:{}:{}:{}".format(
+        template_version(
+            os.path.join(current_app.root_path, current_app.template_folder)
+        ),
+        post.id,
+        post.last_modified.isoformat(),
+    )
+
+
+class FragmentCache:
+    """
+    Flask extension wiring the fragment cache into Jinja.
+
+    Usage:
+        - fragment_cache = FragmentCache()
+        - fragment_cache.init_app(app)
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Configure the fragment cache backend and Jinja tag for an app.
+
+        Args:
+            app (Flask): The Flask application instance.
+        """
+        app.config.setdefault("FRAGMENT_CACHE_TYPE", "lru")
+        if not app.config.get("FRAGMENT_CACHE_DIR"):
+            app.config["FRAGMENT_CACHE_DIR"] = os.path.join(
+                app.instance_path, "fragment_cache"
+            )
+        app.config.setdefault("FRAGMENT_CACHE_TIMEOUT", 3600)
+        app.config.setdefault("FRAGMENT_CACHE_MAX_ENTRIES", 4096)
+        app.extensions["fragment_cache"] = make_backend(app, "FRAGMENT_CACHE")
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.globals.update(
+            post_card_key=post_card_key, post_body_key=post_body_key
+        )
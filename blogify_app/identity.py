@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+User identity caching for the Blogify web application.
+
+- This module provides the 'UserCache' Flask extension, which keeps the
+  profile columns of recently seen users so that Flask-Login's user
+  loader and the timeline route do not query the 'user' table on every
+  request.
+- Users are cached by id, with a second key mapping each username to
+  its id. Entries expire after 'USER_CACHE_TIMEOUT' seconds and the
+  least recently used ones are evicted past 'USER_CACHE_MAX_ENTRIES'.
+- A cached user is attached to the request's database session with
+  'merge(load=False)', which issues no SQL. The result is an ordinary
+  persistent instance: it can be updated and committed, and its
+  relationships load lazily as usual.
+- The password hash is never cached. It is loaded from the database
+  the first time it is read, which only the login and reset routes do.
+- Lookups are also memoised for the duration of a request.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: The 'user_cache' extension instance is created and initialised in
+'blogify_app/__init__.py'. Code that changes a user's profile must call
+'user_cache.invalidate(user, *old_usernames)' after committing. With the
+default 'lru' backend each worker keeps its own entries, so other
+workers may serve the old profile for up to 'USER_CACHE_TIMEOUT'
+seconds; use the 'filesystem' backend to share invalidations.
+"""
+
+import os
+from flask import current_app, g
+from sqlalchemy.orm import make_transient_to_detached
+from blogify_app.cache import make_backend
+
+# Columns left out of cache entries, loaded from the database on access.
+UNCACHED_COLUMNS = ("password",)
+
+
+class UserCache:
+    """
+    Flask extension caching users by id and by username.
+
+    Usage:
+        - user_cache = UserCache()
+        - user_cache.init_app(app)
+        - user = user_cache.get(user_id)
+        - user = user_cache.get_by_username(username)
+
+        # after changing a user
+        user_cache.invalidate(user, old_username)
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Configure the user cache backend of an app.
+
+        Args:
+            app (Flask): The Flask application instance.
+        """
+        app.config.setdefault("USER_CACHE_TYPE", "lru")
+        if not app.config.get("USER_CACHE_DIR"):
+            app.config["USER_CACHE_DIR"] = os.path.join(app.instance_path, "user_cache")
+        app.config.setdefault("USER_CACHE_TIMEOUT", 60)
+        app.config.setdefault("USER_CACHE_MAX_ENTRIES", 4096)
+        app.extensions["user_cache"] = make_backend(app, "USER_CACHE")
+
+    @property
+    def backend(self):
+        """
+        object: The cache backend of the current application.
+        """
+        return current_app.extensions["user_cache"]
+
+    def _memo(self):
+        if "_user_cache" not in g:
+            g._user_cache = {}
+        return g._user_cache
+
+    def _store(self, user):
+        from blogify_app.models import User
+
+        columns = {
+            column.key: getattr(user, column.key)
+            for column in User.__table__.columns
+            if column.key not in UNCACHED_COLUMNS
+        }
+        self.backend.set("user:id:{}".format(user.id), columns)
+        self.backend.set("user:name:{}".format(user.username), user.id)
+
+    def _attach(self, columns):
+        from blogify_app import db
+        from blogify_app.models import User
+
+        user = User(**columns)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def get(self, user_id):
+        """
+        Return a user by id.
+
+        Args:
+            user_id (int): The id of the user.
+
+        Returns:
+            User: The user, attached to the current session, or None if
+              there is no such user.
+        """
+        from blogify_app import db
+        from blogify_app.models import User
+
+        memo = self._memo()
+        if user_id in memo:
+            return memo[user_id]
+        columns = self.backend.get("user:id:{}".format(user_id))
+        if columns is not None:
+            user = self._attach(columns)
+        else:
+            user = db.session.get(User, user_id)
+            if user is not None:
+                self._store(user)
+        memo[user_id] = user
+        return user
+
+    def get_by_username(self, username):
+        """
+        Return a user by username.
+
+        Args:
+            username (str): The username of the user.
+
+        Returns:
+            User: The user, attached to the current session, or None if
+              there is no such user.
+        """
+        from blogify_app.models import User
+
+        user_id = self.backend.get("user:name:{}".format(username))
+        if user_id is not None:
+            user = self.get(user_id)
+            # The name may have moved to another user since it was cached
+            if user is not None and user.username == username:
+                return user
+        user = User.query.filter_by(username=username).first()
+        if user is not None:
+            self._store(user)
+            self._memo()[user.id] = user
+        return user
+
+    def invalidate(self, user, *old_usernames):
+        """
+        Drop the cache entries of a user after it changed.
+
+        Args:
+            user (User): The changed user.
+            *old_usernames (str): Usernames the user went by before the
+              change, whose entries are dropped too.
+        """
+        self.backend.delete("user:id:{}".format(user.id))
+        for username in (user.username,) + old_usernames:
+            self.backend.delete("user:name:{}".format(username))
+        self._memo().pop(user.id, None)
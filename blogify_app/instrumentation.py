@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+SQL instrumentation and query budgets for the Blogify web application.
+
+- This module hooks SQLAlchemy's engine events to count and time the
+  SQL statements issued while serving each request, and keeps the
+  slowest of them with their parameters.
+- Statements slower than 'SQL_SLOW_QUERY_MS' are logged as they finish,
+  with the endpoint that issued them.
+- Responses carry a 'Server-Timing' header with the database time, the
+  template render time and the total time of the request, which
+  browser developer tools display in their network panel.
+- Routes can be given a query budget through the 'QUERY_BUDGETS'
+  setting. A request that goes over its budget is logged, or raises
+  'QueryBudgetExceeded' when 'QUERY_BUDGET_ENFORCE' is enabled, so that
+  N+1 regressions fail loudly in tests.
+- The 'query_budget' context manager offers the same check around an
+  arbitrary block of code, such as a test client call.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: The 'query_counter' extension instance is created and initialised
+in 'blogify_app/__init__.py'. Statements issued while a template renders
+(lazy relationship loads) count towards both the 'db' and the 'render'
+timings.
+"""
+
+import time
+import heapq
+import threading
+from contextlib import contextmanager
+from flask import (
+    before_render_template,
+    current_app,
+    g,
+    has_app_context,
+    has_request_context,
+    request,
+    template_rendered,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Budgets opened with 'query_budget', per thread.
+_active_budgets = threading.local()
+
+# Characters of a statement's parameters kept in logs and reports.
+PARAMETERS_MAX_LENGTH = 200
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when more SQL statements run than a query budget allows.
+
+    - This is an 'AssertionError' so that test runners report it as
+      a failed assertion rather than an error.
+    """
+
+
+class QueryCounter:
+    """
+    Flask extension counting the SQL statements issued per request.
+
+    Attributes:
+        app (Flask): The application the extension was initialised
+          with, if any.
+
+    Usage:
+        - query_counter = QueryCounter()
+        - query_counter.init_app(app)
+        - query_counter.count  # statements so far in this request
+        - query_counter.duration  # seconds spent in them
+        - query_counter.slowest  # [(seconds, statement, parameters)]
+    """
+
+    _listening = False
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Register the engine and template listeners, the budget check
+        and the 'Server-Timing' header with an app.
+
+        Args:
+            app (Flask): The Flask application instance.
+        """
+        app.config.setdefault(
+            "QUERY_BUDGETS", {"main.home": 3, "users.user_posts": 4, "posts.post": 2}
+        )
+        app.config.setdefault("QUERY_BUDGET_ENFORCE", False)
+        app.config.setdefault("SQL_SLOW_QUERY_MS", 100)
+        app.config.setdefault("SQL_RECORD_SLOWEST", 5)
+        app.config.setdefault("SERVER_TIMING_ENABLED", True)
+        if not QueryCounter._listening:
+            event.listen(Engine, "before_cursor_execute", _count_statement)
+            event.listen(Engine, "after_cursor_execute", _time_statement)
+            event.listen(Engine, "handle_error", _discard_statement)
+            before_render_template.connect(_start_render)
+            template_rendered.connect(_finish_render)
+            QueryCounter._listening = True
+        app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+        app.after_request(self._server_timing)
+        app.after_request(self._check_budget)
+
+    @property
+    def count(self):
+        """
+        int: The number of SQL statements issued in the current
+        application context.
+        """
+        return g.get("_query_count", 0)
+
+    @property
+    def duration(self):
+        """
+        float: The seconds spent executing SQL statements in the current
+        application context.
+        """
+        return g.get("_query_duration", 0.0)
+
+    @property
+    def render_duration(self):
+        """
+        float: The seconds spent rendering templates in the current
+        application context.
+        """
+        return g.get("_render_duration", 0.0)
+
+    @property
+    def slowest(self):
+        """
+        list: The slowest SQL statements of the current application
+        context, slowest first, as (seconds, statement, parameters).
+        """
+        return [entry[:1] + entry[2:] for entry in sorted(g.get("_slowest", ()))[::-1]]
+
+    def _server_timing(self, response):
+        """
+        Add the 'Server-Timing' header to a response.
+
+        - The header lists 'db' (with the statement count), 'render' and
+          'total', in milliseconds. 'total' runs from the start of the
+          request to this hook, so it excludes streaming the body.
+
+        Args:
+            response (Response): The outgoing response.
+
+        Returns:
+            Response: The response, with the header if enabled.
+        """
+        if not current_app.config["SERVER_TIMING_ENABLED"]:
+            return response
+        timings = [
+            'db;dur={:.1f};desc="{} queries"'.format(self.duration * 1000, self.count),
+            "render;dur={:.1f}".format(self.render_duration * 1000),
+        ]
+        started = g.get("_request_started")
+        if started is not None:
+            timings.append(
+                "total;dur={:.1f}".format((time.perf_counter() - started) * 1000)
+            )
+        response.headers.add("Server-Timing", ", ".join(timings))
+        return response
+
+    def _check_budget(self, response):
+        """
+        Compare the request's statement count with its route budget.
+
+        Args:
+            response (Response): The outgoing response.
+
+        Returns:
+            Response: The unchanged response.
+
+        Raises:
+            QueryBudgetExceeded: If the budget is exceeded and
+              'QUERY_BUDGET_ENFORCE' is enabled.
+        """
+        budget = current_app.config["QUERY_BUDGETS"].get(request.endpoint)
+        if budget is not None and self.count > budget:
+            message = "{} issued {} SQL statements (budget {})".format(
+                request.endpoint, self.count, budget
+            )
+            if current_app.config["QUERY_BUDGET_ENFORCE"]:
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
+
+
+def _start_request():
+    g._request_started = time.perf_counter()
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    """
+    Engine listener incrementing the per-request and per-block counters,
+    and noting when the statement started.
+    """
+    if has_app_context():
+        g._query_count = g.get("_query_count", 0) + 1
+    for counter in getattr(_active_budgets, "stack", ()):
+        counter[0] += 1
+    conn.info.setdefault("_statement_started", []).append(time.perf_counter())
+
+
+def _time_statement(conn, cursor, statement, parameters, context, executemany):
+    """
+    Engine listener timing a finished statement.
+
+    - The time is added to the request's total, the statement is kept
+      if it is among the 'SQL_RECORD_SLOWEST' slowest of the request,
+      and it is logged if it took more than 'SQL_SLOW_QUERY_MS'.
+    """
+    started = conn.info.get("_statement_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if not has_app_context():
+        return
+    g._query_duration = g.get("_query_duration", 0.0) + elapsed
+    config = current_app.config
+    slowest = g.setdefault("_slowest", [])
+    keep = config["SQL_RECORD_SLOWEST"]
+    slow = elapsed * 1000 > config["SQL_SLOW_QUERY_MS"]
+    if len(slowest) < keep or (keep and elapsed > slowest[0][0]) or slow:
+        params = repr(parameters)
+        if len(params) > PARAMETERS_MAX_LENGTH:
+            params = params[:PARAMETERS_MAX_LENGTH] + "..."
+        # The counter breaks ties, so statements are never compared
+        entry = (elapsed, g._query_count, statement, params)
+        if len(slowest) < keep:
+            heapq.heappush(slowest, entry)
+        elif keep and elapsed > slowest[0][0]:
+            heapq.heapreplace(slowest, entry)
+        if slow:
+            current_app.logger.warning(
+                "Slow SQL statement (%.1f ms) in %s: %s; parameters: %s",
+                elapsed * 1000,
+                request.endpoint if has_request_context() else "no request",
+                " ".join(statement.split()),
+                params,
+            )
+
+
+def _discard_statement(context):
+    """
+    Engine listener forgetting the start of a statement that failed.
+    """
+    if context.connection is not None:
+        started = context.connection.info.get("_statement_started")
+        if started:
+            started.pop()
+
+
+def _start_render(sender, template, context, **extra):
+    # Templates rendered by other templates are timed with their parent
+    if g.get("_render_depth", 0) == 0:
+        g._render_started = time.perf_counter()
+    g._render_depth = g.get("_render_depth", 0) + 1
+
+
+def _finish_render(sender, template, context, **extra):
+    g._render_depth = g.get("_render_depth", 1) - 1
+    if g._render_depth == 0 and "_render_started" in g:
+        elapsed = time.perf_counter() - g.pop("_render_started")
+        g._render_duration = g.get("_render_duration", 0.0) + elapsed
+
+
+@contextmanager
+def query_budget(limit):
+    """
+    Fail if the enclosed block issues more than 'limit' SQL statements.
+
+    Args:
+        limit (int): The maximum number of statements allowed.
+
+    Yields:
+        list: A one-element list holding the running statement count.
+
+    Raises:
+        QueryBudgetExceeded: If the block goes over its budget.
+
+    Usage:
+        with query_budget(2):
+            client.get("/home")
+    """
+    counter = [0]
+    stack = getattr(_active_budgets, "stack", None)
+    if stack is None:
+        stack = _active_budgets.stack = []
+    stack.append(counter)
+    try:
+        yield counter
+    finally:
+        stack.remove(counter)
+    if counter[0] > limit:
+        raise QueryBudgetExceeded(
+            "{} SQL statements issued (budget {})".format(counter[0], limit)
+        )
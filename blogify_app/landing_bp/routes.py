@@ -1,16 +1,19 @@
 #!/usr/bin/env python3
 
 from flask import Blueprint, render_template
+from blogify_app import response_cache
 
 landing_bp = Blueprint('landing', __name__)
 
 
 @landing_bp.route('/')
+@response_cache.cached()
 def landing_page():
     """
     Renders the landing page.
 
     This function renders the HTML template for the landing page.
+    The rendered page is served from the response cache when possible.
 
     Returns:
         flask.render_template: The rendered HTML template for the landing page.
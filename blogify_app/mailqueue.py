@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Outbound mail queue for the Blogify web application.
+
+- This module provides the 'MailQueue' Flask extension. Requests no
+  longer talk to the SMTP relay: 'mail_queue.enqueue(message)' stores
+  the message in the 'outbound_mail' table and returns at once, so a
+  slow or unreachable relay never holds up a worker, and no message is
+  lost when delivery fails.
+- A sender delivers due messages in batches over a single SMTP
+  connection, which stays open while batches keep coming, instead of
+  one connection (and TLS handshake and login) per message.
+- Failed attempts are retried with exponential backoff and jitter, up
+  to 'MAIL_QUEUE_MAX_ATTEMPTS' times. Permanent errors (5xx replies,
+  refused recipients, malformed messages) fail at once. Each message
+  records its status, attempts and last error.
+- Messages are claimed with a conditional UPDATE before sending, so
+  several senders (one per gunicorn worker, or 'flask mail worker'
+  processes) never deliver the same message twice. A claim expires
+  after 'MAIL_QUEUE_LEASE' seconds, so messages held by a crashed
+  sender are picked up again.
+- 'MAIL_QUEUE_MODE' selects where the sender runs: 'thread' (a
+  background thread in each worker, started on first use), 'worker'
+  (only 'flask mail worker' delivers) or 'sync' (delivered in the
+  request, for development and tests).
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: The 'mail_queue' extension instance is created and initialised in
+'blogify_app/__init__.py'. Messages go through the 'mail' (Flask-Mail)
+extension, so 'MAIL_SERVER' and 'MAIL_PORT' can point at a local SMTP
+stand-in such as 'python -m aiosmtpd -n -l localhost:8025' in testing.
+"""
+
+import os
+import random
+import smtplib
+import threading
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from flask_mail import Message
+from sqlalchemy import func, select, update
+
+mail_cli = AppGroup("mail", help="Deliver and inspect the outbound mail queue.")
+
+
+def backoff(attempts, base, cap):
+    """
+    Return the delay before the next delivery attempt of a message.
+
+    Args:
+        attempts (int): The number of attempts made so far (at least 1).
+        base (float): The delay after the first failure, in seconds.
+        cap (float): The longest delay, in seconds.
+
+    Returns:
+        float: The delay in seconds, doubled after each failure and
+          spread by +/- 20% so retries of a batch do not arrive at once.
+    """
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def is_permanent(error):
+    """
+    Tell whether an SMTP error will not go away by retrying.
+
+    Args:
+        error (SMTPException): The error raised while sending.
+
+    Returns:
+        bool: True for 5xx replies and recipients all refused with one.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return getattr(error, "smtp_code", 0) >= 500
+
+
+class MailQueue:
+    """
+    Flask extension queueing outbound mail and delivering it in batches.
+
+    Usage:
+        - mail_queue = MailQueue()
+        - mail_queue.init_app(app)
+        - mail_queue.enqueue(Message("Subject", recipients=[...]))
+    """
+
+    def __init__(self, app=None):
+        self._thread = None
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Configure the mail queue of an app.
+
+        Args:
+            app (Flask): The Flask application instance.
+
+        Raises:
+            ValueError: If 'MAIL_QUEUE_MODE' is unknown.
+        """
+        app.config.setdefault("MAIL_QUEUE_MODE", "thread")
+        app.config.setdefault("MAIL_QUEUE_BATCH_SIZE", 20)
+        app.config.setdefault("MAIL_QUEUE_MAX_ATTEMPTS", 6)
+        app.config.setdefault("MAIL_QUEUE_BACKOFF", 30)
+        app.config.setdefault("MAIL_QUEUE_BACKOFF_MAX", 3600)
+        app.config.setdefault("MAIL_QUEUE_LEASE", 300)
+        app.config.setdefault("MAIL_QUEUE_POLL_INTERVAL", 30)
+        if app.config["MAIL_QUEUE_MODE"] not in ("thread", "worker", "sync"):
+            raise ValueError(
+                "Unknown MAIL_QUEUE_MODE: {}".format(app.config["MAIL_QUEUE_MODE"])
+            )
+        app.extensions["mail_queue"] = self
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def enqueue(self, message):
+        """
+        Queue a message for delivery.
+
+        - The current database session is committed.
+
+        Args:
+            message (Message): The Flask-Mail message. Its sender
+              defaults to 'MAIL_DEFAULT_SENDER'.
+
+        Returns:
+            OutboundMail: The queued message.
+        """
+        from blogify_app import db
+        from blogify_app.models import OutboundMail
+
+        outbound = OutboundMail(
+            subject=message.subject,
+            sender=message.sender or current_app.config.get("MAIL_DEFAULT_SENDER"),
+            recipients=",".join(message.send_to),
+            body=message.body,
+            html=message.html,
+        )
+        db.session.add(outbound)
+        db.session.commit()
+        self._count("queued")
+
+        mode = current_app.config["MAIL_QUEUE_MODE"]
+        if mode == "sync":
+            self.deliver()
+        elif mode == "thread":
+            self._start(current_app._get_current_object())
+            self._wake.set()
+        return outbound
+
+    def _start(self, app):
+        """
+        Start the sender thread of this process on first use, after
+        gunicorn has forked.
+        """
+        with self._lock:
+            if (
+                self._thread is None
+                or self._pid != os.getpid()
+                or not self._thread.is_alive()
+            ):
+                self._thread = threading.Thread(
+                    target=self.run, args=(app,), name="mail-queue", daemon=True
+                )
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def _claim(self):
+        """
+        Claim a batch of due messages for this sender.
+
+        Returns:
+            list: The ids of the claimed messages, oldest due first.
+        """
+        from blogify_app import db
+        from blogify_app.models import OutboundMail
+
+        config = current_app.config
+        now = datetime.utcnow()
+        due = (
+            OutboundMail.status.in_(("queued", "sending")),
+            OutboundMail.next_attempt_at <= now,
+        )
+        candidates = db.session.scalars(
+            select(OutboundMail.id)
+            .where(*due)
+            .order_by(OutboundMail.next_attempt_at)
+            .limit(config["MAIL_QUEUE_BATCH_SIZE"])
+        ).all()
+        claimed = []
+        lease = now + timedelta(seconds=config["MAIL_QUEUE_LEASE"])
+        for mail_id in candidates:
+            result = db.session.execute(
+                update(OutboundMail)
+                .where(OutboundMail.id == mail_id, *due)
+                .values(status="sending", next_attempt_at=lease)
+            )
+            if result.rowcount:
+                claimed.append(mail_id)
+        db.session.commit()
+        return claimed
+
+    def _succeed(self, outbound):
+        from blogify_app import db
+
+        outbound.status = "sent"
+        outbound.attempts += 1
+        outbound.last_error = None
+        outbound.date_sent = datetime.utcnow()
+        db.session.commit()
+        self._count("sent")
+
+    def _fail(self, outbound, error, permanent=False):
+        from blogify_app import db
+
+        config = current_app.config
+        outbound.attempts += 1
+        outbound.last_error = "{}: {}".format(type(error).__name__, error)[:1000]
+        if permanent or outbound.attempts >= config["MAIL_QUEUE_MAX_ATTEMPTS"]:
+            outbound.status = "failed"
+            self._count("failed")
+            current_app.logger.error(
+                "Giving up on mail %s to %s after %s attempts: %s",
+                outbound.id,
+                outbound.recipients,
+                outbound.attempts,
+                outbound.last_error,
+            )
+        else:
+            outbound.status = "queued"
+            outbound.next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=backoff(
+                    outbound.attempts,
+                    config["MAIL_QUEUE_BACKOFF"],
+                    config["MAIL_QUEUE_BACKOFF_MAX"],
+                )
+            )
+            self._count("retried")
+        db.session.commit()
+
+    def deliver(self):
+        """
+        Deliver every due message over one SMTP connection.
+
+        - Batches are claimed until none is left, on the same connection.
+        - When the connection cannot be opened or is lost, the message
+          being sent and the rest of its batch are scheduled for a retry.
+
+        Returns:
+            tuple: The numbers of messages sent and not sent.
+        """
+        from blogify_app import db, mail
+        from blogify_app.models import OutboundMail
+
+        pending = self._claim()
+        if not pending:
+            return 0, 0
+        sent = unsent = 0
+        try:
+            with mail.connect() as conn:
+                while pending:
+                    outbound = db.session.get(OutboundMail, pending[0])
+                    message = Message(
+                        outbound.subject,
+                        sender=outbound.sender,
+                        recipients=outbound.recipients.split(","),
+                        body=outbound.body,
+                        html=outbound.html,
+                    )
+                    try:
+                        conn.send(message)
+                    except (
+                        smtplib.SMTPRecipientsRefused,
+                        smtplib.SMTPResponseException,
+                    ) as e:
+                        self._fail(outbound, e, permanent=is_permanent(e))
+                        unsent += 1
+                    except OSError:
+                        # Connection lost: handled below for the whole batch
+                        raise
+                    except Exception as e:
+                        # Malformed message (bad headers, no recipients)
+                        self._fail(outbound, e, permanent=True)
+                        unsent += 1
+                    else:
+                        self._succeed(outbound)
+                        sent += 1
+                    pending.pop(0)
+                    if not pending:
+                        pending = self._claim()
+        except OSError as e:
+            current_app.logger.warning("SMTP connection failed: %s", e)
+            db.session.rollback()
+            for mail_id in pending:
+                self._fail(db.session.get(OutboundMail, mail_id), e)
+                unsent += 1
+        return sent, unsent
+
+    def run(self, app, once=False):
+        """
+        Deliver messages as they become due.
+
+        Args:
+            app (Flask): The Flask application instance.
+            once (bool, optional): Whether to return after delivering
+              the messages due now. Defaults to False (run forever,
+              waking up on 'enqueue' or every 'MAIL_QUEUE_POLL_INTERVAL'
+              seconds).
+
+        Returns:
+            tuple: With 'once', the numbers of messages sent and not sent.
+        """
+        from blogify_app import db
+
+        with app.app_context():
+            while True:
+                self._wake.clear()
+                try:
+                    result = self.deliver()
+                except Exception:
+                    app.logger.exception("Mail queue delivery failed")
+                    result = (0, 0)
+                finally:
+                    db.session.remove()
+                if once:
+                    return result
+                self._wake.wait(app.config["MAIL_QUEUE_POLL_INTERVAL"])
+
+    def stats(self):
+        """
+        Return the counters of this process.
+
+        Returns:
+            dict: The numbers of messages queued, sent, scheduled for a
+              retry and given up on.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+@mail_cli.command("worker")
+@click.option("--once", is_flag=True, help="Deliver the due messages and exit.")
+def worker(once):
+    """
+    Deliver queued mail in the foreground.
+    \f
+    - Run it as its own process with 'MAIL_QUEUE_MODE=worker', so web
+      workers only queue messages.
+
+    Args:
+        once (bool): Whether to exit once the due messages are delivered.
+    """
+    queue = current_app.extensions["mail_queue"]
+    app = current_app._get_current_object()
+    if once:
+        sent, unsent = queue.run(app, once=True)
+        click.echo("Sent {}, not sent {}.".format(sent, unsent))
+        return
+    click.echo("Delivering queued mail, press Ctrl+C to stop.")
+    try:
+        queue.run(app)
+    except KeyboardInterrupt:
+        pass
+
+
+@mail_cli.command("status")
+def status():
+    """
+    Show the number of messages by delivery status.
+    """
+    from blogify_app import db
+    from blogify_app.models import OutboundMail
+
+    rows = db.session.execute(
+        select(
+            OutboundMail.status,
+            func.count(),
+            func.min(OutboundMail.date_created),
+        ).group_by(OutboundMail.status)
+    ).all()
+    if not rows:
+        click.echo("The queue is empty.")
+    for state, count, oldest in rows:
+        click.echo("{:<8} {:>6}  oldest {:%Y-%m-%d %H:%M}".format(state, count, oldest))
+    for outbound in OutboundMail.query.filter_by(status="failed").limit(10):
+        click.echo(
+            "failed #{} to {}: {}".format(
+                outbound.id, outbound.recipients, outbound.last_error
+            )
+        )
+
+
+@mail_cli.command("retry")
+def retry():
+    """
+    Queue the failed messages for delivery again.
+    """
+    from blogify_app import db
+    from blogify_app.models import OutboundMail
+
+    result = db.session.execute(
+        update(OutboundMail)
+        .where(OutboundMail.status == "failed")
+        .values(status="queued", attempts=0, next_attempt_at=datetime.utcnow())
+    )
+    db.session.commit()
+    click.echo("Queued {} messages again.".format(result.rowcount))
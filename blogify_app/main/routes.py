@@ -6,7 +6,8 @@ Routes for the main section of the Flask web application.
   application, including rendering the home page with the latest
   blog posts and an about page.
 - The 'home' route retrieves the latest blog posts from the database,
-  paginates them, and renders the 'home.html' template.
+  paginates them (keyset or offset, see 'FEED_PAGINATION'), and renders
+  the 'home.html' template.
 - The 'about' route renders the 'about.html' template to provide
   information about the application or organization.
 
@@ -17,36 +18,68 @@ Note: The routes interact with the 'Post' model defined
 in 'blogify_app/models.py' to retrieve and display blog posts.
 """
 
-from flask import render_template, request, Blueprint
-from blogify_app.models import Post
+from flask import render_template, request, Blueprint, current_app
+from sqlalchemy.orm import defer
+from blogify_app import response_cache
+from blogify_app.models import Post, author_loader
+from blogify_app.pagination import paginate_keyset
+from blogify_app.conditional import page_validators, render_conditional
 
 main = Blueprint("main", __name__)
 
 
 @main.route("/home")
+@response_cache.cached(tags=["feed"])
 def home():
     """
     Render the home page with the latest blog posts.
 
     - This route retrieves the latest blog posts from the database
       and paginates them for display on the home page.
-    - The number of posts per page is set to 5 by default.
+    - In 'keyset' mode (the default) the page is selected by the opaque
+      'cursor' query argument; in 'offset' mode by the 'page' number.
+    - The number of posts per page is set by 'POSTS_PER_PAGE' (5 by default).
+    - Post authors are loaded in bulk using 'FEED_AUTHOR_LOADING', and
+      the full 'content' column is deferred in favour of 'excerpt'.
+    - Rendered pages are cached under the 'feed' tag.
+    - Requests whose 'If-None-Match' matches the page's ETag get a 304
+      without rendering.
 
     Returns:
-        str: Rendered HTML template displaying the latest blog posts.
+        Response: Rendered HTML template displaying the latest blog posts,
+          or an empty '304 Not Modified' response.
+
+    Raises:
+        404 Not Found: If the cursor is invalid.
     """
-    page = request.args.get("page", 1, type=int)
-    posts = Post.query.order_by(Post.date_posted.desc()).paginate(page=page, per_page=5)
-    return render_template("home.html", posts=posts)
+    per_page = current_app.config["POSTS_PER_PAGE"]
+    query = Post.query.options(
+        author_loader(current_app.config["FEED_AUTHOR_LOADING"]), defer(Post.content)
+    )
+    if current_app.config["FEED_PAGINATION"] == "keyset":
+        posts = paginate_keyset(
+            query, cursor=request.args.get("cursor"), per_page=per_page
+        )
+    else:
+        page = request.args.get("page", 1, type=int)
+        posts = query.order_by(Post.date_posted.desc()).paginate(
+            page=page, per_page=per_page
+        )
+    etag, last_modified = page_validators(posts)
+    return render_conditional(
+        "home.html", etag, last_modified=last_modified, posts=posts
+    )
 
 
 @main.route("/about")
+@response_cache.cached()
 def about():
     """
     Render the about page.
 
     This route renders the 'about.html' template to provide
     information about the application or organization.
+    The rendered page is served from the response cache when possible.
 
     Returns:
         str: Rendered HTML content for the about page.
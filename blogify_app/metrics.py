@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+"""
+Application metrics for the Blogify web application.
+
+- This module provides the 'Metrics' Flask extension, which records the
+  number of requests per endpoint, method and status code, and
+  histograms of the request latency and template render time per
+  endpoint (such as 'main.home' or 'users.login').
+- It also reports the database time and statement count per endpoint,
+  SQLAlchemy connection pool checkouts, overflow and checkout wait time,
+  cache hits and misses, and the counters of the password hasher and
+  the mail queue.
+- Each worker process keeps its metrics in memory and dumps them, at
+  most every 'METRICS_FLUSH_INTERVAL' seconds, to a JSON file of its own
+  in 'METRICS_DIR'. The 'METRICS_PATH' endpoint ('/metrics') and
+  'flask metrics dump' add up the files of every worker and print them
+  in the Prometheus text exposition format, so the numbers are right
+  whichever preforked worker answers the scrape.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: The 'metrics' extension instance is created and initialised in
+'blogify_app/__init__.py'. Metrics are off unless 'METRICS_ENABLED' is
+set. A worker that is killed loses up to 'METRICS_FLUSH_INTERVAL'
+seconds of metrics. Counters of workers that exited are kept, so totals
+never go backwards; run 'flask metrics reset' when deploying, before the
+workers start. Pool gauges are only reported for live workers.
+"""
+
+import os
+import json
+import atexit
+import time
+import tempfile
+import threading
+from bisect import bisect_left
+import click
+from flask import Response, current_app, g, has_app_context, request
+from flask.cli import AppGroup
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+from werkzeug.exceptions import Forbidden
+
+metrics_cli = AppGroup("metrics", help="Inspect and reset application metrics.")
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Type and help text of each metric, in exposition order.
+METRICS = {
+    "blogify_http_requests_total": (
+        "counter",
+        "Requests served, by endpoint, method and status code.",
+    ),
+    "blogify_http_request_duration_seconds": (
+        "histogram",
+        "Time to build a response, by endpoint.",
+    ),
+    "blogify_template_render_seconds": (
+        "histogram",
+        "Time spent rendering templates per request, by endpoint.",
+    ),
+    "blogify_db_statements_total": (
+        "counter",
+        "SQL statements issued, by endpoint.",
+    ),
+    "blogify_db_seconds_total": (
+        "counter",
+        "Time spent executing SQL statements, by endpoint.",
+    ),
+    "blogify_db_pool_checkouts_total": (
+        "counter",
+        "Connections checked out of the pool.",
+    ),
+    "blogify_db_pool_wait_seconds": (
+        "histogram",
+        "Time waited for a connection from the pool.",
+    ),
+    "blogify_db_pool_size": ("gauge", "Connections the pool keeps, by worker."),
+    "blogify_db_pool_checked_out": (
+        "gauge",
+        "Connections currently checked out, by worker.",
+    ),
+    "blogify_db_pool_overflow": (
+        "gauge",
+        "Connections open beyond the pool size, by worker.",
+    ),
+    "blogify_cache_lookups_total": (
+        "counter",
+        "Cache lookups, by cache, key prefix and result (hit or miss).",
+    ),
+    "blogify_password_hash_total": (
+        "counter",
+        "Password hasher operations, by outcome.",
+    ),
+    "blogify_password_hash_seconds_total": (
+        "counter",
+        "Password hasher time, queueing ('wait') and hashing ('hash').",
+    ),
+    "blogify_mail_messages_total": (
+        "counter",
+        "Queued mail, by outcome.",
+    ),
+}
+
+# Cache extensions whose backend lookups are reported.
+CACHES = ("response_cache", "fragment_cache", "user_cache")
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    """
+    The metrics of one worker process.
+
+    - Counters and histograms recorded by requests are added to; values
+      collected from other extensions at flush time are set, as those
+      extensions keep their own running totals.
+
+    Attributes:
+        pid (int): The process the metrics belong to.
+        flushed (float): The monotonic time of the last flush, 0 if none.
+        exit_flush (bool): Whether a flush is registered to run when the
+          process exits.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.flushed = 0.0
+        self.exit_flush = False
+        self._values = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, value=1):
+        """
+        Add to a counter.
+
+        Args:
+            name (str): The metric name.
+            labels (dict): The label values.
+            value (float, optional): The increment. Defaults to 1.
+        """
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, labels, value):
+        """
+        Set a gauge, or a counter kept by another component.
+
+        Args:
+            name (str): The metric name.
+            labels (dict): The label values.
+            value (float): The value.
+        """
+        with self._lock:
+            self._values[name, _labels_key(labels)] = value
+
+    def observe(self, name, labels, value):
+        """
+        Record a sample in a histogram.
+
+        Args:
+            name (str): The metric name.
+            labels (dict): The label values.
+            value (float): The sample, in seconds.
+        """
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+            histogram[0][bisect_left(BUCKETS, value)] += 1
+            histogram[1] += value
+
+    def snapshot(self):
+        """
+        Return the metrics as a JSON-serialisable dict.
+        """
+        with self._lock:
+            return {
+                "pid": self.pid,
+                "values": [
+                    [name, dict(labels), value]
+                    for (name, labels), value in self._values.items()
+                ],
+                "histograms": [
+                    [name, dict(labels), list(counts), total]
+                    for (name, labels), (counts, total) in self._histograms.items()
+                ],
+            }
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def aggregate(directory):
+    """
+    Add up the metrics files of every worker.
+
+    - Gauges are labelled with the worker pid and dropped for workers
+      that are no longer running; counters and histograms are summed.
+
+    Args:
+        directory (str): The 'METRICS_DIR' holding one file per worker.
+
+    Returns:
+        tuple: The summed values and histograms, keyed by metric name
+          and sorted label pairs.
+    """
+    values, histograms = {}, {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = _alive(snapshot["pid"])
+        for metric, labels, value in snapshot["values"]:
+            if METRICS[metric][0] == "gauge":
+                if not alive:
+                    continue
+                labels["pid"] = str(snapshot["pid"])
+            key = (metric, _labels_key(labels))
+            values[key] = values.get(key, 0) + value
+        for metric, labels, counts, total in snapshot["histograms"]:
+            key = (metric, _labels_key(labels))
+            summed = histograms.setdefault(key, [[0] * len(counts), 0.0])
+            summed[0] = [a + b for a, b in zip(summed[0], counts)]
+            summed[1] += total
+    return values, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(
+                name,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for name, value in pairs
+        )
+    )
+
+
+def _format_number(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def render(values, histograms):
+    """
+    Format aggregated metrics in the Prometheus text exposition format.
+
+    Args:
+        values (dict): The counters and gauges, from 'aggregate'.
+        histograms (dict): The histograms, from 'aggregate'.
+
+    Returns:
+        str: The exposition text.
+    """
+    lines = []
+    for metric, (kind, help_text) in METRICS.items():
+        if kind == "histogram":
+            series = sorted(item for item in histograms.items() if item[0][0] == metric)
+        else:
+            series = sorted(item for item in values.items() if item[0][0] == metric)
+        if not series:
+            continue
+        lines.append("# HELP {} {}".format(metric, help_text))
+        lines.append("# TYPE {} {}".format(metric, kind))
+        for (_, labels), value in series:
+            if kind != "histogram":
+                lines.append(
+                    "{}{} {}".format(
+                        metric, _format_labels(labels), _format_number(value)
+                    )
+                )
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    "{}_bucket{} {}".format(
+                        metric,
+                        _format_labels(labels, [("le", bound)]),
+                        cumulative,
+                    )
+                )
+            lines.append(
+                "{}_sum{} {}".format(
+                    metric, _format_labels(labels), _format_number(total)
+                )
+            )
+            lines.append(
+                "{}_count{} {}".format(metric, _format_labels(labels), cumulative)
+            )
+    return "\n".join(lines) + "\n"
+
+
+def _registry():
+    """
+    Return the registry of the current app and process, or None when
+    metrics are disabled.
+
+    - A registry inherited from the parent of a forked worker is
+      replaced, so each worker files its own metrics.
+    """
+    if not has_app_context():
+        return None
+    registry = current_app.extensions.get("metrics")
+    if registry is not None and registry.pid != os.getpid():
+        registry = current_app.extensions["metrics"] = Registry()
+    return registry
+
+
+def _record_checkout(dbapi_connection, connection_record, connection_proxy):
+    """
+    Pool listener counting connection checkouts.
+    """
+    registry = _registry()
+    if registry is not None:
+        registry.inc("blogify_db_pool_checkouts_total", {})
+
+
+def _time_pool(pool):
+    """
+    Make a pool record how long callers wait for a connection.
+
+    - SQLAlchemy has no event for the start of a checkout, so the pool's
+      'connect' method is wrapped. The wrapper is installed again when
+      'engine.dispose()' replaces the pool.
+    """
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        connection = connect()
+        registry = _registry()
+        if registry is not None:
+            registry.observe(
+                "blogify_db_pool_wait_seconds", {}, time.perf_counter() - started
+            )
+        return connection
+
+    pool.connect = timed_connect
+    pool._blogify_timed = True
+
+
+class Metrics:
+    """
+    Flask extension recording request, database and cache metrics.
+
+    Usage:
+        - metrics = Metrics()
+        - metrics.init_app(app)
+
+        # from a shell on the host
+        curl http://localhost:8000/metrics
+    """
+
+    _listening = False
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Register the metrics hooks and endpoint with an app, if enabled.
+
+        Args:
+            app (Flask): The Flask application instance.
+        """
+        app.config.setdefault("METRICS_ENABLED", False)
+        if not app.config.get("METRICS_DIR"):
+            app.config["METRICS_DIR"] = os.path.join(app.instance_path, "metrics")
+        app.config.setdefault("METRICS_PATH", "/metrics")
+        app.config.setdefault("METRICS_TOKEN", None)
+        app.config.setdefault("METRICS_FLUSH_INTERVAL", 1.0)
+        if not app.config["METRICS_ENABLED"]:
+            return
+        os.makedirs(app.config["METRICS_DIR"], exist_ok=True)
+        app.extensions["metrics"] = Registry()
+        if not Metrics._listening:
+            event.listen(Pool, "checkout", _record_checkout)
+            Metrics._listening = True
+        app.after_request(self._record)
+        app.add_url_rule(
+            app.config["METRICS_PATH"], "metrics", self._endpoint, methods=["GET"]
+        )
+
+    @property
+    def registry(self):
+        """
+        Registry: The metrics of the current worker process.
+        """
+        return _registry()
+
+    def _record(self, response):
+        """
+        Record the metrics of a finished request.
+
+        Args:
+            response (Response): The outgoing response.
+
+        Returns:
+            Response: The unchanged response.
+        """
+        from blogify_app import db, query_counter
+
+        registry = self.registry
+        if not registry.exit_flush:
+            # The first request of this worker, which the endpoint may
+            # already have flushed
+            atexit.register(self._flush_at_exit, current_app._get_current_object())
+            registry.exit_flush = True
+        if not getattr(db.engine.pool, "_blogify_timed", False):
+            _time_pool(db.engine.pool)
+        endpoint = request.endpoint or "unmatched"
+        registry.inc(
+            "blogify_http_requests_total",
+            {
+                "endpoint": endpoint,
+                "method": request.method,
+                "status": str(response.status_code),
+            },
+        )
+        started = g.get("_request_started")
+        if started is not None:
+            registry.observe(
+                "blogify_http_request_duration_seconds",
+                {"endpoint": endpoint},
+                time.perf_counter() - started,
+            )
+        if query_counter.render_duration:
+            registry.observe(
+                "blogify_template_render_seconds",
+                {"endpoint": endpoint},
+                query_counter.render_duration,
+            )
+        if query_counter.count:
+            registry.inc(
+                "blogify_db_statements_total",
+                {"endpoint": endpoint},
+                query_counter.count,
+            )
+            registry.inc(
+                "blogify_db_seconds_total",
+                {"endpoint": endpoint},
+                query_counter.duration,
+            )
+        if (
+            time.monotonic() - registry.flushed
+            >= current_app.config["METRICS_FLUSH_INTERVAL"]
+        ):
+            self.flush()
+        return response
+
+    def _collect(self, registry):
+        """
+        Copy the running totals of the pool and other extensions into a
+        registry.
+        """
+        from blogify_app import db
+
+        pool = db.engine.pool
+        # Only queue pools have a size; SQLite memory databases do not
+        if hasattr(pool, "overflow"):
+            registry.set("blogify_db_pool_size", {}, pool.size())
+            registry.set("blogify_db_pool_checked_out", {}, pool.checkedout())
+            # Negative while fewer than 'size' connections are open
+            registry.set("blogify_db_pool_overflow", {}, max(0, pool.overflow()))
+        for cache in CACHES:
+            backend = current_app.extensions.get(cache)
+            if backend is None:
+                continue
+            for (prefix, result), count in backend.stats().items():
+                registry.set(
+                    "blogify_cache_lookups_total",
+                    {"cache": cache, "prefix": prefix, "result": result},
+                    count,
+                )
+        hasher = current_app.extensions.get("password_hasher")
+        if hasher is not None:
+            stats = hasher.stats()
+            for outcome in ("completed", "rejected", "timeouts", "rehashed"):
+                registry.set(
+                    "blogify_password_hash_total", {"outcome": outcome}, stats[outcome]
+                )
+            for phase in ("wait", "hash"):
+                registry.set(
+                    "blogify_password_hash_seconds_total",
+                    {"phase": phase},
+                    stats[phase + "_seconds"],
+                )
+        queue = current_app.extensions.get("mail_queue")
+        if queue is not None:
+            for outcome, count in queue.stats().items():
+                registry.set("blogify_mail_messages_total", {"outcome": outcome}, count)
+
+    def flush(self):
+        """
+        Write the metrics of this worker to its file in 'METRICS_DIR'.
+
+        - The file is written to a temporary name and renamed into
+          place, so readers never see a partial file.
+        """
+        registry = self.registry
+        self._collect(registry)
+        directory = current_app.config["METRICS_DIR"]
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(registry.snapshot(), f)
+            os.replace(
+                tmp_path, os.path.join(directory, "{}.json".format(registry.pid))
+            )
+        except OSError:
+            current_app.logger.exception("Could not write the metrics file")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        registry.flushed = time.monotonic()
+
+    def _flush_at_exit(self, app):
+        """
+        Write the last metrics of a worker that exits normally.
+        """
+        with app.app_context():
+            self.flush()
+
+    def _endpoint(self):
+        """
+        Serve the metrics of every worker.
+
+        Raises:
+            Forbidden: If 'METRICS_TOKEN' is set and the request does
+              not carry it as a bearer token.
+        """
+        token = current_app.config["METRICS_TOKEN"]
+        if token and request.headers.get("Authorization") != "Bearer " + token:
+            raise Forbidden()
+        self.flush()
+        text = render(*aggregate(current_app.config["METRICS_DIR"]))
+        response = Response(text, mimetype="text/plain")
+        response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+
+@metrics_cli.command("dump")
+def dump():
+    """
+    Print the metrics of every worker.
+    \f
+    - This reads the files the workers wrote, so it works with the
+      endpoint disabled or unreachable.
+    """
+    directory = current_app.config["METRICS_DIR"]
+    if not os.path.isdir(directory):
+        click.echo("No metrics in {}.".format(directory))
+        return
+    click.echo(render(*aggregate(directory)), nl=False)
+
+
+@metrics_cli.command("reset")
+def reset():
+    """
+    Delete the metrics files of every worker.
+    \f
+    - Run it before the workers start, as running workers rewrite their
+      files with their own totals.
+    """
+    directory = current_app.config["METRICS_DIR"]
+    removed = 0
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith((".json", ".tmp")):
+                os.remove(os.path.join(directory, name))
+                removed += 1
+    click.echo("Removed {} metrics files.".format(removed))
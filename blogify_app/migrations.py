@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Schema migrations and query plan checks for the Blogify web application.
+
+- This module evolves the database schema in place with numbered
+  migration steps, and records the steps applied in a 'schema_version'
+  table, so a database created by any earlier version of Blogify can be
+  brought up to date without dropping its data.
+- Steps only create what is missing (tables, columns, indexes), so they
+  also apply cleanly to databases built by 'db.create_all()'.
+- 'flask db explain' runs the feed, timeline and account lookup queries
+  through the database's EXPLAIN and fails if any of them scans a table
+  or sorts rows instead of reading an index.
+
+For detailed information about each function and command, refer to the
+individual docstrings.
+
+Note: The 'flask db' command group is registered in
+'blogify_app/__init__.py'. Run 'flask db upgrade' after every deploy
+that adds a step, before starting the workers. New steps are appended
+to the end of 'MIGRATIONS' with the next version number; never edit a
+step that was released.
+"""
+
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import defer
+from sqlalchemy.schema import CreateColumn
+from blogify_app import db
+from blogify_app.models import OutboundMail, Post, User, author_loader
+from blogify_app.pagination import encode_cursor, paginate_keyset
+from blogify_app.search.engine import INDEX_SCHEMA, INDEX_TABLE
+
+db_cli = AppGroup("db", help="Migrate the schema and check query plans.")
+
+# The migration steps applied so far.
+schema_version = db.Table(
+    "schema_version",
+    db.Column("version", db.Integer, primary_key=True),
+    db.Column("description", db.String(200), nullable=False),
+    db.Column("applied_at", db.DateTime, nullable=False),
+)
+
+# (version, description, function) of every step, in order.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """
+    Register a function as a migration step.
+
+    Args:
+        version (int): The step number, one more than the previous one.
+        description (str): What the step changes.
+
+    Returns:
+        callable: The decorator. The function receives a connection
+          inside the step's transaction.
+    """
+
+    def decorator(step):
+        if MIGRATIONS and version != MIGRATIONS[-1][0] + 1:
+            raise ValueError("Migration {} is out of sequence".format(version))
+        MIGRATIONS.append((version, description, step))
+        return step
+
+    return decorator
+
+
+def _add_column(conn, column):
+    """
+    Add a model column to its table if the table lacks it.
+
+    - Only nullable columns (or ones with a server default) can be added
+      to a table that holds rows.
+    """
+    existing = {c["name"] for c in inspect(conn).get_columns(column.table.name)}
+    if column.name in existing:
+        return
+    conn.exec_driver_sql(
+        "ALTER TABLE {} ADD COLUMN {}".format(
+            conn.dialect.identifier_preparer.format_table(column.table),
+            CreateColumn(column).compile(dialect=conn.dialect),
+        )
+    )
+
+
+def _create_index(conn, table, name):
+    """
+    Create a model index by name if it does not exist.
+    """
+    index = next(index for index in table.indexes if index.name == name)
+    index.create(conn, checkfirst=True)
+
+
+@migration(1, "Create the user and post tables")
+def create_base_tables(conn):
+    User.__table__.create(conn, checkfirst=True)
+    Post.__table__.create(conn, checkfirst=True)
+
+
+@migration(2, "Add post.date_updated")
+def add_post_date_updated(conn):
+    _add_column(conn, Post.__table__.c.date_updated)
+
+
+@migration(3, "Add post.excerpt and post.reading_time")
+def add_post_excerpt(conn):
+    # Existing posts get theirs from 'flask posts backfill-excerpts'
+    _add_column(conn, Post.__table__.c.excerpt)
+    _add_column(conn, Post.__table__.c.reading_time)
+
+
+@migration(4, "Create the outbound_mail table")
+def create_outbound_mail(conn):
+    OutboundMail.__table__.create(conn, checkfirst=True)
+
+
+@migration(5, "Index posts on (date_posted, id) and (user_id, date_posted, id)")
+def add_feed_indexes(conn):
+    _create_index(conn, Post.__table__, "ix_post_date_posted_id")
+    _create_index(conn, Post.__table__, "ix_post_user_id_date_posted_id")
+
+
+@migration(6, "Create the post_search full-text index")
+def create_search_index(conn):
+    # FTS5 is SQLite only; earlier versions created the table on first use
+    if conn.dialect.name != "sqlite" or inspect(conn).has_table(INDEX_TABLE):
+        return
+    conn.exec_driver_sql(INDEX_SCHEMA)
+    conn.exec_driver_sql(
+        "INSERT INTO {}(rowid, title, content) "
+        "SELECT id, title, content FROM post".format(INDEX_TABLE)
+    )
+
+
+def current_version(conn):
+    """
+    Return the last migration step applied to a database.
+
+    Args:
+        conn (Connection): A connection to the database.
+
+    Returns:
+        int: The version, 0 for a database never migrated.
+    """
+    schema_version.create(conn, checkfirst=True)
+    version = conn.execute(select(db.func.max(schema_version.c.version))).scalar()
+    return version or 0
+
+
+def upgrade(engine, target=None, echo=print):
+    """
+    Apply the pending migration steps to a database.
+
+    - Each step runs in its own transaction together with its
+      'schema_version' row, so an interrupted upgrade resumes at the
+      step that failed. (MySQL commits DDL implicitly, which is safe
+      here because the steps skip what already exists.)
+
+    Args:
+        engine (Engine): The engine of the database.
+        target (int, optional): The version to stop at. Defaults to
+          None, the latest.
+        echo (callable, optional): Receives a line per step applied.
+          Defaults to print.
+
+    Returns:
+        list: The versions applied.
+
+    Raises:
+        ValueError: If the database is newer than 'target'.
+    """
+    with engine.begin() as conn:
+        version = current_version(conn)
+    target = MIGRATIONS[-1][0] if target is None else target
+    if version > target:
+        raise ValueError(
+            "The database is at version {}, ahead of {}; downgrades are not "
+            "supported".format(version, target)
+        )
+    applied = []
+    for step_version, description, step in MIGRATIONS:
+        if step_version <= version or step_version > target:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                schema_version.insert().values(
+                    version=step_version,
+                    description=description,
+                    applied_at=datetime.utcnow(),
+                )
+            )
+        applied.append(step_version)
+        echo("Applied {}: {}".format(step_version, description))
+    return applied
+
+
+def _plan_problems(conn, statement, parameters):
+    """
+    Explain a statement and list the table scans and sorts in its plan.
+
+    - On PostgreSQL, sequential scans and sorts are disabled for the
+      explained statement, so a plan that still contains one cannot be
+      served by an index; tiny tables are otherwise always scanned.
+
+    Returns:
+        tuple: The plan lines and the problems found in them.
+
+    Raises:
+        click.ClickException: If the database is not SQLite, PostgreSQL
+          or MySQL.
+    """
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        lines = [row[-1] for row in rows]
+        problems = [
+            line
+            for line in lines
+            if (line.startswith("SCAN ") and " USING " not in line)
+            or "TEMP B-TREE" in line
+        ]
+    elif dialect == "postgresql":
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        conn.exec_driver_sql("SET LOCAL enable_sort = off")
+        rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+        lines = [row[0] for row in rows]
+        problems = [line for line in lines if "Seq Scan" in line or "Sort  (" in line]
+    elif dialect in ("mysql", "mariadb"):
+        rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).mappings()
+        lines = [
+            "{} type={} key={} {}".format(
+                row["table"], row["type"], row["key"], row["Extra"] or ""
+            )
+            for row in rows
+        ]
+        problems = [
+            line for line in lines if " type=ALL " in line or "filesort" in line
+        ]
+    else:
+        raise click.ClickException("Cannot explain queries on {}".format(dialect))
+    return lines, problems
+
+
+def _capture(run):
+    """
+    Run a function and return the SQL statements it issued.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    return statements
+
+
+def checked_queries():
+    """
+    Build the queries whose plans 'flask db explain' checks.
+
+    - The feed and timeline queries are built like the routes build
+      them, with the configured author loading, and go through
+      'paginate_keyset', so the statements explained are the ones the
+      routes issue.
+
+    Returns:
+        dict: Maps query names to functions running the query.
+    """
+    per_page = current_app.config["POSTS_PER_PAGE"]
+    # A cursor into the middle of the feed; plans do not depend on it
+    boundary = Post(id=1, date_posted=datetime.utcnow() - timedelta(days=30))
+    feed = Post.query.options(
+        author_loader(current_app.config["FEED_AUTHOR_LOADING"]), defer(Post.content)
+    )
+    timeline = Post.query.filter_by(author=User(id=1)).options(
+        author_loader(current_app.config["TIMELINE_AUTHOR_LOADING"]),
+        defer(Post.content),
+    )
+    return {
+        "feed, first page": lambda: paginate_keyset(feed, per_page=per_page),
+        "feed, next page": lambda: paginate_keyset(
+            feed, encode_cursor(boundary, "next"), per_page
+        ),
+        "feed, previous page": lambda: paginate_keyset(
+            feed, encode_cursor(boundary, "prev"), per_page
+        ),
+        "timeline, first page": lambda: paginate_keyset(timeline, per_page=per_page),
+        "timeline, next page": lambda: paginate_keyset(
+            timeline, encode_cursor(boundary, "next"), per_page
+        ),
+        "user by email": lambda: User.query.filter_by(email="a@example.com").first(),
+        "user by username": lambda: User.query.filter_by(username="a").first(),
+    }
+
+
+@db_cli.command("upgrade")
+@click.option("--to", "target", type=int, help="Stop at this version.")
+def upgrade_command(target):
+    """
+    Bring the database schema up to date.
+    \f
+    Args:
+        target (int): The version to stop at, or None for the latest.
+    """
+    try:
+        applied = upgrade(db.engine, target, echo=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if not applied:
+        click.echo("The database is up to date.")
+
+
+@db_cli.command("status")
+def status():
+    """
+    Show the schema version and the pending migration steps.
+    """
+    with db.engine.begin() as conn:
+        version = current_version(conn)
+    click.echo("Schema version: {}".format(version))
+    pending = [m for m in MIGRATIONS if m[0] > version]
+    for step_version, description, _ in pending:
+        click.echo("Pending {}: {}".format(step_version, description))
+    if not pending:
+        click.echo("No pending migrations.")
+
+
+@db_cli.command("explain")
+@click.option("--verbose", is_flag=True, help="Print every plan line.")
+def explain(verbose):
+    """
+    Check that the feed and lookup queries are served by indexes.
+    \f
+    - Exits with status 1 if a query scans a table or sorts its rows,
+      so the check can run in CI against a migrated database.
+
+    Args:
+        verbose (bool): Whether the full plans are printed.
+    """
+    failed = 0
+    with current_app.test_request_context():
+        for name, run in checked_queries().items():
+            problems = []
+            for statement, parameters in _capture(run):
+                with db.engine.begin() as conn:
+                    lines, found = _plan_problems(conn, statement, parameters)
+                problems.extend(found)
+                if verbose:
+                    for line in lines:
+                        click.echo("    " + line)
+            if problems:
+                failed += 1
+                click.echo("FAIL {}: {}".format(name, "; ".join(problems)))
+            else:
+                click.echo("ok   {}".format(name))
+    if failed:
+        raise SystemExit(1)
@@ -9,17 +9,26 @@ This module includes the definition of two main classes:
 - Post: Represents a blog post with attributes like title, content,
   and the date it was posted.
 
+'OutboundMail' holds the messages of the outbound mail queue.
+
+It also provides 'author_loader', which selects how a post query loads
+the authors of its rows.
+
 These models are used in conjunction with Flask-SQLAlchemy to create
 and interact with the underlying database tables.
 """
 
 import json
+import hashlib
 from dotenv import load_dotenv
 from datetime import datetime
 from itsdangerous import TimestampSigner, BadSignature, SignatureExpired
 from flask import current_app, abort
-from blogify_app import db, login_manager
+from blogify_app import db, login_manager, user_cache
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload, selectinload, subqueryload, lazyload, raiseload
+from blogify_app.posts.utils import summarize_post
 
 load_dotenv()
 
@@ -44,8 +53,10 @@ def load_user(user_id):
           extension.
         - It is invoked automatically by Flask-Login when attempting
           to load a user during a user session.
+        - Users are served from 'user_cache', so an authenticated
+          request usually costs no query on the 'user' table.
     """
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 
 class User(db.Model, UserMixin):
@@ -92,6 +103,18 @@ class User(db.Model, UserMixin):
     password = db.Column(db.String(120), nullable=False)
     posts = db.relationship("Post", backref="author", lazy=True)
 
+    @property
+    def profile_version(self):
+        """
+        str: A short digest of the profile details shown next to the
+        user's posts (names and avatar). It changes whenever one of
+        them does, which versions cached post cards.
+        """
+        details = "|".join(
+            (self.username, self.firstname, self.lastname, self.image_file)
+        )
+        return hashlib.sha1(details.encode("utf-8")).hexdigest()[:10]
+
     def get_reset_token(self):
         """
         Generate a time-sensitive reset token for the user.
@@ -166,7 +189,12 @@ class Post(db.Model):
         id (int): The unique identifier for the post.
         title (str): The title of the post.
         date_posted (datetime): The date and time when the post was created.
+        date_updated (datetime): The date and time when the post was last
+          modified, or None if it never was.
         content (str): The content of the post.
+        excerpt (str): A short plain-text excerpt of the content, shown
+          on list pages.
+        reading_time (int): The estimated reading time in minutes.
         user_id (int): The ID of the user who authored the post.
 
     Note:
@@ -175,10 +203,22 @@ class Post(db.Model):
           120 characters.
         - 'date_posted' is the date and time when the post was created,
           with a default value set to the current UTC time.
+        - 'date_updated' is set to the current UTC time on every update.
+          It is nullable so existing rows need no backfill; use the
+          'last_modified' property to read the effective stamp.
         - 'content' contains the textual content of the blog post.
+        - 'excerpt' and 'reading_time' are computed from 'content'
+          whenever a post is inserted or its content changes through the
+          ORM (see '_summarize_post' below), so list pages can defer
+          loading 'content' altogether. Bulk INSERT and UPDATE statements
+          bypass this and must supply both values.
         - 'user_id' is a foreign key referencing the 'id' column
           of the 'users' table, indicating the user who authored
           the post.
+        - The composite indexes match the feed and timeline order,
+          ('date_posted', 'id') descending, globally and per author,
+          so both are read straight from an index without sorting.
+          Check the query plans with 'flask db explain'.
 
     Usage:
         - This class is used in conjunction with Flask-SQLAlchemy
@@ -188,12 +228,28 @@ class Post(db.Model):
 
     """
 
+    __table_args__ = (
+        db.Index("ix_post_date_posted_id", "date_posted", "id"),
+        db.Index("ix_post_user_id_date_posted_id", "user_id", "date_posted", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(120), nullable=False)
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_updated = db.Column(db.DateTime, nullable=True, onupdate=datetime.utcnow)
     content = db.Column(db.Text, nullable=False)
+    excerpt = db.Column(db.String(300), nullable=True)
+    reading_time = db.Column(db.Integer, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
 
+    @property
+    def last_modified(self):
+        """
+        datetime: When the post last changed, falling back to
+        'date_posted' for posts that were never updated.
+        """
+        return self.date_updated or self.date_posted
+
     def __repr__(self):
         """
         Returns a string representation of the Post object.
@@ -209,3 +265,106 @@ class Post(db.Model):
             of the Post.
         """
         return 'Post("{}", "{}")'.format(self.title, self.date_posted)
+
+
+@event.listens_for(Post, "before_insert")
+@event.listens_for(Post, "before_update")
+def _summarize_post(mapper, connection, post):
+    """
+    Keep a post's excerpt and reading time in step with its content,
+    however the post is written (routes, seeding scripts, shell).
+    """
+    if post.excerpt is None or inspect(post).attrs.content.history.has_changes():
+        summarize_post(post)
+
+
+class OutboundMail(db.Model):
+    """
+    Class representing an email waiting in, or delivered from, the
+    outbound mail queue.
+
+    Attributes:
+        id (int): The unique identifier for the message.
+        subject (str): The subject line.
+        sender (str): The 'From' address.
+        recipients (str): The recipient addresses, comma-separated.
+        body (str): The plain text body.
+        html (str): The HTML body, or None.
+        status (str): 'queued', 'sending', 'sent' or 'failed'.
+        attempts (int): The number of delivery attempts made.
+        next_attempt_at (datetime): When the message is next due. For a
+          message being sent, when its claim expires.
+        last_error (str): The error of the last failed attempt, or None.
+        date_created (datetime): When the message was queued.
+        date_sent (datetime): When the message was delivered, or None.
+
+    Note:
+        - Messages are queued by 'mail_queue.enqueue' and delivered by
+          the sender in 'blogify_app/mailqueue.py'.
+        - A message left 'sending' by a crashed sender becomes due again
+          once 'next_attempt_at' has passed.
+    """
+
+    __table_args__ = (db.Index("ix_outbound_mail_due", "status", "next_attempt_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text, nullable=True)
+    html = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(10), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_sent = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        """
+        Returns a string representation of the OutboundMail object.
+
+        Returns:
+            str: A formatted string with the subject, recipients and
+              status of the message.
+        """
+        return 'OutboundMail("{}", "{}", "{}")'.format(
+            self.subject, self.recipients, self.status
+        )
+
+
+# Loader options for 'Post.author', by strategy name.
+AUTHOR_LOADERS = {
+    "joined": joinedload,
+    "selectin": selectinload,
+    "subquery": subqueryload,
+    "lazy": lazyload,
+    "raise": raiseload,
+}
+
+
+def author_loader(strategy):
+    """
+    Build the loader option used to fetch the authors of posts.
+
+    - 'joined' (the default for feeds) loads authors in the same
+      SELECT through a LEFT OUTER JOIN.
+    - 'selectin' and 'subquery' load all authors of the page in one
+      extra SELECT.
+    - 'lazy' keeps the per-post SELECT (the N+1 behaviour), and
+      'raise' turns any lazy author access into an error, which is
+      useful to prove a template never touches 'post.author'.
+
+    Args:
+        strategy (str): One of the keys of 'AUTHOR_LOADERS'.
+
+    Returns:
+        Load: A loader option to pass to 'Query.options'.
+
+    Raises:
+        ValueError: If the strategy name is unknown.
+    """
+    try:
+        return AUTHOR_LOADERS[strategy](Post.author)
+    except KeyError:
+        raise ValueError("Unknown author loading strategy: {}".format(strategy))
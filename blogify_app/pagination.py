@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Keyset (cursor) pagination for post listings in the Blogify web application.
+
+- This module provides cursor-based pagination for queries that are
+  ordered newest first on ('date_posted', 'id').
+- Unlike 'Query.paginate', which issues an OFFSET scan plus a COUNT(*)
+  for every page, a keyset page seeks straight to its position using
+  the last row of the previous page. The cost of page N therefore does
+  not depend on N, and no total count is ever computed.
+- Cursors are opaque, signed tokens, so clients cannot forge positions
+  or learn anything about the underlying keys.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: These helpers are used by the 'main.home' and 'users.user_posts'
+routes and rendered by the 'home.html' and 'user_posts.html' templates.
+"""
+
+from datetime import datetime
+from itsdangerous import URLSafeSerializer, BadSignature
+from flask import current_app, abort
+from sqlalchemy import and_, or_
+from blogify_app.models import Post
+
+
+class KeysetPage:
+    """
+    A single page of posts produced by keyset pagination.
+
+    Attributes:
+        items (list): The posts on this page, newest first.
+        per_page (int): The maximum number of posts on a page.
+        has_next (bool): Whether older posts exist after this page.
+        has_prev (bool): Whether newer posts exist before this page.
+        next_cursor (str): Opaque token for the following page,
+          or None when this is the last page.
+        prev_cursor (str): Opaque token for the preceding page,
+          or None when this is the first page.
+
+    Note:
+        - The attribute names mirror those of Flask-SQLAlchemy's
+          'Pagination' object where the two overlap, so templates can
+          iterate 'posts.items' either way.
+    """
+
+    def __init__(self, items, per_page, has_next, has_prev):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = (
+            encode_cursor(items[-1], "next") if has_next and items else None
+        )
+        self.prev_cursor = (
+            encode_cursor(items[0], "prev") if has_prev and items else None
+        )
+
+
+def _serializer():
+    """
+    Build the serializer used to sign and verify cursor tokens.
+
+    Returns:
+        URLSafeSerializer: A serializer bound to the application's
+          secret key with a salt dedicated to feed cursors.
+    """
+    return URLSafeSerializer(current_app.config["SECRET_KEY"], salt="feed-cursor")
+
+
+def encode_cursor(post, direction):
+    """
+    Encode the keyset position of a post into an opaque cursor.
+
+    Args:
+        post (Post): The boundary post of the current page.
+        direction (str): Either 'next' (older posts) or 'prev'
+          (newer posts).
+
+    Returns:
+        str: A URL-safe, signed cursor token.
+    """
+    return _serializer().dumps([post.date_posted.isoformat(), post.id, direction])
+
+
+def decode_cursor(token):
+    """
+    Decode an opaque cursor back into its keyset position.
+
+    Args:
+        token (str): The cursor token received from the client.
+
+    Returns:
+        tuple: A (date_posted, post_id, direction) triple.
+
+    Raises:
+        404 Not Found: If the token was tampered with or is malformed.
+    """
+    try:
+        date_posted, post_id, direction = _serializer().loads(token)
+        return datetime.fromisoformat(date_posted), int(post_id), direction
+    except (BadSignature, ValueError, TypeError):
+        abort(404)
+
+
+def paginate_keyset(query, cursor=None, per_page=5):
+    """
+    Fetch one page of posts using keyset pagination.
+
+    - The query is ordered on ('date_posted', 'id') descending, and
+      the cursor is turned into a row-value comparison on the same
+      keys, so the database can seek directly to the page.
+    - The comparison is led by a plain range on 'date_posted', which
+      databases use as an index bound; the 'OR' alone makes SQLite
+      scan the index from the start.
+    - One extra row is fetched to find out whether another page
+      exists in the direction of travel, avoiding a COUNT(*).
+
+    Args:
+        query (Query): A 'Post' query, optionally already filtered
+          (for example by author). It must not be ordered yet.
+        cursor (str, optional): An opaque cursor from a previous page.
+          Defaults to None, which yields the newest posts.
+        per_page (int, optional): The number of posts per page.
+          Defaults to 5.
+
+    Returns:
+        KeysetPage: The requested page of posts.
+
+    Raises:
+        404 Not Found: If the cursor is invalid.
+    """
+    if cursor is None:
+        rows = (
+            query.order_by(Post.date_posted.desc(), Post.id.desc())
+            .limit(per_page + 1)
+            .all()
+        )
+        return KeysetPage(rows[:per_page], per_page, len(rows) > per_page, False)
+
+    date_posted, post_id, direction = decode_cursor(cursor)
+    if direction == "prev":
+        rows = (
+            query.filter(
+                Post.date_posted >= date_posted,
+                or_(
+                    Post.date_posted > date_posted,
+                    and_(Post.date_posted == date_posted, Post.id > post_id),
+                ),
+            )
+            .order_by(Post.date_posted.asc(), Post.id.asc())
+            .limit(per_page + 1)
+            .all()
+        )
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items, per_page, True, len(rows) > per_page)
+
+    rows = (
+        query.filter(
+            Post.date_posted <= date_posted,
+            or_(
+                Post.date_posted < date_posted,
+                and_(Post.date_posted == date_posted, Post.id < post_id),
+            ),
+        )
+        .order_by(Post.date_posted.desc(), Post.id.desc())
+        .limit(per_page + 1)
+        .all()
+    )
+    return KeysetPage(rows[:per_page], per_page, len(rows) > per_page, True)
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Bounded password hashing for the Blogify web application.
+
+- This module provides the 'PasswordHasher' Flask extension, through
+  which the login, registration and password reset routes hash and
+  verify passwords.
+- bcrypt work runs on a small dedicated thread pool
+  ('PASSWORD_HASH_WORKERS' threads per process). The bcrypt library
+  releases the GIL while hashing, so request threads serving other
+  routes keep running while a login storm is absorbed, and at most that
+  many cores per process are spent on password hashing.
+- At most 'PASSWORD_HASH_QUEUE' operations may be running or waiting.
+  Beyond that, or when an operation does not finish within
+  'PASSWORD_HASH_TIMEOUT' seconds, the request fails fast with
+  '503 Service Unavailable' and a 'Retry-After' header instead of
+  queueing without bound.
+- Queue wait and hash times are recorded and exposed by 'stats()'.
+- The bcrypt cost is 'BCRYPT_LOG_ROUNDS'. 'flask passwords calibrate'
+  measures this host and suggests the highest cost that verifies within
+  a target latency. Stored hashes made at another cost are replaced on
+  the user's next successful login, so changing the setting migrates
+  every active account without a reset.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: The 'password_hasher' extension instance is created and
+initialised in 'blogify_app/__init__.py'. Set 'PASSWORD_HASH_WORKERS'
+to 0 to hash inline, for instance in tests or scripts.
+"""
+
+import re
+import time
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import bcrypt as _bcrypt
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.exceptions import ServiceUnavailable
+
+passwords_cli = AppGroup("passwords", help="Tune password hashing.")
+
+# The cost field of a bcrypt hash, as in '$2b$12$<salt and digest>'.
+_COST = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+def hash_cost(pw_hash):
+    """
+    Return the cost a bcrypt hash was made with.
+
+    Args:
+        pw_hash (str): The stored hash.
+
+    Returns:
+        int: The log2 of the number of rounds, or None if 'pw_hash' is
+          not a bcrypt hash.
+    """
+    match = _COST.match(pw_hash or "")
+    return int(match.group(1)) if match else None
+
+
+def calibrate(target_ms, min_cost=10, max_cost=16, samples=3, echo=print):
+    """
+    Find the highest bcrypt cost that verifies within a target latency.
+
+    - Each cost is timed on a check of a hash made at that cost, which
+      is what a login pays. The median of 'samples' checks is used.
+    - Each step doubles the work, so timing stops at the first cost
+      over the target.
+
+    Args:
+        target_ms (float): The verify latency aimed for, in milliseconds.
+        min_cost (int, optional): The lowest cost considered, returned
+          even if it misses the target. Defaults to 10.
+        max_cost (int, optional): The highest cost considered.
+          Defaults to 16.
+        samples (int, optional): The checks timed per cost. Defaults to 3.
+        echo (callable, optional): Called with a line for each cost
+          timed. Defaults to print.
+
+    Returns:
+        tuple: The chosen cost and a dict mapping each timed cost to its
+          median verify time in milliseconds.
+    """
+    password = b"calibration password"
+    timings = {}
+    chosen = min_cost
+    for cost in range(min_cost, max_cost + 1):
+        pw_hash = _bcrypt.hashpw(password, _bcrypt.gensalt(cost))
+        durations = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            _bcrypt.checkpw(password, pw_hash)
+            durations.append((time.perf_counter() - started) * 1000)
+        timings[cost] = statistics.median(durations)
+        echo("cost {:>2}: {:8.1f} ms".format(cost, timings[cost]))
+        if timings[cost] > target_ms:
+            break
+        chosen = cost
+    return chosen, timings
+
+
+class PasswordHasherBusy(ServiceUnavailable):
+    """
+    Raised when password work is refused or times out under load.
+    """
+
+    description = "Too many sign-in attempts right now, please try again shortly."
+
+
+class PasswordHasher:
+    """
+    Flask extension running bcrypt on a bounded executor.
+
+    Usage:
+        - password_hasher = PasswordHasher()
+        - password_hasher.init_app(app)
+        - hashed = password_hasher.generate(form.password.data)
+        - password_hasher.check(user.password, form.password.data)
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "completed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "rehashed": 0,
+            "wait_seconds": 0.0,
+            "wait_seconds_max": 0.0,
+            "hash_seconds": 0.0,
+            "hash_seconds_max": 0.0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Configure the password hashing pool of an app.
+
+        Args:
+            app (Flask): The Flask application instance.
+        """
+        app.config.setdefault("PASSWORD_HASH_WORKERS", 2)
+        app.config.setdefault("PASSWORD_HASH_QUEUE", 32)
+        app.config.setdefault("PASSWORD_HASH_TIMEOUT", 5.0)
+        app.config.setdefault("PASSWORD_HASH_RETRY_AFTER", 2)
+        app.config.setdefault("BCRYPT_LOG_ROUNDS", 12)
+        app.extensions["password_hasher"] = self
+
+    def _get_executor(self, app):
+        """
+        Create the pool on first use, after gunicorn has forked.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=app.config["PASSWORD_HASH_WORKERS"],
+                    thread_name_prefix="bcrypt",
+                )
+                self._slots = threading.BoundedSemaphore(
+                    app.config["PASSWORD_HASH_QUEUE"]
+                )
+            return self._executor
+
+    def _record(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                if key.endswith("_seconds"):
+                    self._stats[key] += value
+                    self._stats[key + "_max"] = max(self._stats[key + "_max"], value)
+                else:
+                    self._stats[key] += value
+
+    def _timed(self, submitted, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            finished = time.perf_counter()
+            self._record(
+                completed=1,
+                wait_seconds=started - submitted,
+                hash_seconds=finished - started,
+            )
+
+    def _run(self, func, *args):
+        """
+        Run 'func' on the pool and wait for its result.
+
+        Raises:
+            PasswordHasherBusy: If the queue is full or the operation
+              times out.
+        """
+        from blogify_app import bcrypt
+
+        app = current_app._get_current_object()
+        if app.config["PASSWORD_HASH_WORKERS"] <= 0:
+            return self._timed(time.perf_counter(), getattr(bcrypt, func), *args)
+
+        executor = self._get_executor(app)
+        retry_after = app.config["PASSWORD_HASH_RETRY_AFTER"]
+        if not self._slots.acquire(blocking=False):
+            self._record(rejected=1)
+            app.logger.warning("Password hashing queue full, refusing request")
+            raise PasswordHasherBusy(retry_after=retry_after)
+        future = executor.submit(
+            self._timed, time.perf_counter(), getattr(bcrypt, func), *args
+        )
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=app.config["PASSWORD_HASH_TIMEOUT"])
+        except TimeoutError:
+            future.cancel()
+            self._record(timeouts=1)
+            app.logger.warning("Password hashing timed out")
+            raise PasswordHasherBusy(retry_after=retry_after)
+
+    def generate(self, password):
+        """
+        Hash a new password.
+
+        Args:
+            password (str): The plain text password.
+
+        Returns:
+            str: The bcrypt hash, ready to store in 'User.password'.
+
+        Raises:
+            PasswordHasherBusy: If the hashing pool is saturated.
+        """
+        return self._run("generate_password_hash", password).decode("utf-8")
+
+    def check(self, pw_hash, password):
+        """
+        Verify a password against a stored hash.
+
+        Args:
+            pw_hash (str): The stored bcrypt hash.
+            password (str): The plain text password to check.
+
+        Returns:
+            bool: True if the password matches.
+
+        Raises:
+            PasswordHasherBusy: If the hashing pool is saturated.
+        """
+        return self._run("check_password_hash", pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """
+        Tell whether a stored hash was made at another cost than the
+        configured 'BCRYPT_LOG_ROUNDS'.
+
+        Args:
+            pw_hash (str): The stored bcrypt hash.
+
+        Returns:
+            bool: True if the hash should be replaced.
+        """
+        return hash_cost(pw_hash) != current_app.config["BCRYPT_LOG_ROUNDS"]
+
+    def rehash(self, pw_hash, password):
+        """
+        Hash a just verified password again if its cost is outdated.
+
+        - Call only after 'check()' succeeded. When the pool is busy the
+          upgrade is skipped rather than failing the login; it is tried
+          again on the next one.
+
+        Args:
+            pw_hash (str): The stored bcrypt hash.
+            password (str): The plain text password that matched it.
+
+        Returns:
+            str: The new hash to store, or None if the stored one is kept.
+        """
+        if not self.needs_rehash(pw_hash):
+            return None
+        try:
+            new_hash = self.generate(password)
+        except PasswordHasherBusy:
+            return None
+        self._record(rehashed=1)
+        return new_hash
+
+    def stats(self):
+        """
+        Return the counters of this process.
+
+        Returns:
+            dict: Completed, rejected, timed out and rehashing
+              operations, the total and maximum queue wait, and the
+              total and maximum hash time, in seconds.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+@passwords_cli.command("calibrate")
+@click.option(
+    "--target-ms",
+    default=250.0,
+    show_default=True,
+    help="Verify latency aimed for, in milliseconds.",
+)
+@click.option("--min-cost", default=10, show_default=True, help="Lowest cost.")
+@click.option("--max-cost", default=16, show_default=True, help="Highest cost.")
+@click.option("--samples", default=3, show_default=True, help="Checks per cost.")
+def calibrate_command(target_ms, min_cost, max_cost, samples):
+    """
+    Pick the bcrypt cost that meets a verify latency on this host.
+    \f
+    - Run it on the production hardware, ideally under typical load,
+      and set 'BCRYPT_LOG_ROUNDS' to the printed cost. Users are moved
+      to the new cost as they log in.
+
+    Args:
+        target_ms (float): The verify latency aimed for, in milliseconds.
+        min_cost (int): The lowest cost considered.
+        max_cost (int): The highest cost considered.
+        samples (int): The checks timed per cost.
+    """
+    from blogify_app import db
+    from blogify_app.models import User
+
+    if not 4 <= min_cost <= max_cost <= 31:
+        raise click.BadParameter(
+            "Costs must satisfy 4 <= min-cost <= max-cost <= 31.",
+            param_hint="--min-cost/--max-cost",
+        )
+    chosen, timings = calibrate(
+        target_ms, min_cost, max_cost, samples=samples, echo=click.echo
+    )
+    if timings[chosen] > target_ms:
+        click.echo(
+            "Warning: even cost {} takes {:.0f} ms, over the {:.0f} ms target.".format(
+                chosen, timings[chosen], target_ms
+            )
+        )
+    current = current_app.config["BCRYPT_LOG_ROUNDS"]
+    stale = sum(
+        1
+        for (pw_hash,) in db.session.query(User.password)
+        if hash_cost(pw_hash) != chosen
+    )
+    click.echo(
+        "Chosen cost: {} ({:.0f} ms per login, {:.1f} logins/s per core). "
+        "Configured: {}.".format(
+            chosen, timings[chosen], 1000 / timings[chosen], current
+        )
+    )
+    click.echo("Set BCRYPT_LOG_ROUNDS={} in the configuration.".format(chosen))
+    if stale:
+        click.echo(
+            "{} users have hashes at another cost; they are rehashed on "
+            "their next login.".format(stale)
+        )
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Command-line maintenance commands for blog posts.
+
+- This module defines the 'flask posts' command group.
+- 'flask posts backfill-excerpts' computes the excerpt and reading
+  time of posts written before those fields existed.
+
+For detailed information about each command, refer to the individual
+command docstrings.
+
+Note: The command group is registered in 'blogify_app/__init__.py'.
+"""
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import update
+from blogify_app import db
+from blogify_app.models import Post
+from blogify_app.posts.utils import make_excerpt, estimate_reading_time
+
+posts_cli = AppGroup("posts", help="Maintenance commands for blog posts.")
+
+
+@posts_cli.command("backfill-excerpts")
+@click.option(
+    "--batch-size", default=500, show_default=True, help="Posts updated per commit."
+)
+@click.option(
+    "--all", "refresh_all", is_flag=True, help="Recompute existing excerpts too."
+)
+def backfill_excerpts(batch_size, refresh_all):
+    """
+    Compute missing post excerpts and reading times.
+    \f
+    - Posts are walked in id order in batches, each committed on its
+      own, so the command can be interrupted and resumed safely.
+    - Rows are updated with bulk UPDATE statements that keep their
+      'date_updated' stamp, so a backfill does not make every post
+      look freshly edited.
+
+    Args:
+        batch_size (int): The number of posts updated per commit.
+        refresh_all (bool): Whether posts that already have an
+          excerpt are recomputed as well.
+    """
+    last_id = 0
+    updated = 0
+    while True:
+        query = db.session.query(Post.id, Post.content, Post.date_updated).filter(
+            Post.id > last_id
+        )
+        if not refresh_all:
+            query = query.filter(Post.excerpt.is_(None))
+        batch = query.order_by(Post.id).limit(batch_size).all()
+        if not batch:
+            break
+        db.session.execute(
+            update(Post),
+            [
+                {
+                    "id": post_id,
+                    "excerpt": make_excerpt(content),
+                    "reading_time": estimate_reading_time(content),
+                    "date_updated": date_updated,
+                }
+                for post_id, content, date_updated in batch
+            ],
+        )
+        db.session.commit()
+        last_id = batch[-1].id
+        updated += len(batch)
+        click.echo("Updated {} posts (up to id {})".format(updated, last_id))
+    click.echo("Done: {} posts updated.".format(updated))
@@ -16,15 +16,43 @@ respectively.
 """
 
 
-from flask import render_template, url_for, flash, redirect, request, abort, Blueprint
+from flask import (
+    render_template,
+    url_for,
+    flash,
+    redirect,
+    request,
+    abort,
+    Blueprint,
+    current_app,
+)
 from flask_login import current_user, login_required
-from blogify_app import db
-from blogify_app.models import Post
+from sqlalchemy import select
+from blogify_app import db, response_cache
+from blogify_app.models import Post, author_loader
+from blogify_app.conditional import make_etag, post_fingerprint, render_conditional
 from blogify_app.posts.forms import PostForm
+from blogify_app.search.engine import index_post, remove_post
 
 posts = Blueprint("posts", __name__)
 
 
+def _post_tags(post_id):
+    """
+    Return the cache tags of a post page: the post and its author.
+
+    - The response cache reads the versions of these tags before the
+      view runs, so the author is looked up here rather than from the
+      loaded post: a profile update racing with the render then
+      invalidates the stored page.
+    """
+    user_id = db.session.scalar(select(Post.user_id).filter_by(id=post_id))
+    tags = ["post:{}".format(post_id)]
+    if user_id is not None:
+        tags.append("author:{}".format(user_id))
+    return tags
+
+
 @posts.route("/post/new", methods=["GET", "POST"])
 @login_required
 def new_post():
@@ -37,8 +65,8 @@ def new_post():
     Methods:
         - GET: Displays the form to create a new blog post.
         - POST: Processes the submitted form, creates a new blog
-          post in the database, and redirects to the home page
-          upon success.
+          post in the database, adds it to the search index, and
+          redirects to the home page upon success.
 
     Returns:
         str: Rendered HTML content based on the request.
@@ -53,7 +81,10 @@ def new_post():
             title=form.title.data, content=form.content.data, author=current_user
         )
         db.session.add(post)
+        db.session.flush()
+        index_post(post)
         db.session.commit()
+        response_cache.invalidate_post(post)
         flash("Your post has been created!", "success")
         return redirect(url_for("main.home"))
     return render_template(
@@ -62,25 +93,41 @@ def new_post():
 
 
 @posts.route("/post/<int:post_id>")
+@response_cache.cached(tags=_post_tags)
 def post(post_id):
     """
     Render a specific blog post.
 
     This route renders a specific blog post based
-    on the provided post ID.
+    on the provided post ID. The author is loaded together
+    with the post using 'POST_AUTHOR_LOADING'. Rendered pages
+    are cached under the 'post:<id>' and 'author:<id>' tags.
+    Requests whose 'If-None-Match' matches the current version
+    get a 304 without rendering.
 
     Args:
         post_id (int): The ID of the blog post to be rendered.
 
     Returns:
-        str: Rendered HTML content for the specified blog post.
+        Response: Rendered HTML content for the specified blog post,
+          or an empty '304 Not Modified' response.
 
     Raises:
         404 Not Found: If the specified post ID does not exist
           in the database.
     """
-    post = Post.query.get_or_404(post_id)
-    return render_template("post.html", title=post.title, post=post)
+    post = (
+        Post.query.options(author_loader(current_app.config["POST_AUTHOR_LOADING"]))
+        .filter_by(id=post_id)
+        .first_or_404()
+    )
+    return render_conditional(
+        "post.html",
+        make_etag(post_fingerprint(post)),
+        last_modified=post.last_modified,
+        title=post.title,
+        post=post,
+    )
 
 
 @posts.route("/post/<int:post_id>/update", methods=["GET", "POST"])
@@ -111,7 +158,9 @@ def update_post(post_id):
     if form.validate_on_submit():
         post.title = form.title.data
         post.content = form.content.data
+        index_post(post)
         db.session.commit()
+        response_cache.invalidate_post(post)
         flash("Your post has been updated!", "success")
         return redirect(url_for("posts.post", post_id=post.id))
     elif request.method == "GET":
@@ -147,6 +196,8 @@ def delete_post(post_id):
     if post.author != current_user:
         abort(403)
     db.session.delete(post)
+    remove_post(post.id)
     db.session.commit()
+    response_cache.invalidate_post(post)
     flash("Your post has been deleted!", "success")
     return redirect(url_for("main.home"))
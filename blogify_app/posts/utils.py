@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Utility functions for blog post-related operations
+in the Flask web application.
+
+- This module provides utility functions used when posts are written,
+  such as building the excerpt and reading time shown on list pages.
+- Both values are computed once when a post is created or updated and
+  stored on the post, so feeds and timelines never need to load the
+  full 'content' column.
+
+For detailed information about each utility function, parameters,
+and behavior, refer to the individual function docstrings.
+
+Note: 'summarize_post' runs from a mapper hook on 'Post' (see
+'blogify_app/models.py') whenever a post is written through the ORM;
+the 'flask posts backfill-excerpts' command uses the other utilities.
+"""
+
+import math
+
+# Maximum length of an excerpt, in characters (the column holds 300).
+EXCERPT_LENGTH = 280
+
+# Average adult silent reading speed used for reading time estimates.
+WORDS_PER_MINUTE = 200
+
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    """
+    Build a short plain-text excerpt of a post's content.
+
+    - Runs of whitespace (including line breaks) are collapsed.
+    - Long content is cut at the last word boundary before 'length'
+      and an ellipsis is appended.
+
+    Args:
+        content (str): The full content of the post.
+        length (int, optional): The maximum excerpt length.
+          Defaults to EXCERPT_LENGTH.
+
+    Returns:
+        str: The excerpt.
+    """
+    text = " ".join(content.split())
+    if len(text) <= length:
+        return text
+    cut = text[: length - 1]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip(".,;:!?-") + "…"
+
+
+def estimate_reading_time(content):
+    """
+    Estimate how many minutes it takes to read a post.
+
+    Args:
+        content (str): The full content of the post.
+
+    Returns:
+        int: The reading time in whole minutes, at least 1.
+    """
+    return max(1, math.ceil(len(content.split()) / WORDS_PER_MINUTE))
+
+
+def summarize_post(post):
+    """
+    Store the excerpt and reading time of a post from its content.
+
+    Args:
+        post (Post): The post being created or updated.
+    """
+    post.excerpt = make_excerpt(post.content)
+    post.reading_time = estimate_reading_time(post.content)
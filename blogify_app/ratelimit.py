@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Rate limiting of the expensive account routes of the Blogify web
+application.
+
+- This module provides the 'RateLimiter' Flask extension. Views opt in
+  with 'rate_limiter.limit', which throttles form submissions per
+  client IP and per account (the submitted email address) with token
+  buckets: each bucket holds up to N tokens and refills at N per
+  period. Every submission takes a token from the IP bucket; the view
+  takes one from the account bucket with 'rate_limiter.charge' only
+  for a failed login or a reset email sent.
+- Limits are checked before the view runs, so a throttled client is
+  answered '429 Too Many Requests' with a 'Retry-After' header without
+  any bcrypt work, database lookup or email being sent.
+- Two storage backends are available: 'MemoryBucketStore', in the
+  memory of one worker, and 'SQLiteBucketStore', a small SQLite file
+  shared by every gunicorn worker on a host, so limits hold however
+  requests are spread across workers.
+- Account keys are stored as digests, so the store never holds email
+  addresses.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: The 'rate_limiter' extension instance is created and initialised
+in 'blogify_app/__init__.py'. Client IPs come from 'request.remote_addr';
+behind a reverse proxy, wrap the app in Werkzeug's 'ProxyFix' so it
+holds the client address rather than the proxy's.
+"""
+
+import os
+import re
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+
+# Seconds in each period accepted in limit strings ('5/minute').
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+_LIMIT = re.compile(r"^(\d+)\s*/\s*(\d+)?\s*(second|minute|hour|day)s?$")
+
+
+def parse_limit(limit):
+    """
+    Parse a limit such as '5/minute' or '20/10minute'.
+
+    Args:
+        limit (str): A count and a period, optionally with a multiplier.
+
+    Returns:
+        tuple: The bucket capacity and its refill rate in tokens per
+          second.
+
+    Raises:
+        ValueError: If the limit is malformed.
+    """
+    match = _LIMIT.match(limit.strip())
+    if match is None or int(match.group(1)) < 1:
+        raise ValueError("Malformed rate limit: {!r}".format(limit))
+    count = int(match.group(1))
+    seconds = int(match.group(2) or 1) * PERIODS[match.group(3)]
+    return count, count / seconds
+
+
+def _refill(tokens, updated, capacity, rate, now):
+    """
+    Take a token from a bucket.
+
+    Returns:
+        tuple: The remaining tokens and the seconds until a token is
+          available (0 when this one was granted).
+    """
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+def _wait(tokens, updated, capacity, rate, now):
+    """
+    Return the seconds until a bucket holds a token, without taking it.
+    """
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    return 0 if tokens >= 1 else (1 - tokens) / rate
+
+
+class MemoryBucketStore:
+    """
+    Token bucket store in the memory of one worker process.
+
+    Attributes:
+        max_keys (int): The number of buckets kept before the least
+          recently used one is dropped (which refills it).
+
+    Note:
+        - Each gunicorn worker counts separately, so the effective limit
+          is multiplied by the number of workers. Use the SQLite store
+          when that matters.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """
+        Take a token from the bucket of 'key'.
+
+        Args:
+            key (str): The bucket key.
+            capacity (int): The size of the bucket.
+            rate (float): The refill rate, in tokens per second.
+
+        Returns:
+            float: 0 if the token was granted, else the seconds to wait.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, wait = _refill(tokens, updated, capacity, rate, now)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def peek(self, key, capacity, rate):
+        """
+        Tell how long until the bucket of 'key' holds a token.
+
+        Args:
+            key (str): The bucket key.
+            capacity (int): The size of the bucket.
+            rate (float): The refill rate, in tokens per second.
+
+        Returns:
+            float: 0 if a token is available, else the seconds to wait.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0
+        return _wait(bucket[0], bucket[1], capacity, rate, now)
+
+    def clear(self):
+        """
+        Refill every bucket.
+        """
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """
+    Token bucket store in a SQLite file shared by worker processes.
+
+    Attributes:
+        path (str): The path of the database file.
+
+    Note:
+        - Each take runs in an immediate transaction, so concurrent
+          workers update a bucket one at a time.
+        - Connections are opened per thread and per process, so the
+          store is safe to create before gunicorn forks.
+    """
+
+    _prune_every = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key, capacity, rate):
+        """
+        Take a token from the bucket of 'key'.
+
+        Args:
+            key (str): The bucket key.
+            capacity (int): The size of the bucket.
+            rate (float): The refill rate, in tokens per second.
+
+        Returns:
+            float: 0 if the token was granted, else the seconds to wait.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, wait = _refill(tokens, updated, capacity, rate, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) "
+                "VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._takes += 1
+        if self._takes % self._prune_every == 0:
+            self._prune(now)
+        return wait
+
+    def peek(self, key, capacity, rate):
+        """
+        Tell how long until the bucket of 'key' holds a token.
+
+        Args:
+            key (str): The bucket key.
+            capacity (int): The size of the bucket.
+            rate (float): The refill rate, in tokens per second.
+
+        Returns:
+            float: 0 if a token is available, else the seconds to wait.
+        """
+        row = (
+            self._connection()
+            .execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None:
+            return 0
+        return _wait(row[0], row[1], capacity, rate, time.time())
+
+    def _prune(self, now):
+        """
+        Delete buckets untouched for a day, which have refilled anyway
+        for any limit of up to a day.
+        """
+        self._connection().execute(
+            "DELETE FROM buckets WHERE updated < ?", (now - PERIODS["day"],)
+        )
+
+    def clear(self):
+        """
+        Refill every bucket.
+        """
+        self._connection().execute("DELETE FROM buckets")
+
+
+class RateLimiter:
+    """
+    Flask extension throttling form submissions per IP and per account.
+
+    Usage:
+        - rate_limiter = RateLimiter()
+        - rate_limiter.init_app(app)
+
+        @users.route("/login", methods=["GET", "POST"])
+        @rate_limiter.limit("login", account_field="email")
+        def login():
+            ...
+            rate_limiter.charge("login", form.email.data)
+
+    Note:
+        - The limits of a scope are the 'RATELIMIT_<SCOPE>_IP' and
+          'RATELIMIT_<SCOPE>_ACCOUNT' settings, such as '5/minute'. An
+          empty setting disables that limit.
+        - Only POST requests are counted; showing the forms is cheap.
+        - Account buckets only drain through 'charge', so the owner's
+          successful logins never count against them. A client that
+          fails on purpose can still throttle an account's logins, at
+          most for one period and no faster than its IP limit allows;
+          this is the price of stopping password guessing spread over
+          many IPs.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Configure the limits and the bucket store of an app.
+
+        Args:
+            app (Flask): The Flask application instance.
+
+        Raises:
+            ValueError: If 'RATELIMIT_STORAGE' names an unknown store.
+        """
+        app.config.setdefault("RATELIMIT_ENABLED", True)
+        app.config.setdefault("RATELIMIT_STORAGE", "memory")
+        if not app.config.get("RATELIMIT_STORAGE_PATH"):
+            app.config["RATELIMIT_STORAGE_PATH"] = os.path.join(
+                app.instance_path, "ratelimit.sqlite3"
+            )
+        app.config.setdefault("RATELIMIT_LOGIN_IP", "20/minute")
+        app.config.setdefault("RATELIMIT_LOGIN_ACCOUNT", "5/minute")
+        app.config.setdefault("RATELIMIT_REGISTER_IP", "10/hour")
+        app.config.setdefault("RATELIMIT_RESET_IP", "5/hour")
+        app.config.setdefault("RATELIMIT_RESET_ACCOUNT", "3/hour")
+
+        storage = app.config["RATELIMIT_STORAGE"]
+        if storage == "memory":
+            store = MemoryBucketStore()
+        elif storage == "sqlite":
+            os.makedirs(
+                os.path.dirname(app.config["RATELIMIT_STORAGE_PATH"]), exist_ok=True
+            )
+            store = SQLiteBucketStore(app.config["RATELIMIT_STORAGE_PATH"])
+        else:
+            raise ValueError("Unknown RATELIMIT_STORAGE: {}".format(storage))
+        app.extensions["rate_limiter"] = store
+
+    @property
+    def store(self):
+        """
+        object: The bucket store of the current application.
+        """
+        return current_app.extensions["rate_limiter"]
+
+    def _take(self, scope, kind, identity, peek=False):
+        limit = current_app.config.get("RATELIMIT_{}_{}".format(scope.upper(), kind))
+        if not limit or not identity:
+            return 0
+        capacity, rate = parse_limit(limit)
+        key = "{}:{}:{}".format(scope, kind.lower(), identity)
+        if peek:
+            return self.store.peek(key, capacity, rate)
+        return self.store.take(key, capacity, rate)
+
+    @staticmethod
+    def _account_key(account):
+        digest = hashlib.sha256(account.strip().lower().encode("utf-8"))
+        return digest.hexdigest()[:32]
+
+    def check(self, scope, account=None):
+        """
+        Take a token from the IP bucket of a scope, and check that the
+        account bucket still holds one.
+
+        - The account token is only taken by 'charge', once the view
+          knows the attempt failed.
+
+        Args:
+            scope (str): The limit scope, such as 'login'.
+            account (str, optional): The account the request is about,
+              such as the submitted email address. Defaults to None.
+
+        Raises:
+            TooManyRequests: If a limit is exceeded. Its 'retry_after'
+              is the number of seconds to wait.
+        """
+        if not current_app.config["RATELIMIT_ENABLED"]:
+            return
+        wait = self._take(scope, "IP", request.remote_addr)
+        if not wait and account:
+            wait = self._take(scope, "ACCOUNT", self._account_key(account), peek=True)
+        if wait:
+            current_app.logger.warning(
+                "Rate limit '%s' exceeded by %s", scope, request.remote_addr
+            )
+            raise TooManyRequests(retry_after=max(1, math.ceil(wait)))
+
+    def charge(self, scope, account):
+        """
+        Take a token from the account bucket of a scope.
+
+        - Views call this for the attempts an account is limited on,
+          such as a failed login or a reset email sent.
+
+        Args:
+            scope (str): The limit scope, such as 'login'.
+            account (str): The account the request was about.
+        """
+        if not current_app.config["RATELIMIT_ENABLED"] or not account:
+            return
+        self._take(scope, "ACCOUNT", self._account_key(account))
+
+    def limit(self, scope, account_field=None):
+        """
+        Decorate a view so its form submissions are rate limited.
+
+        Args:
+            scope (str): The limit scope, such as 'login'.
+            account_field (str, optional): The form field naming the
+              account, such as 'email'. Defaults to None (IP only).
+
+        Returns:
+            callable: The decorator.
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if request.method == "POST":
+                    account = request.form.get(account_field) if account_field else None
+                    self.check(scope, account)
+                return view(**kwargs)
+
+            return wrapper
+
+        return decorator
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Command-line maintenance commands for the search index.
+
+- This module defines the 'flask search' command group.
+- 'flask search rebuild' drops the full-text index and rebuilds it
+  from every post in the database.
+
+For detailed information about each command, refer to the individual
+command docstrings.
+
+Note: The command group is registered in 'blogify_app/__init__.py'.
+"""
+
+import time
+import click
+from flask.cli import AppGroup
+from blogify_app.search.engine import rebuild_index, SearchUnavailable
+
+search_cli = AppGroup("search", help="Maintenance commands for the search index.")
+
+
+@search_cli.command("rebuild")
+@click.option(
+    "--batch-size", default=5000, show_default=True, help="Posts indexed per batch."
+)
+def rebuild(batch_size):
+    """
+    Rebuild the full-text search index from the posts table.
+    \f
+    Args:
+        batch_size (int): The number of posts indexed per statement.
+    """
+    started = time.perf_counter()
+    try:
+        total = rebuild_index(
+            batch_size=batch_size,
+            progress=lambda done: click.echo("Indexed {} posts".format(done)),
+        )
+    except SearchUnavailable as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        "Done: {} posts indexed in {:.1f}s.".format(
+            total, time.perf_counter() - started
+        )
+    )
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Full-text search engine over blog posts for the Blogify web application.
+
+- This module maintains an inverted index of 'Post.title' and
+  'Post.content' in an SQLite FTS5 virtual table ('post_search') living
+  in the application database, keyed by post id.
+- The index table is created once, by migration step 6
+  ('blogify_app/migrations.py'), and is created and dropped together
+  with the 'post' table, so 'db.drop_all()' never leaves a stale index
+  behind whose rowids a new post would reuse.
+- The index is updated incrementally, inside the same transaction as
+  the post write, by the post create, update and delete routes, and can
+  be rebuilt from scratch with 'flask search rebuild'.
+- Results are ranked by BM25 relevance (title matches weigh more than
+  content matches) and paged with opaque keyset cursors on
+  (score, post id), so deep result pages cost no more than the first.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: FTS5 is only available on SQLite databases. On other databases
+the index functions are no-ops and 'search_posts' raises
+'SearchUnavailable'.
+"""
+
+import re
+from itsdangerous import URLSafeSerializer, BadSignature
+from flask import current_app, abort
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, event, text
+from sqlalchemy.orm import defer
+from blogify_app import db
+from blogify_app.models import Post, author_loader
+
+INDEX_TABLE = "post_search"
+
+# The statement creating the index table.
+INDEX_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5("
+    "title, content, tokenize='porter unicode61')".format(INDEX_TABLE)
+)
+
+# BM25 column weights for (title, content).
+RANK = "bm25(post_search, 10.0, 1.0)"
+
+# Snippet markers; control characters cannot appear in escaped HTML.
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+
+class SearchUnavailable(Exception):
+    """
+    Raised when full-text search is not supported by the database.
+    """
+
+
+class SearchResult:
+    """
+    A single search hit.
+
+    Attributes:
+        post (Post): The matching post, with its author loaded.
+        snippet (Markup): An HTML-safe excerpt with the matched terms
+          wrapped in '<mark>' elements.
+        score (float): The BM25 score of the hit (lower is better).
+    """
+
+    def __init__(self, post, snippet, score):
+        self.post = post
+        self.snippet = snippet
+        self.score = score
+
+
+class SearchPage:
+    """
+    One page of search results.
+
+    Attributes:
+        items (list): The SearchResult objects on this page, best first.
+        has_next (bool): Whether further results exist.
+        next_cursor (str): Opaque token for the following page,
+          or None when this is the last page.
+    """
+
+    def __init__(self, items, has_next):
+        self.items = items
+        self.has_next = has_next
+        self.next_cursor = None
+        if has_next and items:
+            last = items[-1]
+            self.next_cursor = _serializer().dumps([last.score, last.post.id])
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config["SECRET_KEY"], salt="search-cursor")
+
+
+def is_supported():
+    """
+    Tell whether the application database supports FTS5 search.
+
+    Returns:
+        bool: True on SQLite databases.
+    """
+    return db.engine.dialect.name == "sqlite"
+
+
+# The index lives and dies with the 'post' table on SQLite databases.
+event.listen(
+    Post.__table__, "after_create", DDL(INDEX_SCHEMA).execute_if(dialect="sqlite")
+)
+event.listen(
+    Post.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS {}".format(INDEX_TABLE)).execute_if(dialect="sqlite"),
+)
+
+
+def index_post(post):
+    """
+    Add a post to the index, or refresh its entry after an update.
+
+    - The caller commits; the index entry is written in the same
+      transaction as the post itself.
+
+    Args:
+        post (Post): A flushed post (its id must be known).
+    """
+    if not is_supported():
+        return
+    db.session.execute(
+        text(
+            "INSERT OR REPLACE INTO {}(rowid, title, content) "
+            "VALUES (:id, :title, :content)".format(INDEX_TABLE)
+        ),
+        {"id": post.id, "title": post.title, "content": post.content},
+    )
+
+
+def remove_post(post_id):
+    """
+    Remove a post from the index.
+
+    Args:
+        post_id (int): The id of the deleted post.
+    """
+    if not is_supported():
+        return
+    db.session.execute(
+        text("DELETE FROM {} WHERE rowid = :id".format(INDEX_TABLE)), {"id": post_id}
+    )
+
+
+def rebuild_index(batch_size=1000, progress=None):
+    """
+    Drop the index and rebuild it from the 'post' table.
+
+    Args:
+        batch_size (int, optional): Posts indexed per statement.
+          Defaults to 1000.
+        progress (callable, optional): Called with the number of posts
+          indexed so far after each batch. Defaults to None.
+
+    Returns:
+        int: The number of posts indexed.
+
+    Raises:
+        SearchUnavailable: If the database does not support FTS5.
+    """
+    if not is_supported():
+        raise SearchUnavailable("Full-text search requires an SQLite database.")
+    db.session.execute(text("DROP TABLE IF EXISTS {}".format(INDEX_TABLE)))
+    db.session.execute(text(INDEX_SCHEMA))
+    last_id, total = 0, 0
+    while True:
+        upper = db.session.execute(
+            text(
+                "SELECT MAX(id), COUNT(*) FROM (SELECT id FROM post "
+                "WHERE id > :last ORDER BY id LIMIT :n)"
+            ),
+            {"last": last_id, "n": batch_size},
+        ).one()
+        if not upper[1]:
+            break
+        db.session.execute(
+            text(
+                "INSERT INTO {}(rowid, title, content) SELECT id, title, content "
+                "FROM post WHERE id > :last AND id <= :upper".format(INDEX_TABLE)
+            ),
+            {"last": last_id, "upper": upper[0]},
+        )
+        last_id, total = upper[0], total + upper[1]
+        if progress is not None:
+            progress(total)
+    db.session.execute(
+        text("INSERT INTO {0}({0}) VALUES ('optimize')".format(INDEX_TABLE))
+    )
+    db.session.commit()
+    return total
+
+
+def build_match_query(query_text):
+    """
+    Turn free text typed by a user into a safe FTS5 MATCH expression.
+
+    - Every word becomes a quoted term, so FTS5 operators and syntax
+      characters in user input are treated as plain text.
+    - The last word is matched as a prefix, to support search-as-you-type.
+
+    Args:
+        query_text (str): The raw search box input.
+
+    Returns:
+        str: The MATCH expression, or an empty string if the input
+          contains no searchable words.
+    """
+    words = re.findall(r"\w+", query_text.lower())[:16]
+    if not words:
+        return ""
+    terms = ['"{}"'.format(word) for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _highlight(snippet):
+    html = str(escape(snippet))
+    return Markup(html.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>"))
+
+
+def search_posts(query_text, cursor=None, per_page=10):
+    """
+    Search posts by relevance.
+
+    Args:
+        query_text (str): The raw search box input.
+        cursor (str, optional): An opaque cursor from a previous page.
+          Defaults to None.
+        per_page (int, optional): Results per page. Defaults to 10.
+
+    Returns:
+        SearchPage: The requested page of results.
+
+    Raises:
+        SearchUnavailable: If the database does not support FTS5.
+        404 Not Found: If the cursor is invalid.
+    """
+    if not is_supported():
+        raise SearchUnavailable("Full-text search requires an SQLite database.")
+    match = build_match_query(query_text)
+    if not match:
+        return SearchPage([], False)
+
+    params = {"match": match, "n": per_page + 1}
+    after = ""
+    if cursor:
+        try:
+            params["score"], params["last_id"] = _serializer().loads(cursor)
+        except (BadSignature, ValueError, TypeError):
+            abort(404)
+        after = (
+            "AND ({rank} > :score OR ({rank} = :score AND rowid > :last_id))".format(
+                rank=RANK
+            )
+        )
+    rows = db.session.execute(
+        text(
+            "SELECT rowid, {rank} AS score, "
+            "snippet({table}, -1, :start, :end, '…', 24) AS snippet "
+            "FROM {table} WHERE {table} MATCH :match {after} "
+            "ORDER BY score, rowid LIMIT :n".format(
+                rank=RANK, table=INDEX_TABLE, after=after
+            )
+        ),
+        dict(params, start=_MARK_START, end=_MARK_END),
+    ).all()
+
+    hits = rows[:per_page]
+    posts = {
+        post.id: post
+        for post in Post.query.options(
+            author_loader(current_app.config["FEED_AUTHOR_LOADING"]),
+            defer(Post.content),
+        ).filter(Post.id.in_([row.rowid for row in hits]))
+    }
+    items = [
+        SearchResult(posts[row.rowid], _highlight(row.snippet), row.score)
+        for row in hits
+        if row.rowid in posts
+    ]
+    return SearchPage(items, len(rows) > per_page)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Search routes for the Flask web application.
+
+- This module defines the '/search' route, which runs a full-text
+  search over blog post titles and contents and renders the results
+  ranked by relevance.
+- The routes are associated with the 'search' Blueprint.
+
+For detailed information about the search engine, refer to
+'blogify_app/search/engine.py'.
+"""
+
+from flask import render_template, request, abort, Blueprint
+from blogify_app.search.engine import search_posts, SearchUnavailable
+
+search = Blueprint("search", __name__)
+
+
+@search.route("/search")
+def search_results():
+    """
+    Render the search results page.
+
+    - The search terms come from the 'q' query argument and the page
+      from the opaque 'cursor' argument.
+    - Ten results are shown per page, best match first.
+
+    Returns:
+        str: Rendered HTML template displaying the matching posts.
+
+    Raises:
+        404 Not Found: If the cursor is invalid.
+        503 Service Unavailable: If the database does not support
+          full-text search.
+    """
+    query_text = request.args.get("q", "").strip()
+    results = None
+    if query_text:
+        try:
+            results = search_posts(query_text, cursor=request.args.get("cursor"))
+        except SearchUnavailable:
+            abort(503)
+    return render_template(
+        "search.html", title="Search", query_text=query_text, results=results
+    )
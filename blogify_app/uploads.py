@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Memory-bounded streaming uploads for the Blogify web application.
+
+- This module provides 'UploadRequest', the application's request
+  class. Werkzeug writes each uploaded file straight into an
+  'UploadSpool' on disk as the multipart body is parsed, instead of an
+  in-memory or spooled buffer that is copied again later.
+- The spool enforces 'UPLOAD_MAX_FILE_BYTES' as data arrives and
+  hashes the upload on the way in, so an oversized file is refused
+  with '413 Payload Too Large' after at most that many bytes, and the
+  content hash is known without reading the file again.
+- 'inspect_picture' reads only the header of an uploaded picture to
+  check its format and pixel dimensions before anything decodes it,
+  which stops decompression bombs (a small PNG claiming an enormous
+  canvas) from reaching Pillow's decoder.
+
+For detailed information about each class and function, refer to the
+individual docstrings.
+
+Note: 'MAX_CONTENT_LENGTH' still bounds the whole request body, and
+spool files live in 'UPLOAD_SPOOL_DIR' (by default 'uploads' in the
+instance folder), outside the static folder.
+"""
+
+import os
+import hashlib
+import tempfile
+from flask import Request, current_app
+from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Picture formats accepted for profile pictures, as named by Pillow, and
+# the extension each is stored with.
+ALLOWED_FORMATS = {"JPEG": ".jpg", "PNG": ".png"}
+
+
+class UploadSpool:
+    """
+    Write-through file for one uploaded file, with a size limit.
+
+    Attributes:
+        name (str): The path of the spool file. It is deleted when the
+          request ends, so keep the data with 'os.link' if needed.
+        size (int): The number of bytes received so far.
+        max_bytes (int): The number of bytes accepted.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self._file = tempfile.NamedTemporaryFile(dir=directory, suffix=".upload")
+        self._digest = hashlib.sha256()
+        self.name = self._file.name
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, data):
+        """
+        Append a chunk of the upload.
+
+        Raises:
+            RequestEntityTooLarge: If the upload exceeds 'max_bytes'.
+        """
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge(
+                "Uploaded files are limited to {} bytes.".format(self.max_bytes)
+            )
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        """
+        Return the SHA-256 digest of the complete upload.
+        """
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """
+    Request class streaming uploaded files into size-limited spools.
+    """
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        return UploadSpool(
+            current_app.config["UPLOAD_SPOOL_DIR"],
+            current_app.config["UPLOAD_MAX_FILE_BYTES"],
+        )
+
+
+def inspect_picture(stream, max_pixels):
+    """
+    Check an uploaded picture from its header, without decoding it.
+
+    Args:
+        stream (file): The uploaded file. Its position is restored.
+        max_pixels (int): The largest accepted width times height.
+
+    Returns:
+        tuple: The Pillow format name and the (width, height).
+
+    Raises:
+        ValueError: If the file is not a JPEG or PNG picture, or is
+          larger than 'max_pixels'.
+    """
+    position = stream.tell()
+    try:
+        with Image.open(stream) as image:
+            image_format, size = image.format, image.size
+    except Image.DecompressionBombError:
+        raise ValueError("The picture is too large.")
+    except OSError:
+        raise ValueError("The file is not a valid picture.")
+    finally:
+        stream.seek(position)
+    if image_format not in ALLOWED_FORMATS:
+        raise ValueError("Only JPEG and PNG pictures are accepted.")
+    if size[0] * size[1] > max_pixels:
+        raise ValueError(
+            "The picture is too large ({}x{} pixels, at most {:.0f} megapixels).".format(
+                size[0], size[1], max_pixels / 1e6
+            )
+        )
+    return image_format, size
+
+
+class Uploads:
+    """
+    Flask extension installing the streaming upload request class.
+
+    Usage:
+        - uploads = Uploads()
+        - uploads.init_app(app)
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Configure upload limits and the spool directory of an app.
+
+        - An empty 'UPLOAD_SPOOL_DIR' defaults to 'uploads' in the
+          instance folder.
+
+        Args:
+            app (Flask): The Flask application instance.
+        """
+        app.config.setdefault("UPLOAD_MAX_FILE_BYTES", 5 * 1024 * 1024)
+        app.config.setdefault("AVATAR_MAX_PIXELS", 24_000_000)
+        if not app.config.get("UPLOAD_SPOOL_DIR"):
+            app.config["UPLOAD_SPOOL_DIR"] = os.path.join(app.instance_path, "uploads")
+        os.makedirs(app.config["UPLOAD_SPOOL_DIR"], exist_ok=True)
+        app.request_class = UploadRequest
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Command-line maintenance commands for profile pictures.
+
+- This module defines the 'flask avatars' command group.
+- 'flask avatars backfill' moves pictures saved before renditions
+  existed to content-addressed names, writing every size.
+- 'flask avatars gc' deletes the files in 'static/profile_pics' that no
+  user points at any more.
+
+For detailed information about each command, refer to the individual
+command docstrings.
+
+Note: The command group is registered in 'blogify_app/__init__.py'.
+"""
+
+import os
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import update
+from blogify_app import db, response_cache, user_cache
+from blogify_app.models import User
+from blogify_app.avatars import (
+    AVATAR_RENDITIONS,
+    avatar_dir,
+    is_content_addressed,
+    process_avatar,
+    rendition_name,
+)
+from blogify_app.uploads import ALLOWED_FORMATS, inspect_picture
+
+avatars_cli = AppGroup("avatars", help="Maintenance commands for profile pictures.")
+
+
+def _hash_file(path, max_pixels):
+    """
+    Return the content-addressed name of a picture file, with the
+    extension of its format, as 'stage_upload' names uploads.
+
+    Raises:
+        ValueError: If the file is not an accepted picture.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        image_format, _ = inspect_picture(f, max_pixels)
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:32] + ALLOWED_FORMATS[image_format]
+
+
+@avatars_cli.command("backfill")
+@click.option(
+    "--workers", default=4, show_default=True, help="Pictures processed at once."
+)
+def backfill(workers):
+    """
+    Store legacy profile pictures by content hash, with every size.
+    \f
+    - Each distinct legacy file is hashed and processed once, on a pool
+      of threads, even when several users point at it or several files
+      hold the same picture.
+    - Users are then pointed at the new names in one bulk update. The
+      legacy files are left for 'flask avatars gc'.
+    - Files that are not JPEG or PNG pictures are skipped, and their
+      users keep them.
+
+    Args:
+        workers (int): The number of pictures processed concurrently.
+    """
+    directory = avatar_dir(current_app)
+    max_pixels = current_app.config["AVATAR_MAX_PIXELS"]
+    legacy = {}
+    for user_id, image_file in db.session.query(User.id, User.image_file):
+        if is_content_addressed(image_file):
+            continue
+        if not os.path.isfile(os.path.join(directory, image_file)):
+            click.echo("Skipping user {}: {} is missing".format(user_id, image_file))
+            continue
+        legacy.setdefault(image_file, []).append(user_id)
+    if not legacy:
+        click.echo("Nothing to backfill.")
+        return
+
+    def convert(image_file):
+        source = os.path.join(directory, image_file)
+        target = _hash_file(source, max_pixels)
+        if not os.path.exists(os.path.join(directory, target)):
+            process_avatar(source, directory, target)
+        return target
+
+    started = time.perf_counter()
+    renamed = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {name: executor.submit(convert, name) for name in legacy}
+        for name, future in futures.items():
+            try:
+                renamed[name] = future.result()
+            except (OSError, ValueError) as e:
+                click.echo("Skipping {}: {}".format(name, e))
+
+    rows = [
+        {"id": user_id, "image_file": target}
+        for name, target in renamed.items()
+        for user_id in legacy[name]
+    ]
+    if rows:
+        db.session.execute(update(User), rows)
+        db.session.commit()
+        for user in User.query.filter(User.id.in_([row["id"] for row in rows])):
+            user_cache.invalidate(user)
+            response_cache.invalidate_author(user)
+    click.echo(
+        "Done: {} files ({} distinct pictures) for {} users in {:.1f}s.".format(
+            len(renamed),
+            len(set(renamed.values())),
+            len(rows),
+            time.perf_counter() - started,
+        )
+    )
+
+
+@avatars_cli.command("gc")
+@click.option(
+    "--grace",
+    default=3600,
+    show_default=True,
+    help="Keep unreferenced files younger than this many seconds.",
+)
+@click.option("--dry-run", is_flag=True, help="Only list the files to delete.")
+@click.option("--workers", default=4, show_default=True, help="Files deleted at once.")
+def gc(grace, dry_run, workers):
+    """
+    Delete profile pictures no user points at.
+    \f
+    - Recent files are kept, since an upload being processed has its
+      files on disk before 'User.image_file' points at them.
+    - Old staged uploads in 'UPLOAD_SPOOL_DIR' are deleted as well.
+
+    Args:
+        grace (int): The minimum age, in seconds, of a deleted file.
+        dry_run (bool): Whether files are only listed.
+        workers (int): The number of files deleted concurrently.
+    """
+    directory = avatar_dir(current_app)
+    keep = set()
+    for (image_file,) in db.session.query(User.image_file).distinct():
+        keep.add(image_file)
+        if is_content_addressed(image_file):
+            keep.update(rendition_name(image_file, size) for size in AVATAR_RENDITIONS)
+
+    cutoff = time.time() - grace
+    orphans, freed = [], 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name in keep:
+                continue
+            stat = entry.stat()
+            if stat.st_mtime < cutoff:
+                orphans.append(entry.path)
+                freed += stat.st_size
+
+    spool_dir = current_app.config["UPLOAD_SPOOL_DIR"]
+    with os.scandir(spool_dir) as entries:
+        for entry in entries:
+            # Staged uploads left behind by a crashed worker
+            if entry.name.endswith(".staged") and entry.stat().st_mtime < cutoff:
+                orphans.append(entry.path)
+                freed += entry.stat().st_size
+
+    if dry_run:
+        for path in sorted(orphans):
+            click.echo(os.path.basename(path))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(os.remove, orphans))
+    click.echo(
+        "{} {} unreferenced files ({} bytes).".format(
+            "Would delete" if dry_run else "Deleted", len(orphans), freed
+        )
+    )
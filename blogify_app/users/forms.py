@@ -21,8 +21,10 @@ from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
+from flask import current_app
 from flask_login import current_user
 from blogify_app.models import User
+from blogify_app.uploads import inspect_picture
 
 
 class RegistrationForm(FlaskForm):
@@ -167,7 +169,8 @@ class UpdateAccountForm(FlaskForm):
           and within a length range of 2 to 20 characters.
         - `email`: Enforces that a valid email address is provided.
         - `picture`: Enforces that the uploaded file has an allowed
-          extension ('jpg' or 'png').
+          extension ('jpg' or 'png'), is a JPEG or PNG picture and is
+          not larger than 'AVATAR_MAX_PIXELS'.
     """
 
     username = StringField(
@@ -213,6 +216,28 @@ class UpdateAccountForm(FlaskForm):
                 "That email is taken, Please choose another one"
             )
 
+    def validate_picture(self, picture):
+        """
+        Validate the format and pixel dimensions of the uploaded picture.
+
+        - Only the picture header is read; nothing is decoded here.
+
+        Args:
+            picture (FileField): Uploaded profile picture.
+
+        Raises:
+            ValidationError: If the file is not a JPEG or PNG picture,
+              or has more than 'AVATAR_MAX_PIXELS' pixels.
+        """
+        if not picture.data:
+            return
+        try:
+            inspect_picture(
+                picture.data.stream, current_app.config["AVATAR_MAX_PIXELS"]
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+
 
 class RequestResetForm(FlaskForm):
     """
@@ -16,10 +16,29 @@ Note: The 'users' Blueprint is registered in the 'blogify_app/__init__.py'
 file to be incorporated into the main application.
 """
 
-from flask import render_template, url_for, flash, redirect, request, Blueprint
+from flask import (
+    render_template,
+    url_for,
+    flash,
+    redirect,
+    request,
+    Blueprint,
+    current_app,
+    abort,
+)
+from sqlalchemy.orm import defer
 from flask_login import login_user, current_user, logout_user, login_required
-from blogify_app import db, bcrypt
-from blogify_app.models import User, Post
+from blogify_app import (
+    db,
+    response_cache,
+    avatar_processor,
+    password_hasher,
+    rate_limiter,
+    user_cache,
+)
+from blogify_app.models import User, Post, author_loader
+from blogify_app.pagination import paginate_keyset
+from blogify_app.conditional import page_validators, render_conditional
 from blogify_app.users.forms import (
     RegistrationForm,
     LoginForm,
@@ -27,12 +46,13 @@ from blogify_app.users.forms import (
     RequestResetForm,
     ResetPasswordForm,
 )
-from blogify_app.users.utils import save_picture, send_reset_email
+from blogify_app.users.utils import send_reset_email
 
 users = Blueprint("users", __name__)
 
 
 @users.route("/register", methods=["GET", "POST"])
+@rate_limiter.limit("register")
 def register():
     """
     Register a new user.
@@ -57,9 +77,7 @@ def register():
         return redirect(url_for("main.home"))
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
+        hashed_password = password_hasher.generate(form.password.data)
         user = User(
             username=form.username.data, email=form.email.data, password=hashed_password
         )
@@ -71,6 +89,7 @@ def register():
 
 
 @users.route("/login", methods=["GET", "POST"])
+@rate_limiter.limit("login", account_field="email")
 def login():
     """
     Log in an existing user.
@@ -82,7 +101,8 @@ def login():
     Methods:
         - GET: Displays the login form.
         - POST: Processes the submitted form, checks user credentials,
-          and logs in the user if valid.
+          and logs in the user if valid. A password hash made at an
+          outdated bcrypt cost is replaced on the way.
 
     Returns:
         str: Rendered HTML content based on the request.
@@ -96,11 +116,16 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and password_hasher.check(user.password, form.password.data):
+            new_hash = password_hasher.rehash(user.password, form.password.data)
+            if new_hash:
+                user.password = new_hash
+                db.session.commit()
             login_user(user, remember=form.remember.data)
             next_page = request.args.get("next")
             return redirect(next_page) if next_page else redirect(url_for("main.home"))
         else:
+            rate_limiter.charge("login", form.email.data)
             flash("Login Unsuccessful, Please check email and password", "danger")
     return render_template("login.html", title="Log in", form=form)
 
@@ -147,53 +172,82 @@ def account():
     """
     form = UpdateAccountForm()
     if form.validate_on_submit():
-        if form.picture.data:
-            picture_file = save_picture(form.picture.data)
-            current_user.image_file = picture_file
+        old_username = current_user.username
         current_user.username = form.username.data
         current_user.email = form.email.data
         db.session.commit()
+        user_cache.invalidate(current_user, old_username)
+        response_cache.invalidate_author(current_user, old_username)
+        if form.picture.data:
+            # The picture is switched once it has been processed
+            avatar_processor.submit(current_user, form.picture.data)
         flash("Your account has been updated", "success")
         return redirect(url_for("users.account"))
     elif request.method == "GET":
         form.username.data = current_user.username
         form.email.data = current_user.email
-    image_file = url_for("static", filename="profile_pics/" + current_user.image_file)
     return render_template(
-        "account.html", title="Account", image_file=image_file, form=form
+        "account.html",
+        title="Account",
+        avatar_pending=avatar_processor.is_pending(current_user.id),
+        form=form,
     )
 
 
 @users.route("/user/<string:username>")
+@response_cache.cached(tags=lambda username: ["timeline:" + username])
 def user_posts(username):
     """
     Render the page displaying blog posts by a specific user.
 
     - This route retrieves blog posts authored by the specified user
       and paginates them for display on the user's posts page.
-    - The number of posts per page is set to 5 by default.
+    - In 'keyset' mode (the default) the page is selected by the opaque
+      'cursor' query argument; in 'offset' mode by the 'page' number.
+    - The number of posts per page is set by 'POSTS_PER_PAGE' (5 by default).
+    - The author is loaded using 'TIMELINE_AUTHOR_LOADING', and the
+      full 'content' column is deferred in favour of 'excerpt'.
+    - The user is looked up through 'user_cache'.
+    - Rendered pages are cached under the 'timeline:<username>' tag.
+    - Requests whose 'If-None-Match' matches the page's ETag get a 304
+      without rendering.
 
     Args:
         username (str): The username of the target user.
 
     Returns:
-        str: Rendered HTML template displaying blog posts
-        by the user.
+        Response: Rendered HTML template displaying blog posts
+        by the user, or an empty '304 Not Modified' response.
 
     Raises:
-        404: If no user with the specified username is found.
+        404: If no user with the specified username is found,
+          or if the cursor is invalid.
     """
-    page = request.args.get("page", 1, type=int)
-    user = User.query.filter_by(username=username).first_or_404()
-    posts = (
-        Post.query.filter_by(author=user)
-        .order_by(Post.date_posted.desc())
-        .paginate(page=page, per_page=5)
+    per_page = current_app.config["POSTS_PER_PAGE"]
+    user = user_cache.get_by_username(username)
+    if user is None:
+        abort(404)
+    query = Post.query.filter_by(author=user).options(
+        author_loader(current_app.config["TIMELINE_AUTHOR_LOADING"]),
+        defer(Post.content),
+    )
+    if current_app.config["FEED_PAGINATION"] == "keyset":
+        posts = paginate_keyset(
+            query, cursor=request.args.get("cursor"), per_page=per_page
+        )
+    else:
+        page = request.args.get("page", 1, type=int)
+        posts = query.order_by(Post.date_posted.desc()).paginate(
+            page=page, per_page=per_page
+        )
+    etag, last_modified = page_validators(posts, user.id, user.username)
+    return render_conditional(
+        "user_posts.html", etag, last_modified=last_modified, posts=posts, user=user
     )
-    return render_template("user_posts.html", posts=posts, user=user)
 
 
 @users.route("/reset_password", methods=["GET", "POST"])
+@rate_limiter.limit("reset", account_field="email")
 def reset_request():
     """
     Handle user requests to reset their password.
@@ -222,6 +276,7 @@ def reset_request():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         send_reset_email(user)
+        rate_limiter.charge("reset", form.email.data)
         flash(
             "An email has been sent with instructions to reset your password.", "info"
         )
@@ -265,11 +320,10 @@ def reset_token(token):
         return redirect(url_for("users.reset_request"))
     form = ResetPasswordForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
+        hashed_password = password_hasher.generate(form.password.data)
         user.password = hashed_password
         db.session.commit()
+        user_cache.invalidate(user)
         flash(
             "Your password has now been updated! You're now able to log in", "success"
         )
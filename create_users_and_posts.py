@@ -6,15 +6,53 @@ for initial project data.
 - This script initializes the database by creating sample users
   and posts, simulating initial data for the project.
 - It ensures a clean slate by dropping existing tables
-  and recreating fresh ones.
+  and recreating fresh ones with the schema migrations
+  ('blogify_app/migrations.py').
 - The use of Flask-Bcrypt enhances security by hashing user passwords
   before storage.
+- With '--generate', it instead creates any number of synthetic users
+  and posts for load testing: post lengths, authorship and dates follow
+  skewed distributions like real blogs, rows are inserted with chunked
+  bulk INSERTs, and the insert rate is reported. '--append' adds the
+  rows to the existing database instead of recreating it, after
+  migrating it to the latest schema. Either way, the posts are then
+  indexed for full-text search.
+
+Usage:
+    python create_users_and_posts.py
+    python create_users_and_posts.py --generate --users 10000 --posts 500000
+    python create_users_and_posts.py --generate --append --posts 100000
 
 Author: [Emeka Emodi] <emodiemeka@gmail.com>
 """
 
+import math
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
 from blogify_app import db, create_app, bcrypt, User, Post
 from blogify_app.config_production import Config
+from blogify_app.migrations import upgrade
+from blogify_app.search.engine import is_supported, rebuild_index
+from blogify_app.posts.utils import make_excerpt, estimate_reading_time
+
+# Names, and words for titles and content, of generated data.
+FIRST_NAMES = (
+    "Emeka Olivia Mousa Lerato Abdul Mariam Anna Carlos Ikenna Aiden Aisha Kwame "
+    "Chen Priya Sofia Yusuf"
+).split()
+LAST_NAMES = (
+    "Emodi Juma Diop Ndlovu Kadir Ejeh Schmidt Gutierrez Okafor O'Connor Abdullahi "
+    "Mensah Wei Sharma Rossi Bello"
+).split()
+WORDS = (
+    "code python flask database query index cache server design latency deploy bug "
+    "refactor test learning journey today team build scale simple fast clean model "
+    "data user request page template thread memory the a and of to in with for on "
+    "is it we"
+).split()
 
 
 def create_users():
@@ -106,10 +144,12 @@ def create_users():
         },
     ]
 
-    hashed_passwords = [
-        bcrypt.generate_password_hash(user_data["password"]).decode("utf-8")
-        for user_data in users_data
-    ]
+    # Hash each distinct password once; bcrypt is deliberately slow
+    hashes = {
+        password: bcrypt.generate_password_hash(password).decode("utf-8")
+        for password in {user_data["password"] for user_data in users_data}
+    }
+    hashed_passwords = [hashes[user_data["password"]] for user_data in users_data]
     users = [
         User(
             firstname=user_data["firstname"],
@@ -354,7 +394,7 @@ def populate_database():
     with app.app_context():
         # Sanitize the database by dropping all tables and creating fresh ones
         db.drop_all()
-        db.create_all()
+        upgrade(db.engine)
 
         # Create users
         users = create_users()
@@ -367,10 +407,224 @@ def populate_database():
         # Commit the changes
         db.session.commit()
 
+        # Index the posts for full-text search
+        if is_supported():
+            rebuild_index()
+
+
+def _chunks(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def _sentence(rng, words):
+    text = " ".join(rng.choices(WORDS, k=words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _content(rng, sentences):
+    """
+    Write the content of a generated post from a pool of sentences.
+
+    - Lengths follow a log-normal distribution: most posts are a few
+      paragraphs (median about 150 words), a few are long articles.
+    """
+    words = min(5000, max(5, int(rng.lognormvariate(math.log(150), 0.8))))
+    picked = rng.choices(sentences, k=max(1, words // 13))
+    return "\n\n".join(" ".join(picked[i : i + 5]) for i in range(0, len(picked), 5))
+
+
+def generate_users(count, password_hash, rng, chunk_size):
+    """
+    Insert synthetic users with chunked bulk INSERTs.
+
+    - Every user gets the same password hash, computed once by the
+      caller, so creating users costs no bcrypt work.
+    - Usernames and emails are numbered after the highest existing user
+      id, so they stay unique when appending to a database.
+
+    Args:
+        count (int): The number of users to create.
+        password_hash (str): The bcrypt hash given to every user.
+        rng (Random): The random number generator.
+        chunk_size (int): The number of rows per INSERT.
+
+    Returns:
+        list: The ids of the created users.
+    """
+    first_id = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    for start, size in _chunks(count, chunk_size):
+        rows = [
+            {
+                "firstname": rng.choice(FIRST_NAMES),
+                "lastname": rng.choice(LAST_NAMES),
+                "username": "user{}".format(first_id + start + i),
+                "email": "user{}@example.com".format(first_id + start + i),
+                "password": password_hash,
+            }
+            for i in range(size)
+        ]
+        db.session.execute(insert(User), rows)
+        db.session.commit()
+    return db.session.scalars(select(User.id).where(User.id >= first_id)).all()
+
+
+def generate_posts(count, user_ids, rng, chunk_size, days):
+    """
+    Insert synthetic posts with chunked bulk INSERTs.
+
+    - Authorship is skewed: author weights follow a Pareto distribution,
+      so a few prolific authors write most posts, as on real blogs.
+    - Dates span the last 'days' days and grow denser towards today.
+      Posts are inserted in date order, so ids follow dates. About one
+      post in ten has been edited since.
+    - Excerpts and reading times are filled in, as for posts written
+      through the app.
+
+    Args:
+        count (int): The number of posts to create.
+        user_ids (list): The ids of the users posts are assigned to.
+        rng (Random): The random number generator.
+        chunk_size (int): The number of rows per INSERT.
+        days (int): How far back, in days, the oldest post may be.
+    """
+    now = datetime.utcnow()
+    span = days * 86400
+    offsets = sorted((rng.random() ** 2 * span for _ in range(count)), reverse=True)
+    weights = [rng.paretovariate(1.2) for _ in user_ids]
+    # Drawing whole sentences from a pool keeps generation cheaper than
+    # the INSERTs it is meant to measure.
+    sentences = [_sentence(rng, rng.randint(6, 20)) for _ in range(5000)]
+    for start, size in _chunks(count, chunk_size):
+        authors = rng.choices(user_ids, weights=weights, k=size)
+        rows = []
+        for i in range(size):
+            content = _content(rng, sentences)
+            date_posted = now - timedelta(seconds=offsets[start + i])
+            date_updated = None
+            if rng.random() < 0.1:
+                date_updated = min(
+                    now, date_posted + timedelta(seconds=rng.uniform(60, 30 * 86400))
+                )
+            rows.append(
+                {
+                    "title": _sentence(rng, rng.randint(3, 8))[:-1].title(),
+                    "content": content,
+                    "excerpt": make_excerpt(content),
+                    "reading_time": estimate_reading_time(content),
+                    "date_posted": date_posted,
+                    "date_updated": date_updated,
+                    "user_id": authors[i],
+                }
+            )
+        db.session.execute(insert(Post), rows)
+        db.session.commit()
+
+
+def populate_generated(
+    users, posts, append=False, chunk_size=5000, days=730, seed=None
+):
+    """
+    Populate the database with synthetic users and posts for load testing.
+
+    Args:
+        users (int): The number of users to create.
+        posts (int): The number of posts to create. In append mode,
+          posts are spread over new and existing users.
+        append (bool, optional): Whether to keep the existing data
+          instead of recreating every table. Defaults to False.
+        chunk_size (int, optional): The number of rows per INSERT.
+          Defaults to 5000.
+        days (int, optional): The time span of post dates, in days.
+          Defaults to 730.
+        seed (int, optional): The random seed, for reproducible data.
+          Defaults to None.
+    """
+    rng = random.Random(seed)
+    with app.app_context():
+        if not append:
+            db.drop_all()
+        upgrade(db.engine)
+
+        password_hash = bcrypt.generate_password_hash("password").decode("utf-8")
+        started = time.perf_counter()
+        user_ids = generate_users(users, password_hash, rng, chunk_size)
+        elapsed = time.perf_counter() - started
+        print(
+            "{} users in {:.1f}s ({:.0f} rows/s)".format(
+                users, elapsed, users / max(elapsed, 1e-9)
+            )
+        )
+
+        if append:
+            user_ids = db.session.scalars(select(User.id)).all()
+        if posts and not user_ids:
+            raise SystemExit("No users to assign posts to, use --users.")
+        started = time.perf_counter()
+        generate_posts(posts, user_ids, rng, chunk_size, days)
+        elapsed = time.perf_counter() - started
+        print(
+            "{} posts in {:.1f}s ({:.0f} rows/s)".format(
+                posts, elapsed, posts / max(elapsed, 1e-9)
+            )
+        )
+
+        if is_supported():
+            started = time.perf_counter()
+            total = rebuild_index(batch_size=chunk_size)
+            print(
+                "{} posts indexed in {:.1f}s".format(
+                    total, time.perf_counter() - started
+                )
+            )
+
+
+def parse_args():
+    """
+    Parse the command-line arguments of the script.
+
+    Returns:
+        Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--generate",
+        action="store_true",
+        help="create synthetic data instead of the sample users and posts",
+    )
+    parser.add_argument("--users", type=int, default=1000, help="users to create")
+    parser.add_argument("--posts", type=int, default=20000, help="posts to create")
+    parser.add_argument(
+        "--append",
+        action="store_true",
+        help="add to the existing database instead of recreating it",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=5000, help="rows per INSERT statement"
+    )
+    parser.add_argument(
+        "--days", type=int, default=730, help="time span of post dates, in days"
+    )
+    parser.add_argument("--seed", type=int, help="random seed, for reproducible data")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
+    args = parse_args()
+
     # Create a Flask app instance and initialize the database
     app = create_app(Config)
 
-    # Populate the database with dummy data
-    populate_database()
+    if args.generate:
+        # Populate the database with synthetic data at scale
+        populate_generated(
+            args.users,
+            args.posts,
+            append=args.append,
+            chunk_size=args.chunk_size,
+            days=args.days,
+            seed=args.seed,
+        )
+    else:
+        # Populate the database with dummy data
+        populate_database()